@@ -1,57 +1,145 @@
 from django.contrib import admin
-from .models import News, Tag, Comment
+from .models import News, Tag, Comment, TelegramNotification, AuthorStats, BulkLikeJob, likes_count
+from .pagination import EstimatedCountPaginator
+from .bulk_likes import run_bulk
+from .search import search_ids
+from .signals import news_bulk_updated
 from django.utils.html import format_html
-from django.urls import path
+from django.urls import path, reverse
 from django.shortcuts import render
+from django.conf import settings
+from django.utils import timezone
+from django.db.models import Max, Q, Sum
 
 # Функции для массовых операций с новостями
+def update_status(queryset, status):
+    # Массово меняет статус новостей и оповещает об изменении (post_save при update() не отправляется)
+    news_ids = list(queryset.values_list('id', flat=True))
+    News.objects.filter(id__in=news_ids).update(status=status, updated_at=timezone.now())
+    news_bulk_updated.send(sender=News, news_ids=news_ids, fields=['status', 'updated_at'])
+
 def make_published(modeladmin, request, queryset):
     # Функция для массового изменения статуса новостей на "Проверено"
-    queryset.update(status='published')
+    update_status(queryset, 'published')
 make_published.short_description = "Пометить как 'Проверено'"
 
+def make_scheduled(modeladmin, request, queryset):
+    # Функция для массовой постановки новостей в план публикации: новость публикуется в дату публикации (команда run_publisher)
+    update_status(queryset, 'scheduled')
+make_scheduled.short_description = "Запланировать публикацию на дату публикации"
+
 def make_draft(modeladmin, request, queryset):
     # Функция для массового изменения статуса новостей на "Не проверено"
-    queryset.update(status='draft')
+    update_status(queryset, 'draft')
 make_draft.short_description = "Пометить как 'Не проверено'"
 
 def make_archived(modeladmin, request, queryset):
     # Функция для массового изменения статуса новостей на "Архив"
-    queryset.update(status='archived')
+    update_status(queryset, 'archived')
 make_archived.short_description = "Пометить как 'Архив'"
 
+def bulk_likes(modeladmin, request, queryset, action):
+    # Лайки меняются запросами к промежуточной таблице (см. news.bulk_likes), большие выборки - фоновым заданием
+    job = run_bulk(action, queryset.model, queryset, request.user)
+    if job is not None:
+        url = reverse('admin:news_bulklikejob_change', args=[job.pk])
+        modeladmin.message_user(request, format_html(
+            'Выбрано {} объектов, они обрабатываются в фоне. Прогресс: <a href="{}">задание #{}</a>', job.total, url, job.pk,
+        ))
+
 def add_likes_to_news(modeladmin, request, queryset):
     # Функция для массового добавления лайков текущему пользователю в новостях
-    for news in queryset:
-        news.likes.add(request.user)
+    bulk_likes(modeladmin, request, queryset, 'add')
 add_likes_to_news.short_description = "Добавить лайк текущему пользователю"
 
 def add_likes_to_comments(modeladmin, request, queryset):
     # Функция для массового добавления лайков текущему пользователю в комментариях
-    for comment in queryset:
-        comment.likes.add(request.user)
+    bulk_likes(modeladmin, request, queryset, 'add')
 add_likes_to_comments.short_description = "Добавить лайк текущему пользователю"
 
 def remove_likes_from_news(modeladmin, request, queryset):
     # Функция для массового удаления лайков из новостей
-    for news in queryset:
-        news.likes.clear()
+    bulk_likes(modeladmin, request, queryset, 'remove')
 remove_likes_from_news.short_description = "Удалить все лайки"
 
 def remove_likes_from_comments(modeladmin, request, queryset):
     # Функция для массового удаления лайков из комментариев
-    for comment in queryset:
-        comment.likes.clear()
+    bulk_likes(modeladmin, request, queryset, 'remove')
 remove_likes_from_comments.short_description = "Удалить все лайки"
 
-class NewsAdmin(admin.ModelAdmin):
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр с полем ввода вместо списка всех значений (для связей с большими таблицами)"""
+    template = 'admin/news/input_filter.html'
+    placeholder = ''
+
+    def lookups(self, request, model_admin):
+        # Непустой список нужен, чтобы фильтр отображался на странице
+        return ((None, None),)
+
+    def choices(self, changelist):
+        # Вариант "Все" сбрасывает фильтр, а остальные параметры списка передаются формой в скрытых полях
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = [
+            (name, value) for name, value in changelist.get_filters_params().items() if name != self.parameter_name
+        ]
+        yield all_choice
+
+class AuthorFilter(InputFilter):
+    """Фильтр по имени пользователя автора"""
+    title = 'автору'
+    parameter_name = 'author'
+    placeholder = 'Имя пользователя'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(author__username=self.value().strip())
+        return queryset
+
+class CommentNewsFilter(InputFilter):
+    """Фильтр комментариев по ID новости или по поиску в новостях"""
+    title = 'новости'
+    parameter_name = 'news'
+    placeholder = 'ID или слова из новости'
+
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip()
+        if value.isdigit():
+            return queryset.filter(news_id=int(value))
+        if value:
+            return queryset.filter(news__in=search_ids(value))
+        return queryset
+
+class EstimatedCountMixin:
+    """
+    Приблизительное количество строк в списке без фильтров (настройка ADMIN_ESTIMATED_COUNT)
+    и без второго подсчета всех строк таблицы при поиске и фильтрации.
+    """
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if settings.ADMIN_ESTIMATED_COUNT:
+            return EstimatedCountPaginator(queryset, per_page, orphans, allow_empty_first_page)
+        return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+
+    @property
+    def show_full_result_count(self):
+        return not settings.ADMIN_ESTIMATED_COUNT
+
+class NewsAdmin(EstimatedCountMixin, admin.ModelAdmin):
     """Класс для управления новостями в админке"""
-    list_display = ('title', 'pub_date', 'status', 'total_likes', 'preview_link') # Поля, которые отображаются в админке
-    list_filter = ('status', 'pub_date') # Фильтры для фильтрации новостей по статусу и дате публикации
+    list_display = ('title', 'author', 'pub_date', 'status', 'total_likes', 'preview_link') # Поля, которые отображаются в админке
+    list_filter = ('status', 'pub_date', AuthorFilter) # Фильтры для фильтрации новостей по статусу, дате публикации и автору
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)  # Выбор автора поиском, а не списком всех пользователей
     search_fields = ('title', 'brief', 'content')  # Поля, по которым будет производиться поиск новостей
     filter_horizontal = ('tags',) # Отображение тегов в виде списка с возможностью выбора нескольких тегов
     exclude = ('likes',)  # Исключаем поле likes из формы
-    actions = [make_published, make_draft, make_archived, add_likes_to_news, remove_likes_from_news] # Добавляем действия для массовых операций с новостями
+    actions = [make_published, make_scheduled, make_draft, make_archived, add_likes_to_news, remove_likes_from_news] # Добавляем действия для массовых операций с новостями
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск новостей через полнотекстовый индекс вместо LIKE по всем полям"""
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.search(search_term), False
 
     def preview_link(self, obj):
         """Функция для создания ссылки на предварительный просмотр новости"""
@@ -89,10 +177,15 @@ class NewsAdmin(admin.ModelAdmin):
             return "Предварительный просмотр недоступен до сохранения новости"
     preview.short_description = "Предварительный просмотр"
 
+    def get_queryset(self, request):
+        # Количество лайков считается подзапросом в том же запросе, что и список, а не COUNT на каждую строку
+        return super().get_queryset(request).annotate(likes_count=likes_count(News._meta.get_field('likes')))
+
     def total_likes(self, obj):
         # Возвращаем количество лайков для каждой новости
         return obj.total_likes()
     total_likes.short_description = "Лайки"
+    total_likes.admin_order_field = 'likes_count'
 
     class Meta:
         verbose_name = "Новость"
@@ -100,31 +193,118 @@ class NewsAdmin(admin.ModelAdmin):
 
 class TagAdmin(admin.ModelAdmin):
     """Класс для управления тегами в админке"""
-    list_display = ('name', 'slug')
+    list_display = ('name', 'slug', 'published_count', 'total_count', 'last_pub_date')
     prepopulated_fields = {'slug': ('name',)}
 
+    def get_queryset(self, request):
+        # Количество новостей берется из статистики тегов (не больше трех строк на тег), а не из промежуточной таблицы
+        return super().get_queryset(request).annotate(
+            published_count=Sum('stats__count', filter=Q(stats__status='published')),
+            total_count=Sum('stats__count'),
+            last_pub_date=Max('stats__last_pub_date'),
+        )
+
+    def published_count(self, obj):
+        return obj.published_count or 0
+    published_count.short_description = "Проверенных новостей"
+    published_count.admin_order_field = 'published_count'
+
+    def total_count(self, obj):
+        return obj.total_count or 0
+    total_count.short_description = "Всего новостей"
+    total_count.admin_order_field = 'total_count'
+
+    def last_pub_date(self, obj):
+        return obj.last_pub_date
+    last_pub_date.short_description = "Последняя новость"
+    last_pub_date.admin_order_field = 'last_pub_date'
+
     class Meta:
         verbose_name = "Тег"
         verbose_name_plural = "Теги"
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(EstimatedCountMixin, admin.ModelAdmin):
     """Класс для управления комментариями в админке"""
     list_display = ('news', 'author', 'content', 'created_at', 'total_likes') # Поля, которые отображаются в списке комментариев в админке
-    list_filter = ('news', 'author', 'created_at') # Фильтры для поиска по полю news, author и created_at
+    list_filter = (CommentNewsFilter, AuthorFilter, 'created_at') # Фильтры по новости и автору с полем ввода вместо списка всех новостей и пользователей
+    list_select_related = ('news', 'author')
+    autocomplete_fields = ('news', 'author')
     search_fields = ('content', 'author__username')  # Поля, по которым будет производиться поиск
     readonly_fields = ('created_at',)  # Поля, которые нельзя редактировать
     exclude = ('likes',)  # Исключаем поле likes из формы
     actions = [add_likes_to_comments, remove_likes_from_comments] # Добавляем действия для массового добавления и удаления лайков из комментариев
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(likes_count=likes_count(Comment._meta.get_field('likes')))
+
     def total_likes(self, obj):
         # Возвращаем количество лайков для каждого комментария
         return obj.total_likes()
     total_likes.short_description = "Лайки"
+    total_likes.admin_order_field = 'likes_count'
 
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
 
+class TelegramNotificationAdmin(admin.ModelAdmin):
+    """Класс для просмотра очереди уведомлений в Telegram"""
+    list_display = ('id', 'news', 'status', 'attempts', 'next_attempt_at', 'sent_at') # Поля, которые отображаются в списке уведомлений
+    list_filter = ('status',) # Фильтр по статусу отправки
+    list_select_related = ('news',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+
+    class Meta:
+        verbose_name = "Уведомление в Telegram"
+        verbose_name_plural = "Уведомления в Telegram"
+
+class AuthorStatsAdmin(admin.ModelAdmin):
+    """Класс для просмотра статистики авторов (пересчитывается автоматически, вручную не редактируется)"""
+    list_display = ('author', 'status', 'count', 'views', 'likes', 'last_pub_date')
+    list_filter = ('status',)
+    list_select_related = ('author',)
+    search_fields = ('author__username',)
+    ordering = ('-count',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    class Meta:
+        verbose_name = "Статистика автора"
+        verbose_name_plural = "Статистика авторов"
+
+class BulkLikeJobAdmin(admin.ModelAdmin):
+    """Класс для просмотра фоновых заданий с лайками и их прогресса"""
+    list_display = ('id', 'action', 'target', 'user', 'progress_bar', 'status', 'created_at', 'finished_at')
+    list_filter = ('status', 'action', 'target')
+    list_select_related = ('user',)
+    exclude = ('object_ids',)  # Список ID может быть очень большим
+    readonly_fields = ('action', 'target', 'user', 'total', 'processed', 'progress_bar', 'status', 'last_error', 'locked_until', 'created_at', 'finished_at')
+
+    def progress_bar(self, obj):
+        return format_html('<progress value="{}" max="100"></progress> {}/{}', obj.progress, obj.processed, obj.total)
+    progress_bar.short_description = "Прогресс"
+
+    def get_queryset(self, request):
+        # Список ID объектов в списке заданий не нужен
+        return super().get_queryset(request).defer('object_ids')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    class Meta:
+        verbose_name = "Задание с лайками"
+        verbose_name_plural = "Задания с лайками"
+
 admin.site.register(News, NewsAdmin)
 admin.site.register(Tag, TagAdmin)
-admin.site.register(Comment, CommentAdmin)
\ No newline at end of file
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(TelegramNotification, TelegramNotificationAdmin)
+admin.site.register(AuthorStats, AuthorStatsAdmin)
+admin.site.register(BulkLikeJob, BulkLikeJobAdmin)
\ No newline at end of file
@@ -8,4 +8,8 @@ class NewsConfig(AppConfig):
     verbose_name_plural = 'Новости' # имя модели во множественном числе
 
     def ready(self):
-        import news.signals
\ No newline at end of file
+        import news.signals
+        import news.checks
+        from django.db.backends.signals import connection_created
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='news_configure_sqlite')
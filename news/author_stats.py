@@ -0,0 +1,192 @@
+"""
+Материализованная статистика авторов (модель AuthorStats): количество новостей, просмотры,
+лайки и дата последней новости по статусам.
+При сохранении и удалении новости, записи просмотров и изменении лайков (см. news.signals) статистика
+меняется на разницу без пересчета всех новостей автора. Дата последней новости пересчитывается, только если
+перенесенная или удаленная новость была последней. Массовые изменения пересчитывают статистику затронутых авторов,
+полный пересчет выполняет команда rebuild_author_stats.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Greatest
+
+from .models import News, AuthorStats
+
+FIELDS = ('count', 'views', 'likes', 'last_pub_date')
+
+# Поля новости, от которых зависит статистика, в порядке news_row
+ROW_FIELDS = ('author_id', 'status', 'pub_date', 'views')
+
+
+def news_author_ids(news_ids):
+    """ID авторов новостей"""
+    if not news_ids:
+        return []
+    return list(News.objects.filter(pk__in=news_ids).values_list('author_id', flat=True).distinct())
+
+
+def _aggregate(author_ids=None):
+    """Количество новостей, просмотры, лайки и дата последней новости по авторам и статусам"""
+    news = News.objects.all()
+    likes = News.likes.through.objects.all()
+    if author_ids is not None:
+        news = news.filter(author_id__in=author_ids)
+        likes = likes.filter(news__author_id__in=author_ids)
+    news = news.values('author_id', 'status').annotate(
+        news_count=Count('id'), total_views=Sum('views'), last_pub=Max('pub_date'),
+    ).order_by()
+    likes = {
+        (row['news__author_id'], row['news__status']): row['total']
+        for row in likes.values('news__author_id', 'news__status').annotate(total=Count('id')).order_by()
+    }
+    return [
+        AuthorStats(
+            author_id=row['author_id'], status=row['status'], count=row['news_count'], views=row['total_views'] or 0,
+            likes=likes.get((row['author_id'], row['status']), 0), last_pub_date=row['last_pub'],
+        )
+        for row in news
+    ]
+
+
+def refresh_author_stats(author_ids):
+    """Пересчитывает статистику указанных авторов"""
+    author_ids = {author_id for author_id in author_ids if author_id is not None}
+    if not author_ids:
+        return
+    with transaction.atomic():
+        AuthorStats.objects.filter(author_id__in=author_ids).delete()
+        AuthorStats.objects.bulk_create(_aggregate(author_ids))
+
+
+def news_row(pk):
+    """Поля новости из ROW_FIELDS в базе (None, если новости еще нет)"""
+    return News.objects.filter(pk=pk).values_list(*ROW_FIELDS).first()
+
+
+def _add_news(author_id, status, pub_date, views, likes):
+    """Прибавляет новость к статистике автора в статусе"""
+    rows = AuthorStats.objects.filter(author_id=author_id, status=status)
+    if not rows.update(count=F('count') + 1, views=F('views') + views, likes=F('likes') + likes):
+        AuthorStats.objects.create(
+            author_id=author_id, status=status, count=1, views=views, likes=likes, last_pub_date=pub_date,
+        )
+    else:
+        rows.filter(Q(last_pub_date__lt=pub_date) | Q(last_pub_date__isnull=True)).update(last_pub_date=pub_date)
+
+
+def _remove_news(author_id, status, pub_date, views, likes):
+    """Вычитает новость, которой в этом статусе у автора уже нет в базе, из статистики автора"""
+    rows = AuthorStats.objects.filter(author_id=author_id, status=status)
+    rows.update(
+        count=Greatest(F('count') - 1, 0), views=Greatest(F('views') - views, 0), likes=Greatest(F('likes') - likes, 0),
+    )
+    rows.filter(count=0).delete()
+    if rows.filter(last_pub_date__lte=pub_date).exists():
+        _refresh_last_pub_date(author_id, status)
+
+
+def _refresh_last_pub_date(author_id, status):
+    latest = News.objects.filter(author_id=author_id, status=status).aggregate(latest=Max('pub_date'))['latest']
+    AuthorStats.objects.filter(author_id=author_id, status=status).update(last_pub_date=latest)
+
+
+def news_saved(news, before, update_fields=None):
+    """
+    Учитывает сохранение новости. before - поля новости в базе до сохранения (news_row, None для новой новости).
+    Поля, которые не сохранялись (update_fields), берутся из before.
+    """
+    if before is None:
+        with transaction.atomic():
+            _add_news(*(getattr(news, field) for field in ROW_FIELDS), likes=0)
+        return
+    author_id, status, pub_date, views = (
+        getattr(news, field) if update_fields is None or {field, field.removesuffix('_id')} & update_fields else value
+        for field, value in zip(ROW_FIELDS, before)
+    )
+    old_author_id, old_status, old_pub_date, old_views = before
+    with transaction.atomic():
+        if (author_id, status) != (old_author_id, old_status):
+            # Новость переходит в другую строку статистики вместе с просмотрами и лайками
+            likes = News.likes.through.objects.filter(news_id=news.pk).count()
+            _remove_news(old_author_id, old_status, old_pub_date, old_views, likes)
+            _add_news(author_id, status, pub_date, views, likes)
+            return
+        rows = AuthorStats.objects.filter(author_id=author_id, status=status)
+        if views != old_views:
+            rows.update(views=Greatest(F('views') + (views - old_views), 0))
+        if pub_date > old_pub_date:
+            rows.filter(last_pub_date__lt=pub_date).update(last_pub_date=pub_date)
+        elif pub_date < old_pub_date and rows.filter(last_pub_date__lte=old_pub_date).exists():
+            _refresh_last_pub_date(author_id, status)
+
+
+def news_deleted(row, likes):
+    """Вычитает удаленную новость (news_row до удаления и количество ее лайков) из статистики автора"""
+    if row is None:
+        return
+    with transaction.atomic():
+        _remove_news(*row, likes=likes)
+
+
+def add_views(amounts):
+    """Прибавляет просмотры новостей ({ID новости: прирост}) к статистике их авторов"""
+    totals = defaultdict(int)
+    for pk, author_id, status in News.objects.filter(pk__in=amounts).values_list('pk', 'author_id', 'status'):
+        totals[author_id, status] += amounts[pk]
+    with transaction.atomic():
+        for (author_id, status), amount in totals.items():
+            AuthorStats.objects.filter(author_id=author_id, status=status).update(views=F('views') + amount)
+
+
+def add_likes(news_ids, sign):
+    """Прибавляет (sign = 1) или вычитает (sign = -1) лайки новостей (ID новости на каждый лайк) в статистике авторов"""
+    if not news_ids:
+        return
+    counts = defaultdict(int)
+    for news_id in news_ids:
+        counts[news_id] += 1
+    totals = defaultdict(int)
+    for pk, author_id, status in News.objects.filter(pk__in=counts).values_list('pk', 'author_id', 'status'):
+        totals[author_id, status] += counts[pk] * sign
+    with transaction.atomic():
+        for (author_id, status), amount in totals.items():
+            AuthorStats.objects.filter(author_id=author_id, status=status).update(likes=Greatest(F('likes') + amount, 0))
+
+
+def rebuild_author_stats():
+    """Полностью пересчитывает статистику всех авторов. Возвращает количество строк и исправленных строк"""
+    with transaction.atomic():
+        before = {
+            (stats.author_id, stats.status): tuple(getattr(stats, field) for field in FIELDS)
+            for stats in AuthorStats.objects.all()
+        }
+        rows = _aggregate()
+        AuthorStats.objects.all().delete()
+        AuthorStats.objects.bulk_create(rows)
+    after = {(stats.author_id, stats.status): tuple(getattr(stats, field) for field in FIELDS) for stats in rows}
+    changed = sum(1 for key in before.keys() | after.keys() if before.get(key) != after.get(key))
+    return len(rows), changed
+
+
+def author_summary(author_id):
+    """
+    Итоги автора по строкам статистики (не больше одной строки на статус):
+    количество новостей по статусам и всего, просмотры, лайки и дата последней новости.
+    """
+    summary = {'counts': {status: 0 for status, _ in News.STATUS_CHOICES}, 'count': 0, 'views': 0, 'likes': 0,
+               'last_pub_date': None}
+    for stats in AuthorStats.objects.filter(author_id=author_id):
+        summary['counts'][stats.status] = stats.count
+        summary['count'] += stats.count
+        summary['views'] += stats.views
+        summary['likes'] += stats.likes
+        if stats.last_pub_date and (summary['last_pub_date'] is None or stats.last_pub_date > summary['last_pub_date']):
+            summary['last_pub_date'] = stats.last_pub_date
+    return summary
+
+
+def status_news_count(status):
+    """Количество новостей в статусе по строкам статистики авторов (без подсчета самих новостей)"""
+    return AuthorStats.objects.filter(status=status).aggregate(total=Sum('count'))['total'] or 0
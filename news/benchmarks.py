@@ -0,0 +1,11 @@
+"""
+Общие функции команд нагрузочного тестирования (bench и bench_sqlite).
+"""
+
+
+def percentile(values, percent):
+    """Перцентиль времени ответа (значения в секундах) в миллисекундах, None - значений нет"""
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, len(values) * percent // 100)] * 1000, 2)
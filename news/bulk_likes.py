@@ -0,0 +1,120 @@
+"""
+Массовые операции с лайками новостей и комментариев.
+Лайки добавляются и удаляются запросами к промежуточным таблицам частями по BATCH_SIZE объектов
+(INSERT ... ON CONFLICT DO NOTHING и один DELETE на часть) вместо вызовов likes.add() и likes.clear()
+на каждый объект. Сигнал likes_bulk_changed после каждой части обновляет кэши и статистику.
+Выборки больше ADMIN_BULK_LIKES_SYNC_LIMIT выполняются фоновым заданием BulkLikeJob.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import News, Comment, BulkLikeJob
+from .signals import likes_bulk_changed
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+TARGETS = {'news': News, 'comment': Comment}
+
+
+def _through(model):
+    """Промежуточная таблица лайков и имя столбца с ID объекта в ней"""
+    return model.likes.through, f'{model.likes.field.m2m_field_name()}_id'
+
+
+def add_likes(model, object_ids, user):
+    """Добавляет лайк пользователя объектам (уже поставленные лайки не дублируются)"""
+    through, column = _through(model)
+    with transaction.atomic():
+        through.objects.bulk_create(
+            [through(**{column: pk, 'user_id': user.pk}) for pk in object_ids], ignore_conflicts=True,
+        )
+    likes_bulk_changed.send(sender=model, object_ids=list(object_ids), user_ids=[user.pk])
+
+
+def remove_likes(model, object_ids):
+    """Удаляет все лайки объектов одним запросом DELETE"""
+    through, column = _through(model)
+    with transaction.atomic():
+        rows = through.objects.filter(**{f'{column}__in': object_ids})
+        user_ids = list(rows.values_list('user_id', flat=True).distinct())
+        rows.delete()
+    likes_bulk_changed.send(sender=model, object_ids=list(object_ids), user_ids=user_ids)
+
+
+def apply(action, model, object_ids, user):
+    """Выполняет действие с лайками для части объектов"""
+    if action == 'add':
+        add_likes(model, object_ids, user)
+    else:
+        remove_likes(model, object_ids)
+
+
+def run_bulk(action, model, queryset, user):
+    """
+    Выполняет действие админки для выборки. Небольшая выборка обрабатывается сразу,
+    большая ставится в очередь фоновым заданием. Возвращает задание или None.
+    """
+    object_ids = list(queryset.order_by().values_list('pk', flat=True))
+    if len(object_ids) <= settings.ADMIN_BULK_LIKES_SYNC_LIMIT:
+        for start in range(0, len(object_ids), BATCH_SIZE):
+            apply(action, model, object_ids[start:start + BATCH_SIZE], user)
+        return None
+    target = next(name for name, target_model in TARGETS.items() if target_model is model)
+    job = BulkLikeJob.objects.create(action=action, target=target, user=user, object_ids=object_ids, total=len(object_ids))
+    transaction.on_commit(lambda: start_job(job.pk))
+    return job
+
+
+def _lease():
+    return timezone.now() + timedelta(seconds=settings.ADMIN_BULK_LIKES_CLAIM_TIMEOUT)
+
+
+def claimable_jobs():
+    """Задания в очереди и прерванные задания, захват которых истек"""
+    return BulkLikeJob.objects.filter(
+        Q(status='pending') | Q(status='running', locked_until__lt=timezone.now())
+    )
+
+
+def run_job(job_id):
+    """Обрабатывает задание частями с того места, где оно остановилось. Возвращает True, если задание выполнено"""
+    # Задание захватывается на ADMIN_BULK_LIKES_CLAIM_TIMEOUT секунд, захват продлевается после каждой части.
+    # Выполняющееся задание другой процесс не заберет, пока захват не истечет, а прерванное продолжится
+    # с сохраненного прогресса. Повторная обработка части безопасна: добавление не дублирует лайки, а удаление идемпотентно
+    claimed = claimable_jobs().filter(pk=job_id).update(status='running', locked_until=_lease())
+    if not claimed:
+        return False
+    job = BulkLikeJob.objects.select_related('user').get(pk=job_id)
+    model = TARGETS[job.target]
+    try:
+        while job.processed < job.total:
+            chunk = job.object_ids[job.processed:job.processed + BATCH_SIZE]
+            apply(job.action, model, chunk, job.user)
+            job.processed += len(chunk)
+            BulkLikeJob.objects.filter(pk=job.pk).update(processed=job.processed, locked_until=_lease())
+    except Exception as e:
+        logger.exception(f'Ошибка задания с лайками #{job.pk}')
+        BulkLikeJob.objects.filter(pk=job.pk).update(status='failed', last_error=str(e))
+        return False
+    BulkLikeJob.objects.filter(pk=job.pk).update(status='done', finished_at=timezone.now())
+    return True
+
+
+def start_job(job_id):
+    """Запускает обработку задания в фоновом потоке процесса"""
+
+    def target():
+        try:
+            run_job(job_id)
+        finally:
+            connection.close()  # Поток не обслуживает запросы, поэтому соединение закрываем сами
+
+    threading.Thread(target=target, name=f'news-like-job-{job_id}', daemon=True).start()
@@ -0,0 +1,137 @@
+"""
+Кэш отрендеренных карточек новостей для списков.
+Ключ карточки состоит из ID новости и ее версии. Версия меняется при сохранении новости,
+изменении ее тегов или лайков и переименовании тега (см. news.signals), поэтому устаревшая карточка
+просто перестает запрашиваться и вытесняется из кэша. Массовые изменения (загрузка данных) вместо версий
+отдельных новостей меняют общее поколение карточек, которое тоже входит в ключ.
+Количество просмотров меняется постоянно, поэтому в кэше вместо него хранится метка VIEWS_MARKER,
+которая заменяется на текущее значение при каждой сборке списка.
+Попадания и промахи копятся в памяти процесса и записываются в общий кэш не чаще раза в STATS_FLUSH_INTERVAL секунд.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = 'news/news_card.html'
+GENERATION_KEY = 'news:card:generation'
+STATS_KEYS = {'hits': 'news:card:stats:hits', 'misses': 'news:card:stats:misses'}
+STATS_FLUSH_INTERVAL = 10
+VIEWS_MARKER = '<!--news-views-->'
+
+_stats_lock = threading.Lock()
+_pending_stats = Counter()
+_stats_flushed_at = time.monotonic()
+
+
+def _version_key(news_id):
+    return f'news:card:version:{news_id}'
+
+
+def _card_key(news_id, generation, version, archived):
+    return f'news:card:{generation}:{news_id}:{version}:{"archived" if archived else "active"}'
+
+
+def invalidate_cards(news_ids):
+    """
+    Меняет версию карточек новостей, после чего они будут отрендерены заново.
+    Версия меняется после фиксации транзакции: иначе параллельный запрос успел бы отрендерить
+    еще не измененную новость и сохранить ее карточку под новой версией.
+    """
+    if not news_ids:
+        return
+    news_ids = list(news_ids)
+
+    def bump():
+        version = time.time_ns()
+        cache.set_many({_version_key(news_id): version for news_id in news_ids}, None)
+
+    transaction.on_commit(bump)
+
+
+def _next_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def invalidate_all_cards():
+    """Меняет поколение карточек после фиксации транзакции: все карточки будут отрендерены заново"""
+    transaction.on_commit(_next_generation)
+
+
+def _count_stats(hits, misses, force=False):
+    """Добавляет попадания и промахи к накопленным и записывает их в кэш, если прошло STATS_FLUSH_INTERVAL секунд"""
+    global _stats_flushed_at
+    with _stats_lock:
+        _pending_stats.update(hits=hits, misses=misses)
+        if not force and time.monotonic() - _stats_flushed_at < STATS_FLUSH_INTERVAL:
+            return
+        pending = {name: value for name, value in _pending_stats.items() if value}
+        _pending_stats.clear()
+        _stats_flushed_at = time.monotonic()
+    for name, value in pending.items():
+        key = STATS_KEYS[name]
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.set(key, value, None)
+
+
+def get_stats():
+    """Статистика попаданий в кэш карточек (со счетчиками всех процессов, записанными в общий кэш)"""
+    _count_stats(0, 0, force=True)
+    values = cache.get_many(STATS_KEYS.values())
+    hits = values.get(STATS_KEYS['hits'], 0)
+    misses = values.get(STATS_KEYS['misses'], 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else 0.0}
+
+
+def reset_stats():
+    global _stats_flushed_at
+    with _stats_lock:
+        _pending_stats.clear()
+        _stats_flushed_at = time.monotonic()
+    cache.delete_many(STATS_KEYS.values())
+
+
+def render_cards(news_list, archived=False):
+    """
+    Собирает HTML карточек новостей из кэша, рендеря только отсутствующие в нем карточки.
+    Версии и карточки читаются из кэша и записываются в него пачкой.
+    """
+    news_list = list(news_list)
+    if not news_list:
+        return mark_safe('')
+
+    versions = cache.get_many([GENERATION_KEY, *(_version_key(news.pk) for news in news_list)])
+    generation = versions.get(GENERATION_KEY, 0)
+    keys = {}
+    for news in news_list:
+        version_key = _version_key(news.pk)
+        if version_key not in versions:
+            # Новая версия уникальна, поэтому вытесненная из кэша версия не вернет старую карточку
+            version = time.time_ns()
+            versions[version_key] = version if cache.add(version_key, version, None) else cache.get(version_key, version)
+        keys[news.pk] = _card_key(news.pk, generation, versions[version_key], archived)
+
+    cached = cache.get_many(keys.values())
+    rendered = {}
+    fragments = []
+    for news in news_list:
+        key = keys[news.pk]
+        if key not in cached:
+            rendered[key] = cached[key] = render_to_string(CARD_TEMPLATE, {'news': news, 'archived': archived})
+        fragments.append(cached[key].replace(VIEWS_MARKER, str(news.views), 1))
+    if rendered:
+        cache.set_many(rendered, getattr(settings, 'NEWS_CARD_CACHE_TIMEOUT', 3600))
+
+    _count_stats(len(news_list) - len(rendered), len(rendered))
+    return mark_safe(''.join(fragments))
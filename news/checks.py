@@ -0,0 +1,19 @@
+"""Проверки настроек проекта (python manage.py check)"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Кэши, которые видны только одному процессу
+PROCESS_LOCAL_CACHES = {'django.core.cache.backends.locmem.LocMemCache'}
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    # Кэши сбрасываются сменой поколения, в том числе из других процессов сервера и фоновых команд.
+    # В кэше одного процесса смена поколения не доходит до остальных процессов, и они отдают устаревшие данные
+    if settings.DEBUG or settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        'The default cache is local to one process, so cache invalidation from workers and other web processes is lost.',
+        hint='Use a shared cache backend (FileBasedCache, DatabaseCache or RedisCache) or set DEBUG for development.',
+        id='news.E001',
+    )]
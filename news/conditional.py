@@ -0,0 +1,83 @@
+"""
+Условные GET-запросы к спискам и страницам новостей (ETag и Last-Modified).
+Валидаторы страницы считаются дешевыми запросами: дата последнего изменения - MAX(updated_at) по фильтру
+страницы (индекс (status, updated_at)), количество новостей - по материализованной статистике.
+Количество нужно, чтобы заметить удаление новости: оно не меняет MAX(updated_at).
+Дата изменения новости обновляется при изменении самой новости, ее тегов, лайков и комментариев
+(см. news.signals). Если валидаторы совпали, отвечаем 304 без выборки новостей и рендеринга шаблона.
+
+Условные ответы и кэширование в прокси (Cache-Control: public) - только для анонимных посетителей.
+Страницы пользователей содержат имя пользователя и CSRF-токены форм, поэтому всегда рендерятся заново
+и помечаются как private. Просмотры в валидаторы не входят и в списках могут отставать на NEWS_HTTP_CACHE_MAX_AGE.
+Страница новости отдается с max-age=0 и must-revalidate: каждый показ, в том числе из кэша прокси,
+доходит до сервера хотя бы условным запросом, и просмотр засчитывается (см. NewsDetailView.not_modified).
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(last_modified, *parts):
+    """ETag страницы по дате последнего изменения и дополнительным частям (например, количеству новостей)"""
+    value = ':'.join([last_modified.isoformat(), *(str(part) for part in parts)])
+    return f'"{hashlib.md5(value.encode()).hexdigest()}"'
+
+
+class ConditionalGetMixin:
+    """
+    Примесь для представлений новостей: отвечает 304 на условный запрос анонимного посетителя
+    к неизменившейся странице и выставляет заголовки Cache-Control и Vary.
+    """
+
+    # Сколько секунд браузер и прокси могут показывать страницу без проверки (None - NEWS_HTTP_CACHE_MAX_AGE)
+    cache_max_age = None
+
+    def get_cache_max_age(self):
+        return settings.NEWS_HTTP_CACHE_MAX_AGE if self.cache_max_age is None else self.cache_max_age
+
+    def get_validators(self):
+        """(дата последнего изменения, дополнительные части ETag) или None, если проверять нечего"""
+        return None
+
+    def not_modified(self):
+        """Вызывается перед ответом 304 вместо рендеринга страницы"""
+
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            response = super().get(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            response = self.conditional_get(request, *args, **kwargs)
+            max_age = self.get_cache_max_age()
+            patch_cache_control(response, public=True, max_age=max_age)
+            if not max_age:
+                # Без срока свежести прокси и браузер проверяют страницу на сервере при каждом показе
+                patch_cache_control(response, must_revalidate=True)
+        # Анонимная и пользовательская версии страницы различаются по cookie сессии
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+    def conditional_get(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+        last_modified, *parts = validators
+        etag = make_etag(last_modified, *parts)
+        timestamp = int(last_modified.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        elif response.status_code == 304:
+            self.not_modified()
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(timestamp)
+        return response
+
+
+def list_validators(queryset, count):
+    """Валидаторы списка новостей: MAX(updated_at) по фильтру списка и количество новостей (None - список пуст)"""
+    last_modified = queryset.aggregate(last_modified=Max('updated_at'))['last_modified']
+    return None if last_modified is None else (last_modified, count)
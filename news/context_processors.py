@@ -0,0 +1,9 @@
+from .tag_stats import tag_cloud as build_tag_cloud
+
+
+def tag_cloud(request):
+    """
+    Облако тегов для base.html. Передается функция, поэтому кэш читается,
+    только если шаблон действительно выводит облако.
+    """
+    return {'tag_cloud': build_tag_cloud}
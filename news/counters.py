@@ -0,0 +1,112 @@
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """
+    Буфер просмотров новостей (write-behind).
+    Просмотры накапливаются в памяти процесса и периодически записываются в базу
+    пачкой запросов вида UPDATE ... SET views = views + n, поэтому страница новости
+    не блокирует базу на запись при каждом открытии и не теряет просмотры при параллельных запросах.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval  # Интервал сброса в секундах (None - берется из настроек)
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._stopped = threading.Event()
+
+    def get_interval(self):
+        if self.interval is not None:
+            return self.interval
+        return getattr(settings, 'NEWS_VIEWS_FLUSH_INTERVAL', 5)
+
+    def incr(self, news_id, amount=1):
+        """Добавляет просмотр в буфер. При нулевом интервале просмотр сразу записывается в базу."""
+        with self._lock:
+            self._pending[news_id] += amount
+        if self.get_interval() <= 0:
+            self.flush()
+        else:
+            self._ensure_worker()
+
+    def pending(self, news_id=None):
+        """Возвращает количество еще не записанных просмотров (для одной новости или всех)."""
+        with self._lock:
+            if news_id is None:
+                return sum(self._pending.values())
+            return self._pending.get(news_id, 0)
+
+    def drain(self):
+        """Забирает накопленные просмотры из буфера и очищает его."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        return pending
+
+    def flush(self):
+        """
+        Записывает накопленные просмотры в базу.
+        Новости группируются по количеству просмотров, чтобы на каждую группу приходился один UPDATE.
+        Если запись не удалась, просмотры возвращаются в буфер и будут записаны при следующем сбросе.
+        Возвращает количество записанных просмотров.
+        """
+        from .models import News
+        from .signals import news_bulk_updated
+
+        pending = self.drain()
+        if not pending:
+            return 0
+
+        groups = defaultdict(list)
+        for news_id, amount in pending.items():
+            groups[amount].append(news_id)
+
+        try:
+            with transaction.atomic():
+                for amount, ids in groups.items():
+                    News.objects.filter(pk__in=ids).update(views=F('views') + amount)
+        except Exception as e:
+            logger.error(f'Ошибка записи просмотров: {e}')
+            with self._lock:
+                self._pending.update(pending)
+            return 0
+
+        news_bulk_updated.send(sender=News, news_ids=list(pending), fields=['views'], amounts=pending)
+        return sum(pending.values())
+
+    def _ensure_worker(self):
+        """Запускает фоновый поток, который сбрасывает буфер раз в интервал."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stopped.clear()
+            self._worker = threading.Thread(target=self._run, name='news-views-flusher', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        from django.db import connection
+
+        while not self._stopped.wait(self.get_interval()):
+            self.flush()
+            connection.close()  # Поток не обслуживает запросы, поэтому соединение закрываем сами
+
+    def stop(self):
+        """Останавливает фоновый поток и записывает остаток буфера."""
+        self._stopped.set()
+        self.flush()
+
+
+# Общий буфер просмотров для процесса
+views_counter = ViewCounter()
+atexit.register(views_counter.stop)
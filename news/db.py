@@ -0,0 +1,90 @@
+"""
+Настройка соединений с SQLite.
+В профиле production (настройка DB_PROFILE) для каждого нового соединения выполняются PRAGMA из SQLITE_PRAGMAS:
+журнал WAL, при котором запись просмотров и лайков не блокирует чтение списков новостей,
+ожидание блокировки вместо ошибки database is locked, увеличенный кэш страниц и mmap.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models import Max
+
+
+def get_pragmas(profile=None):
+    """PRAGMA для профиля базы данных"""
+    profile = profile or settings.DB_PROFILE
+    return dict(settings.SQLITE_PRAGMAS) if profile == 'production' else {}
+
+
+def apply_pragmas(cursor, pragmas):
+    """Выполняет PRAGMA на соединении (курсор Django или sqlite3)"""
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Обработчик сигнала connection_created"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = get_pragmas()
+    if connection.is_in_memory_db():
+        # Для базы в памяти (тесты) журнал и mmap не имеют смысла
+        pragmas.pop('journal_mode', None)
+        pragmas.pop('mmap_size', None)
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, pragmas)
+
+
+@contextmanager
+def immediate_atomic(using=DEFAULT_DB_ALIAS):
+    """
+    transaction.atomic(), который в SQLite начинает транзакцию командой BEGIN IMMEDIATE.
+    Транзакция, которая сначала читает, а потом пишет, не может дождаться блокировки (busy_timeout не действует)
+    и сразу получает ошибку database is locked, если параллельно записала другая транзакция.
+    BEGIN IMMEDIATE берет блокировку записи в начале транзакции, и ожидание ее освобождения ограничено busy_timeout.
+    Django 4.2 начинает транзакции SQLite только командой BEGIN (OPTIONS['transaction_mode'] появился в 5.1),
+    поэтому транзакция управляется вручную: автокоммит выключается, BEGIN IMMEDIATE выполняется отдельным запросом,
+    а блок atomic() внутри нее работает как точка сохранения (вложенные блоки, on_commit и откат при ошибке).
+    Вложенный блок, ручное управление транзакциями и другие СУБД - обычный atomic().
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block or not transaction.get_autocommit(using):
+        with transaction.atomic(using=using):
+            yield
+        return
+    transaction.set_autocommit(False, using=using)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+        with transaction.atomic(using=using):
+            yield
+        transaction.commit(using=using)
+    except BaseException:
+        transaction.rollback(using=using)
+        raise
+    finally:
+        # Функции on_commit выполняются при включении автокоммита после фиксации
+        transaction.set_autocommit(True, using=using)
+
+
+def estimate_count(queryset):
+    """
+    Оценка количества строк таблицы без COUNT(*) по всей таблице: из статистики планировщика
+    (sqlite_stat1, заполняется командой ANALYZE или PRAGMA optimize), иначе по наибольшему ID.
+    Возвращает None для запросов с условиями и для других СУБД: их нужно считать точно.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'sqlite' or queryset.query.where or queryset.query.distinct:
+        return None
+    model = queryset.model
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [model._meta.db_table])
+            row = cursor.fetchone()
+        except DatabaseError:
+            row = None  # Таблица sqlite_stat1 появляется после первого ANALYZE
+    if row:
+        return int(row[0].split()[0])
+    return model._default_manager.using(queryset.db).aggregate(last=Max('pk'))['last'] or 0
+
@@ -0,0 +1,234 @@
+"""
+Ленты новостей в форматах RSS 2.0, Atom и JSON Feed: все проверенные новости, новости тега и новости автора.
+Готовое тело ленты хранится в кэше с ETag и Last-Modified. Кэш сбрасывается сменой поколения
+при изменении новостей и тегов (см. news.signals), а запрос с If-None-Match или If-Modified-Since
+к неизменившейся ленте получает ответ 304, не обращаясь к базе.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import feedgenerator, timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views import View
+
+from .models import News, Tag
+
+CACHE_GENERATION_KEY = 'news:feeds:generation'
+
+
+class JsonFeedGenerator(feedgenerator.SyndicationFeed):
+    """Лента в формате JSON Feed 1.1 (https://jsonfeed.org/version/1.1)"""
+    content_type = 'application/feed+json; charset=utf-8'
+
+    def write(self, outfile, encoding):
+        data = {
+            'version': 'https://jsonfeed.org/version/1.1',
+            'title': self.feed['title'],
+            'home_page_url': self.feed['link'],
+            'feed_url': self.feed['feed_url'],
+            'description': self.feed['description'],
+            'language': self.feed['language'],
+            'items': [self.item_data(item) for item in self.items],
+        }
+        outfile.write(json.dumps(data, ensure_ascii=False))
+
+    def item_data(self, item):
+        data = {
+            'id': item['unique_id'] or item['link'],
+            'url': item['link'],
+            'title': item['title'],
+            'content_text': item['description'],
+        }
+        if item['pubdate']:
+            data['date_published'] = item['pubdate'].isoformat()
+        if item['updateddate']:
+            data['date_modified'] = item['updateddate'].isoformat()
+        if item['author_name']:
+            data['authors'] = [{'name': item['author_name']}]
+        if item['categories']:
+            data['tags'] = list(item['categories'])
+        return data
+
+
+FEED_TYPES = {
+    'rss': feedgenerator.Rss201rev2Feed,
+    'atom': feedgenerator.Atom1Feed,
+    'json': JsonFeedGenerator,
+}
+
+
+class FeedFormatConverter:
+    """Конвертер URL для формата ленты"""
+    regex = '|'.join(FEED_TYPES)
+
+    def to_python(self, value):
+        return value
+
+    def to_url(self, value):
+        return value
+
+
+class NewsFeed(Feed):
+    """Лента всех проверенных новостей"""
+    title = 'Новостной блог'
+    description = 'Последние новости'
+    route = 'news_feed'
+
+    def link(self, obj=None):
+        return reverse('news_list')
+
+    def feed_url(self, obj=None):
+        return reverse(self.route, kwargs={'fmt': self.fmt, **self.route_kwargs(obj)})
+
+    def route_kwargs(self, obj):
+        return {}
+
+    def get_queryset(self, obj):
+        return News.objects.filter(status='published')
+
+    def items(self, obj=None):
+        return (
+            self.get_queryset(obj).select_related('author').prefetch_related('tags')
+            .defer('content').order_by('-pub_date', '-id')[:settings.NEWS_FEED_SIZE]
+        )
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.brief
+
+    def item_link(self, item):
+        return reverse('news_detail', args=[item.pk])
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_updateddate(self, item):
+        return item.updated_at
+
+    def item_author_name(self, item):
+        return item.author.username
+
+    def item_categories(self, item):
+        return [tag.name for tag in item.tags.all()]
+
+
+class TagNewsFeed(NewsFeed):
+    """Лента проверенных новостей тега"""
+    route = 'tag_news_feed'
+
+    def get_object(self, request, tag_slug):
+        return get_object_or_404(Tag, slug=tag_slug)
+
+    def title(self, obj):
+        return f'Новостной блог: {obj.name}'
+
+    def description(self, obj):
+        return f'Последние новости с тегом {obj.name}'
+
+    def link(self, obj):
+        return reverse('news_by_tag', args=[obj.slug])
+
+    def route_kwargs(self, obj):
+        return {'tag_slug': obj.slug}
+
+    def get_queryset(self, obj):
+        return News.objects.filter(status='published', tags=obj)
+
+
+class AuthorNewsFeed(NewsFeed):
+    """Лента проверенных новостей автора"""
+    route = 'author_news_feed'
+
+    def get_object(self, request, author_id):
+        return get_object_or_404(User, pk=author_id)
+
+    def title(self, obj):
+        return f'Новостной блог: {obj.username}'
+
+    def description(self, obj):
+        return f'Последние новости автора {obj.username}'
+
+    def link(self, obj):
+        return reverse('author_articles', args=[obj.pk])
+
+    def route_kwargs(self, obj):
+        return {'author_id': obj.pk}
+
+    def get_queryset(self, obj):
+        return News.objects.filter(status='published', author=obj)
+
+
+def _cache_generation():
+    return cache.get_or_set(CACHE_GENERATION_KEY, 1, None)
+
+
+def _next_generation():
+    try:
+        cache.incr(CACHE_GENERATION_KEY)
+    except ValueError:
+        cache.set(CACHE_GENERATION_KEY, 1, None)
+
+
+def invalidate_feeds():
+    """
+    Сбрасывает кэш всех лент (вызывается при изменении новостей и тегов) после фиксации транзакции,
+    чтобы параллельный запрос не сохранил в новом поколении ленту по еще не измененным данным.
+    """
+    transaction.on_commit(_next_generation)
+
+
+class CachedFeedView(View):
+    """
+    Отдает ленту из кэша с заголовками ETag и Last-Modified и отвечает 304 на условный запрос.
+    Last-Modified - время, когда содержимое ленты изменилось в последний раз: если после сброса кэша
+    лента получилась такой же (тот же ETag), время не меняется.
+    """
+    feed_class = NewsFeed
+
+    def get(self, request, fmt, **kwargs):
+        # Ссылки в ленте абсолютные, поэтому лента для каждой схемы и каждого хоста кэшируется отдельно
+        feed_key = ':'.join([
+            request.scheme, request.get_host(), self.feed_class.route, fmt, *(str(value) for value in kwargs.values()),
+        ])
+        key = f'news:feed:{_cache_generation()}:{feed_key}'
+        entry = cache.get(key)
+        if entry is None:
+            entry = self.render(request, fmt, feed_key, **kwargs)
+            cache.set(key, entry, settings.NEWS_FEED_CACHE_TIMEOUT)
+
+        response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+        if response is None:
+            response = HttpResponse(entry['body'], content_type=entry['content_type'])
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        return response
+
+    def render(self, request, fmt, feed_key, **kwargs):
+        feed = self.feed_class()
+        feed.fmt = fmt
+        feed.feed_type = FEED_TYPES[fmt]
+        rendered = feed(request, **kwargs)
+        etag = f'"{hashlib.md5(rendered.content).hexdigest()}"'
+        # Время изменения хранится отдельно от поколения кэша и меняется, только если изменилось содержимое
+        state_key = f'news:feed:state:{feed_key}'
+        state = cache.get(state_key)
+        if state is None or state['etag'] != etag:
+            state = {'etag': etag, 'last_modified': int(timezone.now().timestamp())}
+            cache.set(state_key, state, None)
+        return {
+            'body': rendered.content,
+            'content_type': rendered['Content-Type'],
+            'etag': etag,
+            'last_modified': state['last_modified'],
+        }
@@ -0,0 +1,277 @@
+import json
+import os
+import shutil
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from importlib import import_module
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from news import search
+from news.benchmarks import percentile
+from news.counters import views_counter
+from news.models import News, Tag, Comment
+from news.tag_stats import rebuild_tag_stats
+from news.author_stats import rebuild_author_stats
+from users.models import Profile
+from users.stats import rebuild_user_stats
+
+# python manage.py bench --scale 1000 --output bench.json команда
+
+# Приложения, маршруты которых проверяются
+BENCH_APPS = ('news.urls', 'users.urls')
+
+# Маршруты, которые вызываются методом POST
+POST_ROUTES = {'news_like', 'comment_like'}
+
+WORDS = (
+    'новость город спорт футбол матч команда выборы экономика рынок курс технологии наука космос '
+    'исследование погода снег дождь культура театр музей выставка здоровье врач больница школа '
+    'университет студент транспорт метро дорога строительство парк концерт фестиваль фильм премия'
+).split()
+
+
+def text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def iter_routes(urlconf):
+    """Именованные маршруты модуля URL и имена их параметров"""
+    for pattern in import_module(urlconf).urlpatterns:
+        if isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name, list(pattern.pattern.converters)
+
+
+class Command(BaseCommand):
+    help = ('Seed a reproducible dataset in a temporary database and load-test every news and users URL '
+            'through the in-process client, reporting throughput, latency percentiles and query counts as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1000, help='Number of news to seed (users, tags and comments scale with it)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed of the dataset')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per URL')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients per URL')
+        parser.add_argument('--output', '-o', default='-', help="JSON report file, '-' for stdout")
+        parser.add_argument('--routes', nargs='+', help='Only benchmark these URL names')
+
+    def handle(self, *args, **options):
+        self.output = options['output']
+        db = connections['default']
+        directory = tempfile.mkdtemp()
+        db.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        setup_test_environment()
+        old_name = db.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            started = time.monotonic()
+            self.seed(options['scale'], options['seed'])
+            seed_time = time.monotonic() - started
+            self.log(f'Seeded {options["scale"]} news in {seed_time:.1f}s')
+
+            results = []
+            for name, method, url in self.build_requests(options['routes']):
+                result = self.run_route(name, method, url, options['requests'], options['concurrency'])
+                results.append(result)
+                latency = result['latency_ms']
+                self.log(
+                    f"{name:<24} {result['throughput_rps']!s:>8} req/s  p50 {latency['p50']!s:>7} ms  "
+                    f"p95 {latency['p95']!s:>7} ms  p99 {latency['p99']!s:>7} ms  "
+                    f"queries {result['queries']['mean']!s:>5}  errors {result['errors']}"
+                )
+        finally:
+            views_counter.drain()
+            connections.close_all()
+            db.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(directory, ignore_errors=True)
+
+        report = {
+            'meta': {
+                'commit': self.git_commit(),
+                'created_at': timezone.now().isoformat(),
+                'django': django.get_version(),
+                'python': sys.version.split()[0],
+                'db_profile': settings.DB_PROFILE,
+                'scale': options['scale'],
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'seed_seconds': round(seed_time, 2),
+            },
+            'results': results,
+        }
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if self.output == '-':
+            self.stdout.write(data)
+        else:
+            with open(self.output, 'w', encoding='utf-8') as file:
+                file.write(data)
+            self.log(f'Report written to {self.output}')
+
+    def log(self, message):
+        # При выводе отчета в stdout сообщения пишем в stderr, чтобы не испортить JSON
+        (self.stderr if self.output == '-' else self.stdout).write(message)
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def seed(self, scale, seed):
+        """Заполняет базу воспроизводимым набором данных (пакетной вставкой, без поштучных сигналов)"""
+        rng = random.Random(seed)
+        now = timezone.now()
+        password = make_password('bench')
+
+        users = User.objects.bulk_create([
+            User(username=f'bench{i}', email=f'bench{i}@example.com', password=password, date_joined=now)
+            for i in range(max(10, scale // 20))
+        ])
+        Profile.objects.bulk_create([Profile(user=user) for user in users])
+        tags = Tag.objects.bulk_create([
+            Tag(name=f'Тег {i}', slug=f'teg-{i}') for i in range(max(5, min(100, scale // 20)))
+        ])
+
+        statuses = ['published'] * 7 + ['archived'] * 2 + ['draft']
+        news_list = News.objects.bulk_create([
+            News(
+                title=text(rng, 6), brief=text(rng, 20), content=text(rng, 200),
+                pub_date=now - timedelta(minutes=i * 37 + rng.randint(0, 30)), updated_at=now,
+                status=rng.choice(statuses), author=rng.choice(users), views=rng.randint(0, 5000), notified=True,
+            )
+            for i in range(scale)
+        ], batch_size=500)
+        News.tags.through.objects.bulk_create([
+            News.tags.through(news_id=news.pk, tag_id=tag.pk)
+            for news in news_list for tag in rng.sample(tags, rng.randint(1, 3))
+        ], batch_size=2000)
+        News.likes.through.objects.bulk_create([
+            News.likes.through(news_id=news.pk, user_id=user.pk)
+            for news in news_list for user in rng.sample(users, rng.randint(0, 5))
+        ], batch_size=2000)
+
+        comments = Comment.objects.bulk_create([
+            Comment(news=rng.choice(news_list), author=rng.choice(users), content=text(rng, 15))
+            for _ in range(scale * 2)
+        ], batch_size=1000)
+        Comment.likes.through.objects.bulk_create([
+            Comment.likes.through(comment_id=comment.pk, user_id=user.pk)
+            for comment in comments for user in rng.sample(users, rng.randint(0, 2))
+        ], batch_size=2000)
+
+        if search.is_available():
+            for start in range(0, len(news_list), 500):
+                search.index_news(news_list[start:start + 500])
+        rebuild_tag_stats()
+        rebuild_author_stats()
+        rebuild_user_stats()
+
+        self.user = users[0]
+        self.news = next(news for news in news_list if news.status == 'published')
+        self.comment = Comment.objects.filter(author=self.user).first() or comments[0]
+        self.tag = Tag.objects.filter(news=self.news).first()
+        self.query = WORDS[0]
+
+    def build_requests(self, only=None):
+        """Конкретные URL для всех маршрутов приложений: параметры подставляются из созданных данных"""
+        values = {
+            'pk': self.news.pk,
+            'tag_slug': self.tag.slug,
+            'status': 'published',
+            'author_id': self.user.pk,
+            'fmt': 'rss',
+            'uidb64': urlsafe_base64_encode(force_bytes(self.user.pk)),
+            'token': default_token_generator.make_token(self.user),
+        }
+        for urlconf in BENCH_APPS:
+            for name, params in iter_routes(urlconf):
+                if only and name not in only:
+                    continue
+                kwargs = {param: values[param] for param in params}
+                if 'comment' in name and 'pk' in kwargs:
+                    kwargs['pk'] = self.comment.pk  # Маршруты комментариев получают ID комментария пользователя
+                url = reverse(name, kwargs=kwargs)
+                if name.startswith('search'):
+                    url += f'?q={self.query}'
+                yield name, 'POST' if name in POST_ROUTES else 'GET', url
+
+    def run_route(self, name, method, url, total, concurrency):
+        """Выполняет total запросов к URL из concurrency потоков, у каждого свой клиент с входом пользователя"""
+        latencies, queries, statuses = [], [], {}
+        errors = [0]
+        lock = threading.Lock()
+        per_thread = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+
+        def worker(count):
+            client = Client()
+            client.force_login(self.user)
+            local_latencies, local_queries, local_statuses, local_errors = [], [], {}, 0
+            for _ in range(count):
+                started = time.perf_counter()
+                try:
+                    with CaptureQueriesContext(connection) as captured:
+                        response = getattr(client, method.lower())(url)
+                    status = response.status_code
+                except Exception:
+                    status = 'exception'
+                local_latencies.append(time.perf_counter() - started)
+                local_statuses[status] = local_statuses.get(status, 0) + 1
+                if status == 'exception' or status >= 500:
+                    local_errors += 1
+                else:
+                    local_queries.append(len(captured))
+                if name == 'logout':
+                    client.force_login(self.user)
+            connections.close_all()
+            with lock:
+                latencies.extend(local_latencies)
+                queries.extend(local_queries)
+                errors[0] += local_errors
+                for status, count in local_statuses.items():
+                    statuses[str(status)] = statuses.get(str(status), 0) + count
+
+        threads = [threading.Thread(target=worker, args=(count,)) for count in per_thread if count]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        return {
+            'name': name,
+            'method': method,
+            'url': url,
+            'requests': len(latencies),
+            'errors': errors[0],
+            'status_codes': statuses,
+            'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+            },
+            'queries': {
+                'mean': round(sum(queries) / len(queries), 1) if queries else None,
+                'max': max(queries) if queries else None,
+            },
+        }
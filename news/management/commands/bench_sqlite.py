@@ -0,0 +1,155 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from news.benchmarks import percentile
+from news.db import apply_pragmas, get_pragmas
+from news.models import News, Comment
+
+# python manage.py bench_sqlite команда
+
+SENTINEL = -987654321  # Значение параметра, которое заменяется на ID новости при выполнении запроса
+
+
+def compile_sql(queryset):
+    """SQL запроса Django в формате sqlite3 (параметры через ?)"""
+    sql, params = queryset.query.sql_with_params()
+    return sql.replace('%s', '?'), params
+
+
+def format_ms(value, width):
+    """Время в миллисекундах для таблицы результатов ('-', если операций не было)"""
+    return f'{value:>{width}.1f}ms' if value is not None else f"{'-':>{width + 2}}"
+
+
+def bind(params, news_id):
+    return [news_id if value == SENTINEL else value for value in params]
+
+
+class Worker(threading.Thread):
+    """Поток, который выполняет операцию в цикле и собирает время ответа и ошибки блокировки"""
+
+    def __init__(self, connect, operation, deadline, reconnect):
+        super().__init__(daemon=True)
+        self.connect = connect
+        self.operation = operation
+        self.deadline = deadline
+        self.reconnect = reconnect  # Открывать соединение на каждую операцию (как без CONN_MAX_AGE)
+        self.latencies = []
+        self.errors = 0
+
+    def run(self):
+        db = None if self.reconnect else self.connect()
+        while time.monotonic() < self.deadline:
+            started = time.perf_counter()
+            try:
+                current = self.connect() if self.reconnect else db
+                self.operation(current)
+                if self.reconnect:
+                    current.close()
+                self.latencies.append(time.perf_counter() - started)
+            except sqlite3.OperationalError:
+                self.errors += 1
+        if db is not None:
+            db.close()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent reads (news list and detail) and writes (views) with default and production SQLite settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per profile')
+        parser.add_argument('--readers', type=int, default=4, help='Concurrent reader threads')
+        parser.add_argument('--writers', type=int, default=2, help='Concurrent writer threads')
+        parser.add_argument('--profiles', nargs='+', default=['default', 'production'], choices=['default', 'production'])
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The benchmark is only supported for SQLite')
+        news_ids = list(News.objects.values_list('id', flat=True))
+        if not news_ids:
+            raise CommandError('No news in the database, load data first (import_news base.json)')
+
+        page_size = 10
+        self.list_sql = compile_sql(
+            News.objects.filter(status='published').for_cards().order_by('-pub_date', '-id')[:page_size]
+        )
+        self.count_sql = compile_sql(News.objects.filter(status='published').values('id'))
+        self.detail_sql = compile_sql(News.objects.filter(pk=SENTINEL))
+        self.comments_sql = compile_sql(Comment.objects.filter(news_id=SENTINEL).for_list().order_by('-created_at')[:20])
+        self.news_ids = news_ids
+
+        self.stdout.write(
+            f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'read p50':>10}{'read p95':>10}"
+            f"{'write p95':>11}{'locked':>8}"
+        )
+        for profile in options['profiles']:
+            result = self.run_profile(profile, options)
+            self.stdout.write(
+                f"{profile:<12}{result['reads']:>10.0f}{result['writes']:>10.0f}"
+                f"{format_ms(result['read_p50'], 9)}{format_ms(result['read_p95'], 8)}"
+                f"{format_ms(result['write_p95'], 9)}{result['errors']:>8}"
+            )
+
+    def run_profile(self, profile, options):
+        """Запускает читателей и писателей на копии базы с настройками профиля"""
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'bench.sqlite3')
+        try:
+            source = sqlite3.connect(settings.DATABASES['default']['NAME'])
+            target = sqlite3.connect(path)
+            source.backup(target)
+            source.close()
+            pragmas = get_pragmas(profile)
+            target.execute(f"PRAGMA journal_mode = {pragmas.get('journal_mode', 'delete')}")
+            target.close()
+
+            def connect():
+                # isolation_level=None: каждая запись - отдельная транзакция, как запрос в Django с autocommit
+                db = sqlite3.connect(path, timeout=0 if 'busy_timeout' in pragmas else 5, isolation_level=None,
+                                     check_same_thread=False)
+                apply_pragmas(db, pragmas)
+                return db
+
+            deadline = time.monotonic() + options['duration']
+            reconnect = profile == 'default'
+            readers = [Worker(connect, self.read, deadline, reconnect) for _ in range(options['readers'])]
+            writers = [Worker(connect, self.write, deadline, reconnect) for _ in range(options['writers'])]
+            started = time.monotonic()
+            for worker in readers + writers:
+                worker.start()
+            for worker in readers + writers:
+                worker.join()
+            elapsed = time.monotonic() - started
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        read_latencies = [value for worker in readers for value in worker.latencies]
+        write_latencies = [value for worker in writers for value in worker.latencies]
+        return {
+            'reads': len(read_latencies) / elapsed,
+            'writes': len(write_latencies) / elapsed,
+            'read_p50': percentile(read_latencies, 50),
+            'read_p95': percentile(read_latencies, 95),
+            'write_p95': percentile(write_latencies, 95),
+            'errors': sum(worker.errors for worker in readers + writers),
+        }
+
+    def read(self, db):
+        """Страница списка новостей и страница новости с комментариями"""
+        db.execute(*self.list_sql).fetchall()
+        db.execute(f'SELECT COUNT(*) FROM ({self.count_sql[0]})', self.count_sql[1]).fetchone()
+        news_id = random.choice(self.news_ids)
+        db.execute(self.detail_sql[0], bind(self.detail_sql[1], news_id)).fetchall()
+        db.execute(self.comments_sql[0], bind(self.comments_sql[1], news_id)).fetchall()
+
+    def write(self, db):
+        """Запись просмотра новости"""
+        db.execute('UPDATE news_news SET views = views + 1 WHERE id = ?', [random.choice(self.news_ids)])
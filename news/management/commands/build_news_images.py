@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from news.models import News
+from news_blog import images
+
+# python manage.py build_news_images команда
+
+class Command(BaseCommand):
+    help = 'Build missing news image thumbnails (card, detail and social sizes, WebP and fallback) in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild thumbnails even if they already exist')
+
+    def handle(self, *args, **options):
+        futures = []
+        total = 0
+        for news in News.objects.exclude(image='').exclude(image__isnull=True).only('id', 'image', 'image_hash').iterator():
+            total += 1
+            try:
+                future = news.process_image(force=options['force'])
+            except OSError as e:
+                self.stderr.write(f'{news.pk}: {e}')
+                continue
+            if future is not None:
+                futures.append(future)
+        images.shutdown()  # Ждем, пока миниатюры будут построены и записаны в новости
+        failed = sum(1 for future in futures if future.exception() is not None)
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} news images ({failed} failed)'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from news import cards
+
+# python manage.py card_cache_stats команда
+
+class Command(BaseCommand):
+    help = 'Show hit/miss statistics of the rendered news card cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = cards.get_stats()
+        self.stdout.write(f"Hits: {stats['hits']}")
+        self.stdout.write(f"Misses: {stats['misses']}")
+        self.stdout.write(f"Hit ratio: {stats['hit_ratio']:.1%}")
+        if options['reset']:
+            cards.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Card cache statistics reset'))
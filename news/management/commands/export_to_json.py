@@ -1,26 +1,149 @@
 # your_app/management/commands/export_to_json.py
-from django.core.management.base import BaseCommand
+import gzip
+import io
+import itertools
+import sys
+import time
+from datetime import datetime
+
+from django.apps import apps
 from django.core import serializers
-from news.models import Tag, News  
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 # python manage.py export_to_json команда
 
+# Экспортируемые модели в порядке зависимостей и поле даты изменения для --since.
+# Дата изменения есть только у новостей. Даты регистрации пользователя и создания комментария
+# не меняются при изменении строки, поэтому остальные модели выгружаются целиком.
+# Удаленные объекты в выгрузку не попадают.
+EXPORT_MODELS = (
+    ('auth.user', None),
+    ('users.profile', None),
+    ('news.tag', None),
+    ('news.news', 'updated_at'),
+    ('news.comment', None),
+)
+
+# Поля, которые выгружаются только по явному флагу
+SECRET_FIELDS = {'auth.user': {'password'}}
+
+# Связи, которые нужны сериализатору. Подгружаются пачками вместе с объектами, а не запросом на каждый объект
+PREFETCH = {
+    'news.news': ('tags', 'likes'),
+    'news.comment': ('likes',),
+    'auth.user': ('groups', 'user_permissions'),
+}
+
+
+def parse_since(value):
+    """Разбирает дату или дату и время из параметра --since"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid --since value: {value}')
+        moment = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class CountingIterator:
+    """Итератор, считающий выгруженные объекты"""
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.count = 0
+
+    def __iter__(self):
+        for obj in self.iterable:
+            self.count += 1
+            yield obj
+
+
 class Command(BaseCommand):
-    help = 'Export data from the database to a JSON file'
+    help = 'Export data from the database to a JSON file (streamed, all models, optionally incremental and compressed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='base.json', help="Output file, '-' for stdout (default: base.json)")
+        parser.add_argument('--format', choices=('json', 'jsonl'), default='json', help='JSON array (loaddata compatible) or JSON lines')
+        parser.add_argument(
+            '--since',
+            help='Export only news changed since this date or datetime (ISO 8601). Other models have no modification '
+                 'time and are exported in full; deleted objects are never exported',
+        )
+        parser.add_argument('--include-passwords', action='store_true', help='Export user password hashes (omitted by default)')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip (implied by a .gz output file)')
+        parser.add_argument('--indent', type=int, default=None, help='Indentation for the json format')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Number of rows fetched from the database at once')
+        parser.add_argument('--models', nargs='+', help='Export only these models (app_label.model)')
+
+    def get_models(self, options):
+        """Выгружаемые модели (метка, поле даты изменения)"""
+        selected = {label.lower() for label in options['models'] or ()}
+        return [(label, since_field) for label, since_field in EXPORT_MODELS if not selected or label in selected]
+
+    def get_fields(self, options):
+        """Имена выгружаемых полей (None - все поля): без секретных полей, если они не запрошены явно"""
+        if options['include_passwords']:
+            return None
+        fields = set()
+        for label, _ in self.get_models(options):
+            meta = apps.get_model(label)._meta
+            fields |= {field.name for field in [*meta.fields, *meta.many_to_many]} - SECRET_FIELDS.get(label, set())
+        # Выбор полей сериализатора общий для всех моделей, поэтому секретное поле не должно встречаться в других моделях
+        return fields
+
+    def get_querysets(self, options):
+        """Наборы запросов для выгрузки, каждый читается из базы пачками"""
+        since = parse_since(options['since']) if options['since'] else None
+        for label, since_field in self.get_models(options):
+            model = apps.get_model(label)
+            queryset = model._default_manager.order_by('pk')
+            if since is not None and since_field:
+                queryset = queryset.filter(**{f'{since_field}__gte': since})
+            if label in PREFETCH:
+                queryset = queryset.prefetch_related(*PREFETCH[label])
+            yield queryset
 
     def handle(self, *args, **options):
-        # Получаем все объекты моделей
-        tags_data = Tag.objects.all()
-        news_data = News.objects.all()
+        output = options['output']
+        compress = options['gzip'] or output.endswith('.gz')
+        chunk_size = options['chunk_size']
+        to_stdout = output == '-'
 
-        # Объединяем данные из обеих моделей
-        combined_data = list(tags_data) + list(news_data)
+        objects = CountingIterator(itertools.chain.from_iterable(
+            queryset.iterator(chunk_size=chunk_size) for queryset in self.get_querysets(options)
+        ))
 
-        # Сериализуем данные в JSON с отступами
-        json_data = serializers.serialize('json', combined_data, indent=4)
+        if to_stdout:
+            raw = sys.stdout.buffer
+        else:
+            raw = open(output, 'wb')
+        # Текстовый поток поверх файла. Закрытие gzip-потока не закрывает сам файл, обычный поток отсоединяем от файла
+        stream = gzip.open(raw, 'wt', encoding='utf-8') if compress else io.TextIOWrapper(raw, encoding='utf-8')
 
-        # Сохраняем JSON в файл
-        with open('base.json', 'w', encoding='utf-8') as json_file:
-            json_file.write(json_data)
+        started = time.monotonic()
+        try:
+            # Сериализатор пишет объекты в поток по одному, поэтому память не зависит от размера базы
+            serializers.serialize(
+                options['format'], objects, stream=stream, indent=options['indent'], ensure_ascii=False,
+                fields=self.get_fields(options),
+            )
+        finally:
+            if compress:
+                stream.close()
+            else:
+                stream.flush()
+                stream.detach()
+            if to_stdout:
+                raw.flush()
+            else:
+                raw.close()
 
-        self.stdout.write(self.style.SUCCESS('Data exported successfully to base.json'))
\ No newline at end of file
+        elapsed = time.monotonic() - started
+        message = f'Data exported successfully to {"stdout" if to_stdout else output}: {objects.count} objects in {elapsed:.1f}s'
+        # При выгрузке в stdout сообщения пишем в stderr, чтобы не испортить данные
+        (self.stderr if to_stdout else self.stdout).write(self.style.SUCCESS(message))
@@ -0,0 +1,252 @@
+import gzip
+import itertools
+import json
+import sys
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer
+from django.db import connection, transaction
+from news.models import News, Comment
+from news import cards, feeds, search
+from news.author_stats import rebuild_author_stats
+from news.tag_stats import rebuild_tag_stats
+from users.stats import rebuild_user_stats
+
+# python manage.py import_news base.json команда
+
+# Естественные ключи: объекты с таким ключом обновляются, а их ID в базе могут отличаться от ID в выгрузке.
+# Остальные модели обновляются по первичному ключу.
+NATURAL_KEYS = {
+    'auth.user': 'username',
+    'news.tag': 'name',
+    'users.profile': 'user',
+}
+
+# Внешние ключи, значения которых нужно перевести из ID выгрузки в ID базы
+REMAPPED_FIELDS = {
+    'users.profile': {'user': 'auth.user'},
+    'news.news': {'author': 'auth.user'},
+    'news.comment': {'author': 'auth.user'},
+}
+
+# Связи многие-ко-многим, которые записываются напрямую в промежуточные таблицы
+M2M_REMAP = {
+    ('news.news', 'tags'): 'news.tag',
+    ('news.news', 'likes'): 'auth.user',
+    ('news.comment', 'likes'): 'auth.user',
+}
+
+
+def iter_json_array(stream, buffer='', chunk_size=65536):
+    """Читает объекты JSON-массива из потока по одному, не загружая файл целиком"""
+    decoder = json.JSONDecoder()
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if buffer.startswith('['):
+                buffer, started = buffer[1:], True
+                continue
+        elif buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        elif buffer.startswith(']'):
+            return
+        elif buffer:
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield obj
+                buffer = buffer[end:]
+                continue
+        if eof:
+            if buffer.strip():
+                raise CommandError('Unexpected end of JSON data')
+            return
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer += chunk
+
+
+def iter_json_lines(stream):
+    """Читает объекты из файла JSON Lines"""
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_objects(stream):
+    """Определяет формат выгрузки (JSON-массив или JSON Lines) по первому символу"""
+    first = stream.read(1)
+    while first and first.isspace():
+        first = stream.read(1)
+    if first == '[':
+        return iter_json_array(stream, buffer=first)
+    return iter_json_lines(itertools.chain([first + stream.readline()], stream))
+
+
+def iter_batches(objects, batch_size):
+    """Группирует идущие подряд объекты одной модели в пачки"""
+    batch, label = [], None
+    for obj in objects:
+        if obj['model'] != label and batch:
+            yield label, batch
+            batch = []
+        label = obj['model']
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            yield label, batch
+            batch = []
+    if batch:
+        yield label, batch
+
+
+class Command(BaseCommand):
+    help = 'Bulk import data exported by export_to_json (idempotent, signals are not sent per object)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Exported file (.json, .jsonl, optionally .gz) or '-' for stdin")
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of objects inserted per query')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path == '-':
+            stream = sys.stdin
+        elif path.endswith('.gz'):
+            stream = gzip.open(path, 'rt', encoding='utf-8')
+        else:
+            stream = open(path, encoding='utf-8')
+
+        self.id_maps = defaultdict(dict)  # ID в выгрузке -> ID в базе для моделей с естественным ключом
+        self.counts = defaultdict(int)
+        self.models = set()
+        self.news_ids = []
+        started = time.monotonic()
+        try:
+            with transaction.atomic():
+                for label, batch in iter_batches(iter_objects(stream), options['batch_size']):
+                    self.import_batch(label.lower(), batch)
+                self.reset_sequences()
+                if self.news_ids:
+                    self.finish_news(options['batch_size'])
+                if self.models & {News, Comment}:
+                    # Счетчики активности пользователей при массовой записи не обновляются сигналами
+                    rebuild_user_stats()
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.monotonic() - started
+        total = sum(self.counts.values())
+        for label, count in self.counts.items():
+            self.stdout.write(f'{label}: {count}')
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(self.style.SUCCESS(f'Imported {total} objects in {elapsed:.1f}s ({rate:.0f} rows/sec)'))
+
+    def import_batch(self, label, batch):
+        """Записывает пачку объектов одной модели запросом INSERT ... ON CONFLICT DO UPDATE"""
+        model = apps.get_model(label)
+        self.models.add(model)
+        natural_key = NATURAL_KEYS.get(label)
+        remapped = REMAPPED_FIELDS.get(label, {})
+
+        objects, m2m = [], []
+        present = set()  # Поля, которые есть в выгрузке: отсутствующие (например, пароли) не перезаписываются
+        for item, deserialized in zip(batch, Deserializer(batch, ignorenonexistent=True)):
+            obj = deserialized.object
+            present |= item.get('fields', {}).keys()
+            if model is User and 'password' not in item.get('fields', {}):
+                obj.set_unusable_password()  # Новый пользователь из выгрузки без паролей не может войти по пустому паролю
+            for field_name, related_label in remapped.items():
+                attname = model._meta.get_field(field_name).attname
+                value = getattr(obj, attname)
+                setattr(obj, attname, self.id_maps[related_label].get(value, value))
+            if natural_key:
+                obj.pk = None  # ID назначает база, соответствие ID находим по естественному ключу
+            objects.append((item.get('pk'), obj))
+            m2m.append(deserialized.m2m_data)
+
+        pk_name = model._meta.pk.name
+        unique_field = model._meta.get_field(natural_key).name if natural_key else pk_name
+        update_fields = [
+            field.name for field in model._meta.concrete_fields
+            if not field.primary_key and field.name != unique_field and field.name in present
+        ]
+        if update_fields:
+            model._default_manager.bulk_create(
+                [obj for _, obj in objects],
+                update_conflicts=True,
+                unique_fields=[unique_field],
+                update_fields=update_fields,
+            )
+        else:
+            model._default_manager.bulk_create([obj for _, obj in objects], ignore_conflicts=True)
+
+        if natural_key:
+            attname = model._meta.get_field(natural_key).attname
+            keys = [getattr(obj, attname) for _, obj in objects]
+            db_ids = dict(model._default_manager.filter(**{f'{attname}__in': keys}).values_list(attname, 'pk'))
+            for source_pk, obj in objects:
+                obj.pk = db_ids[getattr(obj, attname)]
+                if source_pk is not None:
+                    self.id_maps[label][source_pk] = obj.pk
+
+        self.import_m2m(label, model, objects, m2m)
+        self.counts[label] += len(objects)
+
+        if model is News:
+            # Поиск, статистика и кэши обновляются один раз после всех пачек (см. finish_news)
+            self.news_ids.extend(obj.pk for _, obj in objects)
+
+    def finish_news(self, batch_size):
+        """
+        Поштучные сигналы при массовой записи не отправляются: после всех пачек индексирует импортированные
+        новости, пересчитывает статистику тегов и авторов и один раз сбрасывает кэши карточек, поиска и лент
+        """
+        news_ids = list(dict.fromkeys(self.news_ids))
+        for start in range(0, len(news_ids), batch_size):
+            search.index_news(
+                News.objects.filter(pk__in=news_ids[start:start + batch_size]).only('title', 'brief', 'content')
+            )
+        rebuild_tag_stats()
+        rebuild_author_stats()
+        cards.invalidate_all_cards()
+        search.invalidate_cache()
+        feeds.invalidate_feeds()
+
+    def import_m2m(self, label, model, objects, m2m):
+        """Заменяет связи многие-ко-многим объектов пачки, записывая строки промежуточных таблиц пачкой"""
+        for field in model._meta.many_to_many:
+            if not any(field.name in data for data in m2m):
+                continue
+            through = field.remote_field.through
+            source_column = field.m2m_field_name()
+            target_column = field.m2m_reverse_field_name()
+            related_map = self.id_maps[M2M_REMAP.get((label, field.name), '')]
+
+            ids = [obj.pk for _, obj in objects]
+            through.objects.filter(**{f'{source_column}__in': ids}).delete()
+            rows = [
+                through(**{f'{source_column}_id': obj.pk, f'{target_column}_id': related_map.get(value, value)})
+                for (_, obj), data in zip(objects, m2m)
+                for value in data.get(field.name, ())
+            ]
+            through.objects.bulk_create(rows, ignore_conflicts=True)
+
+    def reset_sequences(self):
+        """Обновляет счетчики ID после вставки объектов с явными ID (как loaddata)"""
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), list(self.models))
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from news.author_stats import rebuild_author_stats
+
+# python manage.py rebuild_author_stats команда
+
+class Command(BaseCommand):
+    help = 'Recalculate materialized author statistics (news count, views, likes and last publication date per status)'
+
+    def handle(self, *args, **options):
+        rows, changed = rebuild_author_stats()
+        self.stdout.write(self.style.SUCCESS(f'Author statistics rebuilt: {rows} rows, {changed} corrected'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from news.models import News
+from news import search
+
+# python manage.py rebuild_search_index команда
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for news'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of news indexed per batch')
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            self.stdout.write(self.style.WARNING('Full-text index is only supported on SQLite, nothing to do'))
+            return
+
+        chunk_size = options['chunk_size']
+        total = 0
+        with transaction.atomic():
+            search.create_index()
+            search.clear_index()
+            batch = []
+            for news in News.objects.only('id', 'title', 'brief', 'content').iterator(chunk_size=chunk_size):
+                batch.append(news)
+                if len(batch) >= chunk_size:
+                    search.index_news(batch)
+                    total += len(batch)
+                    batch = []
+            search.index_news(batch)
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt: {total} news indexed'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from news.tag_stats import rebuild_tag_stats
+
+# python manage.py rebuild_tag_stats команда
+
+class Command(BaseCommand):
+    help = 'Recalculate materialized tag statistics (news count and last publication date per tag and status)'
+
+    def handle(self, *args, **options):
+        rows, changed = rebuild_tag_stats()
+        self.stdout.write(self.style.SUCCESS(f'Tag statistics rebuilt: {rows} rows, {changed} corrected'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from news.bulk_likes import claimable_jobs, run_job
+
+# python manage.py run_like_jobs команда
+
+class Command(BaseCommand):
+    help = 'Run queued and interrupted admin bulk like jobs (e.g. after a server restart)'
+
+    def handle(self, *args, **options):
+        job_ids = claimable_jobs().order_by('created_at').values_list('id', flat=True)
+        done = 0
+        for job_id in list(job_ids):
+            if run_job(job_id):
+                done += 1
+            else:
+                self.stderr.write(f'Job #{job_id} failed or was claimed by another process')
+        self.stdout.write(self.style.SUCCESS(f'Finished {done} like jobs'))
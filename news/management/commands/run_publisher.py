@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from news import publisher
+
+# python manage.py run_publisher команда
+
+class Command(BaseCommand):
+    help = 'Publish scheduled news when their publication date comes and archive old news (runs until interrupted)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process all due news and exit')
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of news changed per batch')
+        parser.add_argument('--poll-interval', type=float, default=60.0, help='Maximum sleep between checks in seconds')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Publisher started'))
+        try:
+            while True:
+                processed = publisher.run_once(options['batch_size'])
+                if processed:
+                    self.stdout.write(f'Processed {processed} news')
+                if options['once']:
+                    break
+                # Спим до ближайшего срока публикации или архивирования
+                time.sleep(publisher.next_due_in(options['poll_interval']))
+                connection.close_if_unusable_or_obsolete()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Publisher stopped'))
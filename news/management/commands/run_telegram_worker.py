@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from news.notifications import TelegramWorker
+
+# python manage.py run_telegram_worker команда
+
+class Command(BaseCommand):
+    help = 'Send queued Telegram notifications (runs until interrupted)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send all due notifications and exit')
+        parser.add_argument('--batch-size', type=int, default=50, help='Number of notifications sent per batch')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Maximum sleep between queue checks in seconds')
+
+    def handle(self, *args, **options):
+        worker = TelegramWorker(batch_size=options['batch_size'])
+        worker.start()
+        self.stdout.write(self.style.SUCCESS('Telegram worker started'))
+        try:
+            while True:
+                processed = worker.run_once()
+                if processed:
+                    continue  # Сразу забираем следующую пачку
+                if options['once']:
+                    break
+                time.sleep(worker.next_due_in(options['poll_interval']))
+                connection.close_if_unusable_or_obsolete()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.stop()
+        self.stdout.write(self.style.SUCCESS('Telegram worker stopped'))
@@ -0,0 +1,148 @@
+"""
+Учет запросов к базе данных на каждый HTTP-запрос.
+QueryInstrumentationMiddleware считает запросы и время работы базы, добавляет заголовок Server-Timing
+и пишет в лог запросы, превысившие бюджет времени или количества запросов, вместе с их SQL.
+Повторяющиеся запросы одного вида (признак N+1) записываются в лог с представлением
+и местом, где они выполнены: строкой шаблона или строкой кода проекта.
+Место определяется по стеку вызовов, поэтому вычисляется не для каждого запроса, а только для повторяющихся
+и для запросов после превышения бюджета. По умолчанию учет включен только в режиме отладки.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Списки параметров IN (%s, %s, ...) разной длины считаются одним видом запроса
+PLACEHOLDERS_RE = re.compile(r'%s(?:, %s)+')
+
+PROJECT_DIR = str(settings.BASE_DIR)
+
+
+def query_template(sql):
+    """Вид запроса: SQL без значений параметров"""
+    return PLACEHOLDERS_RE.sub('%s', sql)
+
+
+def query_location():
+    """
+    Место, где выполнен запрос: ближайшая строка шаблона (по стеку рендеринга узлов шаблона),
+    иначе ближайшая строка кода проекта.
+    """
+    code_location = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            origin = getattr(node, 'origin', None)
+            if token is not None and origin is not None:
+                return f'{origin.template_name}:{token.lineno}'
+        filename = frame.f_code.co_filename
+        if code_location is None and filename.startswith(PROJECT_DIR) and 'site-packages' not in filename \
+                and filename != __file__:
+            code_location = f'{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return code_location
+
+
+class QueryTracker:
+    """
+    Обертка выполнения запросов (connection.execute_wrapper), которая записывает SQL, время и место запроса.
+    Место записывается, только если вид запроса повторился repeat_threshold раз или превышен бюджет
+    количества (query_budget) или времени (time_budget, в секундах от создания обертки).
+    """
+
+    def __init__(self, repeat_threshold, query_budget, time_budget):
+        self.queries = []
+        self.duration = 0.0
+        self.counts = defaultdict(int)  # Количество запросов по видам
+        self.repeat_threshold = repeat_threshold
+        self.query_budget = query_budget
+        self.deadline = time.perf_counter() + time_budget
+
+    def needs_location(self, template):
+        return (
+            self.counts[template] >= self.repeat_threshold or len(self.queries) >= self.query_budget
+            or time.perf_counter() > self.deadline
+        )
+
+    def __call__(self, execute, sql, params, many, context):
+        template = query_template(sql)
+        self.counts[template] += 1
+        location = query_location() if self.needs_location(template) else None
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.duration += duration
+            self.queries.append((sql, duration, location))
+
+    def repeated(self):
+        """Виды запросов, выполненные не меньше repeat_threshold раз: [(SQL, количество, места)]"""
+        locations = defaultdict(set)
+        for sql, _, location in self.queries:
+            if location:
+                locations[query_template(sql)].add(location)
+        return [
+            (sql, count, sorted(locations[sql]))
+            for sql, count in self.counts.items() if count >= self.repeat_threshold
+        ]
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Считает запросы к базе и время их выполнения для каждого HTTP-запроса.
+    Настройки: DB_INSTRUMENTATION (включение), REQUEST_TIME_BUDGET_MS, REQUEST_QUERY_BUDGET,
+    N_PLUS_ONE_THRESHOLD (сколько одинаковых запросов считать признаком N+1).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DB_INSTRUMENTATION:
+            return self.get_response(request)
+
+        tracker = QueryTracker(
+            settings.N_PLUS_ONE_THRESHOLD, settings.REQUEST_QUERY_BUDGET, settings.REQUEST_TIME_BUDGET_MS / 1000,
+        )
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(tracker))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        db_ms = tracker.duration * 1000
+        total_ms = total * 1000
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{len(tracker.queries)} queries", app;dur={total_ms - db_ms:.1f}, total;dur={total_ms:.1f}'
+        )
+        self.report(request, tracker, total_ms)
+        return response
+
+    def report(self, request, tracker, total_ms):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else None
+        if total_ms > settings.REQUEST_TIME_BUDGET_MS or len(tracker.queries) > settings.REQUEST_QUERY_BUDGET:
+            statements = '\n'.join(
+                f'  {duration * 1000:.1f} ms {location or "-"}: {sql}' for sql, duration, location in tracker.queries
+            )
+            logger.warning(
+                f'{request.method} {request.path} ({view}): {total_ms:.0f} ms, {len(tracker.queries)} queries '
+                f'({tracker.duration * 1000:.0f} ms in DB) over budget\n{statements}'
+            )
+        for sql, count, locations in tracker.repeated():
+            logger.warning(
+                f'N+1 in {request.method} {request.path} ({view}): query repeated {count} times '
+                f'at {", ".join(locations) or "unknown location"}: {sql}'
+            )
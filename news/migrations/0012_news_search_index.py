@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # Полнотекстовый индекс FTS5 создается только для SQLite
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from news.search import create_index, index_news
+    create_index(schema_editor)
+    News = apps.get_model('news', 'News')
+    index_news(News.objects.only('id', 'title', 'brief', 'content').iterator())
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from news.search import drop_index
+    drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0011_remove_comment_dislikes_remove_news_dislikes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
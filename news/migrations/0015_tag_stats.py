@@ -0,0 +1,51 @@
+# Generated by Django 4.2 on 2026-10-18 12:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_tag_stats(apps, schema_editor):
+    # Начальное заполнение статистики тегов по уже существующим новостям
+    News = apps.get_model('news', 'News')
+    TagStats = apps.get_model('news', 'TagStats')
+    rows = (
+        News.tags.through.objects.values('tag_id', 'news__status')
+        .annotate(count=models.Count('news_id'), last_pub_date=models.Max('news__pub_date'))
+    )
+    TagStats.objects.bulk_create([
+        TagStats(tag_id=row['tag_id'], status=row['news__status'], count=row['count'], last_pub_date=row['last_pub_date'])
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0014_news_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('draft', 'Не проверено'), ('published', 'Проверено'), ('archived', 'Архив')], max_length=10, verbose_name='Статус')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество новостей')),
+                ('last_pub_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата последней новости')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='news.tag', verbose_name='Тег')),
+            ],
+            options={
+                'verbose_name': 'Статистика тега',
+                'verbose_name_plural': 'Статистика тегов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tagstats',
+            index=models.Index(fields=['status', '-count'], name='news_tagstats_cloud_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='tagstats',
+            constraint=models.UniqueConstraint(fields=('tag', 'status'), name='news_tagstats_tag_status_uniq'),
+        ),
+        migrations.RunPython(fill_tag_stats, migrations.RunPython.noop),
+    ]
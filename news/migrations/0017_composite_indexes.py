@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0016_news_image_variants'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='tagstats',
+            name='news_tagstats_cloud_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['news', '-created_at', '-id'], name='news_comment_news_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['status', '-pub_date', '-id'], name='news_status_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='news_author_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['author', 'status', '-pub_date', '-id'], name='news_author_status_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tagstats',
+            index=models.Index(fields=['status', '-count', 'tag'], name='news_tagstats_cloud_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2 on 2026-10-18 13:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_author_stats(apps, schema_editor):
+    # Начальное заполнение статистики авторов по уже существующим новостям и лайкам
+    News = apps.get_model('news', 'News')
+    AuthorStats = apps.get_model('news', 'AuthorStats')
+    likes = {
+        (row['news__author_id'], row['news__status']): row['total']
+        for row in News.likes.through.objects.values('news__author_id', 'news__status')
+        .annotate(total=models.Count('id')).order_by()
+    }
+    rows = (
+        News.objects.values('author_id', 'status')
+        .annotate(count=models.Count('id'), total_views=models.Sum('views'), last_pub_date=models.Max('pub_date')).order_by()
+    )
+    AuthorStats.objects.bulk_create([
+        AuthorStats(
+            author_id=row['author_id'], status=row['status'], count=row['count'], views=row['total_views'] or 0,
+            likes=likes.get((row['author_id'], row['status']), 0), last_pub_date=row['last_pub_date'],
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('news', '0017_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('draft', 'Не проверено'), ('published', 'Проверено'), ('archived', 'Архив')], max_length=10, verbose_name='Статус')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество новостей')),
+                ('views', models.PositiveBigIntegerField(default=0, verbose_name='Просмотры')),
+                ('likes', models.PositiveIntegerField(default=0, verbose_name='Лайки')),
+                ('last_pub_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата последней новости')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='author_stats', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='authorstats',
+            constraint=models.UniqueConstraint(fields=('author', 'status'), name='news_authorstats_author_status_uniq'),
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
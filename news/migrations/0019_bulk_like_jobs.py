@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-18 13:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('news', '0018_author_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkLikeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('add', 'Добавить лайк'), ('remove', 'Удалить все лайки')], max_length=10, verbose_name='Действие')),
+                ('target', models.CharField(choices=[('news', 'Новости'), ('comment', 'Комментарии')], max_length=10, verbose_name='Объекты')),
+                ('object_ids', models.JSONField(default=list, verbose_name='ID объектов')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Всего объектов')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Выполнено'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Захвачено до')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='like_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задание с лайками',
+                'verbose_name_plural': 'Задания с лайками',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bulklikejob',
+            index=models.Index(fields=['status', 'created_at'], name='news_likejob_status_idx'),
+        ),
+    ]
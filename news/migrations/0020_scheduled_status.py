@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0019_bulk_like_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='authorstats',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Не проверено'), ('scheduled', 'Запланировано'), ('published', 'Проверено'), ('archived', 'Архив')], max_length=10, verbose_name='Статус'),
+        ),
+        migrations.AlterField(
+            model_name='news',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Не проверено'), ('scheduled', 'Запланировано'), ('published', 'Проверено'), ('archived', 'Архив')], default='draft', max_length=10, verbose_name='Статус'),
+        ),
+        migrations.AlterField(
+            model_name='tagstats',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Не проверено'), ('scheduled', 'Запланировано'), ('published', 'Проверено'), ('archived', 'Архив')], max_length=10, verbose_name='Статус'),
+        ),
+    ]
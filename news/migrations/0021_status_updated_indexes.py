@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0020_scheduled_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='authorstats',
+            index=models.Index(fields=['status', 'count'], name='news_authorstats_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['status', 'updated_at'], name='news_status_updated_idx'),
+        ),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
 from unidecode import unidecode
+from news_blog import images
 
 class Tag(models.Model):
     """Класс для тегов новостей"""
@@ -21,10 +25,50 @@ class Tag(models.Model):
         verbose_name = "Тег"
         verbose_name_plural = "Теги"
 
+def likes_count(likes_field):
+    """
+    Количество лайков коррелированным подзапросом к промежуточной таблице по ее индексу.
+    В отличие от Count('likes') основной запрос не группируется, поэтому сортировка
+    берется из индекса и с LIMIT читается только одна страница.
+    """
+    through = likes_field.remote_field.through
+    column = likes_field.m2m_field_name()
+    return Coalesce(Subquery(
+        through.objects.filter(**{column: OuterRef('pk')}).order_by()
+        .values(column).annotate(count=models.Count(column)).values('count')
+    ), 0)
+
+
+class NewsQuerySet(models.QuerySet):
+    """Набор запросов для новостей"""
+
+    def for_cards(self):
+        """
+        Выборка для карточек в списках новостей: количество лайков считается в том же запросе,
+        теги подгружаются одним запросом на страницу, а тяжелый текст новости не загружается.
+        """
+        return self.annotate(
+            likes_count=likes_count(News._meta.get_field('likes'))
+        ).prefetch_related('tags').defer('content')
+
+    def search(self, query, rank=False):
+        """Полнотекстовый поиск по заголовку и тексту новости (см. news.search), rank - добавить релевантность"""
+        from .search import search_queryset
+        return search_queryset(self, query, rank)
+
+    def touch(self):
+        """
+        Обновляет дату изменения новостей, когда меняется то, что показывается на их страницах,
+        но не поля самой новости: теги, лайки, комментарии (см. news.signals)
+        """
+        return self.update(updated_at=timezone.now())
+
+
 class News(models.Model):
     """Класс для новостей"""
     STATUS_CHOICES = (
         ('draft', 'Не проверено'),
+        ('scheduled', 'Запланировано'),  # Публикуется автоматически в pub_date (команда run_publisher)
         ('published', 'Проверено'),
         ('archived', 'Архив'),
     )
@@ -40,22 +84,113 @@ class News(models.Model):
     author = models.ForeignKey(User, on_delete=models.SET_DEFAULT, default=1, verbose_name='Автор')  # Устанавливаем по умолчанию администратора
     likes = models.ManyToManyField(User, related_name='liked_news', blank=True, verbose_name='Лайки')
     notified = models.BooleanField(default=False, verbose_name='Уведомление отправлено')
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name='Дата изменения')
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)  # Хэш файла, по которому построены миниатюры
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # {размер: {формат: имя файла}}
+
+    objects = NewsQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженное изображение, чтобы при сохранении понять, изменилось ли оно
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
+    def get_image_url(self, size=None, fmt=None):
+        """
+        URL изображения новости. С размером возвращается подходящая миниатюра, а пока миниатюры
+        не построены - исходное изображение. fmt='webp' - миниатюра в формате WebP.
+        """
+        if not self.image:
+            return None
+        if size is not None or fmt is not None:
+            name = images.pick_variant(self.image_variants, size, fmt)
+            if name:
+                return self.image.storage.url(name)
+            if fmt is not None:
+                return None
+        return self.image.url
+
+    def process_image(self, force=False):
+        """Строит миниатюры изображения вне запроса (см. news_blog.images). Без изменений файла миниатюры не пересоздаются"""
+        if not self.image:
+            return None
+        pk, name = self.pk, self.image.name
+
+        def on_done(digest, variants):
+            # Изображение могло смениться, пока строились миниатюры. Миниатюры меняют разметку карточки и страницы (srcset),
+            # поэтому обновляется и дата изменения, от которой зависят ETag и Last-Modified
+            updated = News.objects.filter(pk=pk, image=name).update(
+                image_hash=digest, image_variants=variants, updated_at=timezone.now(),
+            )
+            if updated:
+                from .signals import news_bulk_updated
+                news_bulk_updated.send(sender=News, news_ids=[pk], fields=['image_hash', 'image_variants'])
+
+        return images.process_image(
+            self.image.path, 'news_images/derived', settings.NEWS_IMAGE_SIZES,
+            '' if force else self.image_hash, on_done,
+        )
+
+    def save(self, *args, **kwargs):
+        # Обновляем дату изменения. Не auto_now, чтобы выгрузки без этого поля (base.json) загружались со значением по умолчанию
+        self.updated_at = timezone.now()
+        image_changed = self.image.name != getattr(self, '_loaded_image', None)
+        if image_changed and self.image and self.image_hash and images.field_file_hash(self.image) == self.image_hash:
+            # Загружен файл с тем же содержимым: миниатюры названы по хэшу содержимого и по-прежнему подходят
+            image_changed = False
+        if image_changed:
+            # Миниатюры старого изображения больше не подходят
+            self.image_hash = ''
+            self.image_variants = {}
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
+            if image_changed:
+                kwargs['update_fields'] |= {'image_hash', 'image_variants'}
+        super().save(*args, **kwargs)
+        self._loaded_image = self.image.name
+
+        if image_changed and self.image:
+            # Миниатюры строятся после фиксации транзакции и не задерживают ответ на запрос
+            transaction.on_commit(self.process_image)
+
     def increase_views(self):
-        # Добавляем один просмотр к новости при каждом открытии
+        # Добавляем один просмотр к новости при каждом открытии.
+        # Просмотр попадает в буфер и записывается в базу пачкой (см. news.counters)
+        from .counters import views_counter
+        views_counter.incr(self.pk)
         self.views += 1
-        self.save(update_fields=['views'])
 
     def total_likes(self):
-        # Добавляем количество лайков к новости
+        # Добавляем количество лайков к новости (если количество уже посчитано в запросе, берем его)
+        if hasattr(self, 'likes_count'):
+            return self.likes_count
         return self.likes.count()
 
     class Meta:
         verbose_name = "Новость"
         verbose_name_plural = "Новости"
+        indexes = [
+            # Списки актуальных и архивных новостей: фильтр по статусу, сортировка по дате публикации
+            models.Index(fields=['status', '-pub_date', '-id'], name='news_status_pub_idx'),
+            # Дата последнего изменения списка для условных запросов: MAX(updated_at) по статусу (см. news.conditional)
+            models.Index(fields=['status', 'updated_at'], name='news_status_updated_idx'),
+            # Статьи автора: все или с указанным статусом
+            models.Index(fields=['author', '-pub_date', '-id'], name='news_author_pub_idx'),
+            models.Index(fields=['author', 'status', '-pub_date', '-id'], name='news_author_status_pub_idx'),
+        ]
+
+
+class CommentQuerySet(models.QuerySet):
+    """Набор запросов для комментариев"""
+
+    def for_list(self):
+        """Выборка для списка комментариев: автор загружается в том же запросе, лайки считаются в нем же"""
+        return self.select_related('author').annotate(likes_count=likes_count(Comment._meta.get_field('likes')))
 
 
 class Comment(models.Model):
@@ -66,14 +201,158 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     likes = models.ManyToManyField(User, related_name='liked_comments', blank=True, verbose_name='Лайки')
 
+    objects = CommentQuerySet.as_manager()
+
     def __str__(self):
         return f"Комментарий от {self.author.username} к {self.news.title}"
 
     def total_likes(self):
+        # Если количество лайков уже посчитано в запросе, берем его
+        if hasattr(self, 'likes_count'):
+            return self.likes_count
         return self.likes.count()
-    
+
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
+        indexes = [
+            # Комментарии новости от новых к старым
+            models.Index(fields=['news', '-created_at', '-id'], name='news_comment_news_created_idx'),
+        ]
+
+        
+
+class TelegramNotification(models.Model):
+    """
+    Очередь (outbox) уведомлений в Telegram.
+    Уведомление записывается в той же транзакции, что и новость, а отправляется фоновым процессом
+    (команда run_telegram_worker), поэтому запрос пользователя не ждет ответа Telegram.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'В очереди'),
+        ('sending', 'Отправляется'),  # Захвачено процессом отправки до next_attempt_at (см. news.notifications)
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    )
+
+    news = models.ForeignKey(News, on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications', verbose_name='Новость')
+    chat_id = models.CharField(max_length=64, verbose_name='Чат')
+    message = models.TextField(verbose_name='Сообщение')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попытки')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата отправки')
 
-        
\ No newline at end of file
+    def __str__(self):
+        return f"Уведомление #{self.pk} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Уведомление в Telegram"
+        verbose_name_plural = "Уведомления в Telegram"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='news_notification_due_idx'),
+        ]
+
+
+class TagStats(models.Model):
+    """
+    Материализованная статистика тега: количество новостей с тегом и дата последней из них для каждого статуса.
+    Обновляется сигналами при изменении новостей и их тегов (см. news.tag_stats), поэтому страницы тегов,
+    облако тегов и админка не считают новости по промежуточной таблице.
+    """
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='stats', verbose_name='Тег')
+    status = models.CharField(max_length=10, choices=News.STATUS_CHOICES, verbose_name='Статус')
+    count = models.PositiveIntegerField(default=0, verbose_name='Количество новостей')
+    last_pub_date = models.DateTimeField(null=True, blank=True, verbose_name='Дата последней новости')
+
+    def __str__(self):
+        return f"{self.tag} ({self.get_status_display()}): {self.count}"
+
+    class Meta:
+        verbose_name = "Статистика тега"
+        verbose_name_plural = "Статистика тегов"
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'status'], name='news_tagstats_tag_status_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['status', '-count', 'tag'], name='news_tagstats_cloud_idx'),
+        ]
+
+
+class AuthorStats(models.Model):
+    """
+    Материализованная статистика автора по каждому статусу новостей: количество новостей, просмотры,
+    лайки и дата последней новости. Обновляется сигналами при изменении новостей и лайков (см. news.author_stats),
+    поэтому страница автора и админка не считают новости автора при каждом запросе.
+    """
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='author_stats', verbose_name='Автор')
+    status = models.CharField(max_length=10, choices=News.STATUS_CHOICES, verbose_name='Статус')
+    count = models.PositiveIntegerField(default=0, verbose_name='Количество новостей')
+    views = models.PositiveBigIntegerField(default=0, verbose_name='Просмотры')
+    likes = models.PositiveIntegerField(default=0, verbose_name='Лайки')
+    last_pub_date = models.DateTimeField(null=True, blank=True, verbose_name='Дата последней новости')
+
+    def __str__(self):
+        return f"{self.author} ({self.get_status_display()}): {self.count}"
+
+    class Meta:
+        verbose_name = "Статистика автора"
+        verbose_name_plural = "Статистика авторов"
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'status'], name='news_authorstats_author_status_uniq'),
+        ]
+        indexes = [
+            # Количество новостей в статусе по всем авторам (см. news.conditional)
+            models.Index(fields=['status', 'count'], name='news_authorstats_status_idx'),
+        ]
+
+
+class BulkLikeJob(models.Model):
+    """
+    Фоновое задание массового добавления или удаления лайков из админки.
+    Большие выборки обрабатываются частями вне запроса (см. news.bulk_likes), после каждой части
+    сохраняется прогресс, поэтому задание видно в админке и продолжается после перезапуска (команда run_like_jobs).
+    """
+    ACTION_CHOICES = (
+        ('add', 'Добавить лайк'),
+        ('remove', 'Удалить все лайки'),
+    )
+    TARGET_CHOICES = (
+        ('news', 'Новости'),
+        ('comment', 'Комментарии'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнено'),
+        ('failed', 'Ошибка'),
+    )
+
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name='Действие')
+    target = models.CharField(max_length=10, choices=TARGET_CHOICES, verbose_name='Объекты')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='like_jobs', verbose_name='Пользователь')
+    object_ids = models.JSONField(default=list, verbose_name='ID объектов')
+    total = models.PositiveIntegerField(default=0, verbose_name='Всего объектов')
+    processed = models.PositiveIntegerField(default=0, verbose_name='Обработано')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    locked_until = models.DateTimeField(null=True, blank=True, verbose_name='Захвачено до')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата завершения')
+
+    def __str__(self):
+        return f"{self.get_action_display()}: {self.get_target_display().lower()} ({self.processed}/{self.total})"
+
+    @property
+    def progress(self):
+        """Процент обработанных объектов"""
+        return 100 * self.processed // self.total if self.total else 100
+
+    class Meta:
+        verbose_name = "Задание с лайками"
+        verbose_name_plural = "Задания с лайками"
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='news_likejob_status_idx'),
+        ]
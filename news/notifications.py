@@ -0,0 +1,182 @@
+"""
+Уведомления о новых новостях в Telegram через очередь (outbox).
+queue_news_notification() записывает уведомление в таблицу TelegramNotification,
+а TelegramWorker (команда run_telegram_worker) забирает уведомления пачками и отправляет их
+одним экземпляром бота с ограничением частоты и повторными попытками с нарастающей задержкой.
+Каждое уведомление перед отправкой захватывается условным UPDATE, поэтому несколько процессов
+отправки не отправляют одно уведомление дважды.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+import telegram
+from telegram.error import BadRequest, ChatMigrated, Forbidden, InvalidToken, RetryAfter
+from django.conf import settings
+from django.utils import timezone
+
+from .models import News, TelegramNotification
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, которые не исчезнут при повторе: неверная разметка или получатель (BadRequest), бот заблокирован или
+# исключен из чата (Forbidden), чат перенесен (ChatMigrated), неверный токен. Такие уведомления сразу помечаются
+# как неотправленные, повторы с задержкой - только для сетевых ошибок, таймаутов и RetryAfter
+PERMANENT_ERRORS = (BadRequest, Forbidden, ChatMigrated, InvalidToken)
+
+
+def format_news_message(news, header='*Новая новость!*'):
+    """Формирует текст уведомления о новой новости"""
+    # Форматирование даты публикации
+    pub_date_formatted = timezone.localtime(news.pub_date).strftime('%d.%m.%Y %H:%M')
+
+    # Ограничение длины текста новости
+    content_truncated = (news.content[:100] + '...') if len(news.content) > 100 else news.content
+
+    # Формируем сообщение с полной информацией о новости
+    message_template = (
+        f"Заголовок: {news.title}\n"
+        f"Краткое описание: {news.brief}\n"
+        f"Текст новости: {content_truncated}\n"
+        f"Дата публикации: {pub_date_formatted}\n"
+        f"Изображение: {'Да' if news.image else 'Нет'}\n"
+        f"Автор: {news.author.username}"
+    )
+    return header + '\n' + message_template
+
+
+def queue_news_notification(news):
+    """Добавляет уведомление о новости в очередь"""
+    return TelegramNotification.objects.create(
+        news=news,
+        chat_id=settings.YOUR_PERSONAL_CHAT_ID or '',
+        message=format_news_message(news),
+    )
+
+
+def queue_news_notifications(news_list, header='*Новая новость!*'):
+    """Добавляет уведомления о нескольких новостях в очередь одним запросом"""
+    return TelegramNotification.objects.bulk_create([
+        TelegramNotification(news=news, chat_id=settings.YOUR_PERSONAL_CHAT_ID or '', message=format_news_message(news, header))
+        for news in news_list
+    ])
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: удваивается с каждой неудачей, но не больше TELEGRAM_RETRY_MAX_DELAY"""
+    return min(settings.TELEGRAM_RETRY_BASE_DELAY * 2 ** (attempts - 1), settings.TELEGRAM_RETRY_MAX_DELAY)
+
+
+class TelegramWorker:
+    """
+    Фоновая отправка уведомлений из очереди.
+    Бот (и его HTTP-клиент) создается один раз на все время работы. Работа с базой идет синхронно,
+    а в цикле событий выполняется только отправка сообщений пачки.
+    """
+
+    def __init__(self, token=None, base_url=None, batch_size=50, rate_limit=None, max_attempts=None):
+        self.token = token or settings.TELEGRAM_BOT_TOKEN
+        self.base_url = base_url or settings.TELEGRAM_API_URL
+        self.batch_size = batch_size
+        rate_limit = rate_limit or settings.TELEGRAM_RATE_LIMIT
+        self.min_interval = 1 / rate_limit  # Минимальный интервал между сообщениями в секундах
+        self.max_attempts = max_attempts or settings.TELEGRAM_MAX_ATTEMPTS
+        self.loop = asyncio.new_event_loop()
+        self.bot = None
+
+    def start(self):
+        self.bot = telegram.Bot(token=self.token, base_url=self.base_url)
+        self.loop.run_until_complete(self.bot.initialize())
+
+    def stop(self):
+        if self.bot is not None:
+            self.loop.run_until_complete(self.bot.shutdown())
+            self.bot = None
+        self.loop.close()
+
+    def claim_notifications(self):
+        """
+        Забирает пачку уведомлений, время отправки которых наступило.
+        Уведомление захватывается запросом UPDATE ... SET status = 'sending' с условием на прочитанные статус
+        и время: если его уже забрал другой процесс, запрос не изменит строку, и уведомление пропускается.
+        Захват действует TELEGRAM_CLAIM_TIMEOUT секунд (next_attempt_at), после этого уведомление процесса,
+        остановившегося во время отправки, забирается заново.
+        """
+        now = timezone.now()
+        claimed_until = now + timedelta(seconds=settings.TELEGRAM_CLAIM_TIMEOUT)
+        due = (
+            TelegramNotification.objects.filter(status__in=('pending', 'sending'), next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:self.batch_size]
+        )
+        claimed = []
+        for notification in due:
+            rows = TelegramNotification.objects.filter(
+                pk=notification.pk, status=notification.status, next_attempt_at=notification.next_attempt_at,
+            ).update(status='sending', next_attempt_at=claimed_until)
+            if rows:
+                notification.status, notification.next_attempt_at = 'sending', claimed_until
+                claimed.append(notification)
+        return claimed
+
+    async def _send_batch(self, notifications):
+        """Отправляет сообщения пачки с ограничением частоты. Возвращает список ошибок (None - успех)"""
+        results = []
+        last_sent = 0.0
+        for notification in notifications:
+            wait = self.min_interval - (time.monotonic() - last_sent)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            last_sent = time.monotonic()
+            try:
+                await self.bot.send_message(chat_id=notification.chat_id, text=notification.message, parse_mode='Markdown')
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def run_once(self):
+        """Отправляет одну пачку уведомлений. Возвращает количество обработанных уведомлений"""
+        notifications = self.claim_notifications()
+        if not notifications:
+            return 0
+
+        results = self.loop.run_until_complete(self._send_batch(notifications))
+        now = timezone.now()
+        sent_ids = []
+        for notification, error in zip(notifications, results):
+            if error is None:
+                sent_ids.append(notification.pk)
+                continue
+            notification.attempts += 1
+            notification.last_error = str(error)
+            if isinstance(error, PERMANENT_ERRORS):
+                notification.status = 'failed'
+                logger.error(f'Уведомление #{notification.pk} не может быть отправлено: {error}')
+            elif notification.attempts >= self.max_attempts:
+                notification.status = 'failed'
+                logger.error(f'Уведомление #{notification.pk} не отправлено после {notification.attempts} попыток: {error}')
+            else:
+                delay = error.retry_after if isinstance(error, RetryAfter) else retry_delay(notification.attempts)
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                notification.status = 'pending'
+                notification.next_attempt_at = now + timedelta(seconds=delay)
+                logger.warning(f'Ошибка отправки уведомления #{notification.pk}, повтор через {delay} с: {error}')
+            notification.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+        if sent_ids:
+            TelegramNotification.objects.filter(pk__in=sent_ids).update(status='sent', sent_at=now, last_error='')
+            News.objects.filter(notifications__pk__in=sent_ids).update(notified=True)
+            logger.info(f'Отправлено уведомлений: {len(sent_ids)}')
+        return len(notifications)
+
+    def next_due_in(self, poll_interval):
+        """Через сколько секунд наступит время следующего уведомления (не больше poll_interval)"""
+        next_attempt_at = (
+            TelegramNotification.objects.filter(status__in=('pending', 'sending'))
+            .order_by('next_attempt_at').values_list('next_attempt_at', flat=True).first()
+        )
+        if next_attempt_at is None:
+            return poll_interval
+        return max(0.0, min(poll_interval, (next_attempt_at - timezone.now()).total_seconds()))
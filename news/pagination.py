@@ -0,0 +1,183 @@
+"""
+Курсорная (keyset) пагинация списков новостей.
+Вместо OFFSET страница ищется по ключу (дата, id) последнего показанного объекта,
+поэтому глубокие страницы архива стоят столько же, сколько первая, а общее количество
+новостей (COUNT) не считается, если его явно не запросили.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    """Некорректный курсор в запросе"""
+
+
+def encode_cursor(obj, direction, field='pub_date'):
+    """Курсор для перехода от объекта вперед ('next') или назад ('prev') по полю даты или числовому полю"""
+    value = getattr(obj, field)
+    data = {'d': direction, 'p': value.isoformat() if hasattr(value, 'isoformat') else value, 'i': obj.pk}
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Разбирает курсор. Возвращает (направление, значение поля, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = data['p'] if isinstance(data['p'], int) else parse_datetime(data['p'])
+        if data['d'] not in ('next', 'prev') or value is None:
+            raise ValueError
+        return data['d'], value, int(data['i'])
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+
+
+class KeysetPage:
+    """Страница курсорной пагинации"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по ключу (значение поля, id) для списков, отсортированных от новых к старым
+    (или по возрастанию при descending=False).
+    Общее количество объектов считается только при обращении к count.
+    Атрибуты:
+    - field: Поле, по которому сортируется список (pub_date для новостей, created_at для комментариев,
+      views для поиска без запроса).
+    """
+
+    def __init__(self, queryset, per_page, field='pub_date', descending=True):
+        self.field = field
+        self.descending = descending
+        prefix = '-' if descending else ''
+        self.queryset = queryset.order_by(f'{prefix}{field}', f'{prefix}id')
+        self.per_page = per_page
+
+    @cached_property
+    def count(self):
+        return self.queryset.count()
+
+    def page(self, cursor=None):
+        """Возвращает страницу после (или перед) новостью из курсора"""
+        if not cursor:
+            items = list(self.queryset[:self.per_page + 1])
+            has_more, has_before = len(items) > self.per_page, False
+            items = items[:self.per_page]
+        else:
+            direction, value, pk = decode_cursor(cursor)
+            field = self.field
+            after, before = ('lt', 'gt') if self.descending else ('gt', 'lt')
+            if direction == 'next':
+                following = Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'id__{after}': pk})
+                items = list(self.queryset.filter(following)[:self.per_page + 1])
+                has_more, has_before = len(items) > self.per_page, True
+                items = items[:self.per_page]
+            else:
+                preceding = Q(**{f'{field}__{before}': value}) | Q(**{field: value, f'id__{before}': pk})
+                items = list(self.queryset.filter(preceding).reverse()[:self.per_page + 1])
+                has_before, has_more = len(items) > self.per_page, True
+                items = items[:self.per_page][::-1]
+
+        return KeysetPage(
+            items,
+            next_cursor=encode_cursor(items[-1], 'next', self.field) if items and has_more else None,
+            previous_cursor=encode_cursor(items[0], 'prev', self.field) if items and has_before else None,
+        )
+
+
+class KeysetPaginationMixin:
+    """
+    Примесь для ListView, включающая курсорную пагинацию.
+    Включается для всех списков настройкой NEWS_CURSOR_PAGINATION или для отдельного запроса
+    параметром cursor (пустое значение - первая страница). Общее количество новостей
+    передается в контекст только при параметре count=1.
+    """
+
+    def use_cursor_pagination(self):
+        return 'cursor' in self.request.GET or getattr(settings, 'NEWS_CURSOR_PAGINATION', False)
+
+    def count_requested(self):
+        """Нужно ли считать общее количество новостей"""
+        return not self.use_cursor_pagination() or self.request.GET.get('count') == '1'
+
+    def get_total_count(self):
+        """Заранее известное общее количество объектов (например, из счетчиков). None - считать запросом COUNT"""
+        return None
+
+    def get_keyset_ordering(self):
+        """Поле сортировки курсорной пагинации и порядок (по убыванию или нет)"""
+        return 'pub_date', True
+
+    def get_paginator(self, queryset, per_page, *args, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, *args, **kwargs)
+        self._set_known_count(paginator)
+        return paginator
+
+    def _set_known_count(self, paginator):
+        count = self.get_total_count()
+        if count is not None:
+            paginator.count = count  # Заменяет cached_property count, запрос COUNT не выполняется
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size, *self.get_keyset_ordering())
+        self._set_known_count(paginator)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Некорректный курсор страницы')
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cursor_pagination'] = self.use_cursor_pagination()
+        if context['cursor_pagination']:
+            params = self.request.GET.copy()
+            params.pop('cursor', None)
+            params.pop('page', None)
+            context['cursor_query'] = params.urlencode()
+        return context
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор списков админки для больших таблиц (включается настройкой ADMIN_ESTIMATED_COUNT).
+    Количество строк списка без фильтров оценивается (см. news.db.estimate_count), поэтому
+    число страниц приблизительное, зато открытие списка не читает таблицу целиком.
+    """
+
+    @cached_property
+    def count(self):
+        from .db import estimate_count
+
+        estimate = estimate_count(self.object_list)
+        return estimate if estimate is not None else super().count
+
@@ -0,0 +1,86 @@
+"""
+Публикация запланированных новостей и архивирование старых (команда run_publisher).
+Ближайшая новость к публикации и самая старая опубликованная находятся по индексу (status, pub_date),
+поэтому обработчик спит до ближайшего срока, а не просматривает таблицу по расписанию.
+Новости меняют статус пачками: один UPDATE на пачку, после него один сигнал news_bulk_updated
+(кэши, статистика тегов и авторов) и одна запись уведомлений в очередь Telegram.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import News
+from .notifications import queue_news_notifications
+from .signals import news_bulk_updated
+
+logger = logging.getLogger(__name__)
+
+PUBLISHED_HEADER = '*Опубликована новость!*'
+
+
+def archive_before(now=None):
+    """Дата, раньше которой опубликованные новости переносятся в архив (None - архивирование отключено)"""
+    days = settings.NEWS_ARCHIVE_AFTER_DAYS
+    if not days:
+        return None
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def change_status(from_status, to_status, pub_date_before, batch_size):
+    """
+    Переводит одну пачку новостей со сроком pub_date_before и раньше из статуса from_status в to_status.
+    Возвращает список ID измененных новостей.
+    """
+    with transaction.atomic():
+        news_ids = list(
+            News.objects.filter(status=from_status, pub_date__lte=pub_date_before)
+            .order_by('pub_date', 'id').values_list('id', flat=True)[:batch_size]
+        )
+        if not news_ids:
+            return []
+        # Условие по статусу повторяется: новость могли изменить в админке между выборкой и обновлением
+        News.objects.filter(id__in=news_ids, status=from_status).update(status=to_status, updated_at=timezone.now())
+        if to_status == 'published':
+            queue_news_notifications(
+                News.objects.filter(id__in=news_ids, status=to_status).select_related('author'), PUBLISHED_HEADER,
+            )
+    news_bulk_updated.send(sender=News, news_ids=news_ids, fields=['status', 'updated_at'])
+    return news_ids
+
+
+def run_once(batch_size=100, now=None):
+    """Публикует все наступившие запланированные новости и архивирует старые. Возвращает количество новостей"""
+    now = now or timezone.now()
+    total = 0
+    while news_ids := change_status('scheduled', 'published', now, batch_size):
+        total += len(news_ids)
+        logger.info(f'Опубликовано новостей: {len(news_ids)}')
+    before = archive_before(now)
+    if before is not None:
+        while news_ids := change_status('published', 'archived', before, batch_size):
+            total += len(news_ids)
+            logger.info(f'Перенесено в архив новостей: {len(news_ids)}')
+    return total
+
+
+def next_due(now=None):
+    """Ближайший срок публикации или архивирования (None - ждать нечего)"""
+    due = list(
+        News.objects.filter(status='scheduled').order_by('pub_date', 'id').values_list('pub_date', flat=True)[:1]
+    )
+    if archive_before(now) is not None:
+        oldest = News.objects.filter(status='published').order_by('pub_date', 'id').values_list('pub_date', flat=True)[:1]
+        due += [pub_date + timedelta(days=settings.NEWS_ARCHIVE_AFTER_DAYS) for pub_date in oldest]
+    return min(due) if due else None
+
+
+def next_due_in(max_sleep, now=None):
+    """Сколько секунд спать до ближайшего срока, но не больше max_sleep (чтобы заметить новые запланированные новости)"""
+    now = now or timezone.now()
+    due = next_due(now)
+    if due is None:
+        return max_sleep
+    return max(0.0, min(max_sleep, (due - now).total_seconds()))
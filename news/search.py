@@ -0,0 +1,334 @@
+"""
+Полнотекстовый поиск по новостям.
+Для SQLite используется виртуальная таблица FTS5 (news_search), в которой хранятся основы слов
+заголовка и текста новости. Основы слов получаются стеммером для русского языка (алгоритм Snowball),
+поэтому запрос "новости" находит и "новость", и "новостями".
+Индекс обновляется сигналами при сохранении и удалении новостей (см. news.signals)
+и может быть полностью перестроен командой rebuild_search_index.
+"""
+import hashlib
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'news_search'
+TITLE_WEIGHT = 10.0  # Совпадение в заголовке важнее совпадения в тексте
+BODY_WEIGHT = 1.0
+
+SEARCH_SORT_FIELDS = ('pub_date', 'views', 'relevance')  # Допустимые поля сортировки результатов поиска
+CACHE_GENERATION_KEY = 'news:search:generation'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+CYRILLIC_RE = re.compile('[а-я]')
+
+VOWELS = 'аеиоуыэюя'
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+ADJECTIVE = (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = ('ся', 'сь')
+VERB = (
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+     'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'),
+)
+NOUN = (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+    'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+)
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+
+def _suffix_table(groups):
+    """
+    Окончания группы для _strip_suffix: [(длина, {окончание: допустимо ли без "а"/"я" перед ним})]
+    от самых длинных к самым коротким. Строится один раз при загрузке модуля.
+    """
+    if isinstance(groups[0], str):
+        groups = ((), groups)
+    first, second = groups
+    by_length = {}
+    for suffix in first:
+        by_length.setdefault(len(suffix), {})[suffix] = False
+    for suffix in second:
+        by_length.setdefault(len(suffix), {})[suffix] = True
+    return sorted(by_length.items(), reverse=True)
+
+
+def _strip_suffix(word, table):
+    """
+    Отрезает самое длинное окончание из таблицы окончаний (см. _suffix_table).
+    Окончания первой группы (если групп две) допустимы только после "а" или "я".
+    Возвращает слово без окончания или None, если окончание не найдено.
+    """
+    for length, suffixes in table:
+        anywhere = suffixes.get(word[-length:])
+        if anywhere is None:
+            continue
+        base = word[:-length]
+        if anywhere or (base and base[-1] in 'ая'):
+            return base
+        return None
+    return None
+
+
+PERFECTIVE_GERUND_TABLE = _suffix_table(PERFECTIVE_GERUND)
+ADJECTIVE_TABLE = _suffix_table(ADJECTIVE)
+PARTICIPLE_TABLE = _suffix_table(PARTICIPLE)
+REFLEXIVE_TABLE = _suffix_table(REFLEXIVE)
+VERB_TABLE = _suffix_table(VERB)
+NOUN_TABLE = _suffix_table(NOUN)
+
+
+def _regions(word):
+    """Возвращает начало областей RV и R2 алгоритма Snowball"""
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in VOWELS and word[i - 1] in VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = next_region(0)
+    return rv, next_region(r1)
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """
+    Стеммер Snowball для русского языка. Слова на других языках возвращаются в нижнем регистре.
+    Основы частых слов кэшируются: при индексации слова повторяются из новости в новость.
+    """
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC_RE.search(word):
+        return word
+
+    rv_start, r2_start = _regions(word)
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастие, иначе возвратная частица и прилагательное/глагол/существительное
+    result = _strip_suffix(rv, PERFECTIVE_GERUND_TABLE)
+    if result is None:
+        reflexive = _strip_suffix(rv, REFLEXIVE_TABLE)
+        rv = reflexive if reflexive is not None else rv
+        result = _strip_suffix(rv, ADJECTIVE_TABLE)
+        if result is not None:
+            participle = _strip_suffix(result, PARTICIPLE_TABLE)
+            result = participle if participle is not None else result
+        else:
+            result = _strip_suffix(rv, VERB_TABLE)
+            if result is None:
+                result = _strip_suffix(rv, NOUN_TABLE)
+    rv = result if result is not None else rv
+
+    # Шаг 2: окончание "и"
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательный суффикс в области R2
+    for suffix in DERIVATIONAL:
+        if rv.endswith(suffix) and len(prefix) + len(rv) - len(suffix) >= r2_start:
+            rv = rv[:-len(suffix)]
+            break
+
+    # Шаг 4: превосходная степень, двойное "н" и мягкий знак
+    for suffix in SUPERLATIVE:
+        if rv.endswith(suffix):
+            rv = rv[:-len(suffix)]
+            break
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    elif rv.endswith('ь'):
+        rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text):
+    """Разбивает текст на слова и приводит их к основам"""
+    return [stem(word) for word in WORD_RE.findall(text or '')]
+
+
+def build_match_query(query):
+    """Строит выражение MATCH для FTS5: все основы слов запроса должны встретиться в новости"""
+    return ' '.join(f'"{token}"' for token in dict.fromkeys(tokenize(query)))
+
+
+def is_available():
+    """Индекс FTS5 доступен только для SQLite"""
+    return connection.vendor == 'sqlite'
+
+
+def create_index(schema_editor=None):
+    """Создает таблицу полнотекстового индекса"""
+    cursor_owner = schema_editor.connection if schema_editor else connection
+    with cursor_owner.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(title, body, tokenize='unicode61')"
+        )
+
+
+def drop_index(schema_editor=None):
+    """Удаляет таблицу полнотекстового индекса"""
+    cursor_owner = schema_editor.connection if schema_editor else connection
+    with cursor_owner.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def _document(news):
+    """Строка индекса для новости: основы слов заголовка и текста"""
+    return (
+        news.pk,
+        ' '.join(tokenize(news.title)),
+        ' '.join(tokenize(f'{news.brief}\n{news.content}')),
+    )
+
+
+def index_news(news_list):
+    """Добавляет или обновляет новости в индексе"""
+    if not is_available():
+        return
+    rows = [_document(news) for news in news_list]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, title, body) VALUES (%s, %s, %s)', rows)
+
+
+def remove_news(news_ids):
+    """Удаляет новости из индекса"""
+    if not is_available() or not news_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(news_id,) for news_id in news_ids])
+
+
+def clear_index():
+    """Очищает индекс"""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+
+def search_queryset(queryset, query, rank=False):
+    """
+    Фильтрует новости по поисковому запросу. Таблица индекса присоединяется к новостям один раз
+    (news_search.rowid = news.id), а релевантность (search_rank, меньше - лучше) выбирается из этого
+    соединения только при rank=True, то есть когда результаты сортируются по релевантности.
+    Если индекс недоступен, используется поиск по вхождению слов в заголовок и текст.
+    """
+    if not is_available():
+        condition = Q()
+        for word in WORD_RE.findall(query or ''):
+            condition &= Q(title__icontains=word) | Q(brief__icontains=word) | Q(content__icontains=word)
+        return queryset.filter(condition)
+
+    match = build_match_query(query)
+    if not match:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    queryset = queryset.extra(
+        tables=[SEARCH_TABLE],
+        where=[f'{SEARCH_TABLE}.rowid = {table}.id', f'{SEARCH_TABLE} MATCH %s'],
+        params=[match],
+    )
+    if rank:
+        queryset = queryset.extra(
+            select={'search_rank': f'bm25({SEARCH_TABLE}, %s, %s)'}, select_params=[TITLE_WEIGHT, BODY_WEIGHT],
+        )
+    return queryset
+
+
+def search_ids(query):
+    """
+    Подзапрос ID новостей, подходящих под поисковый запрос, для условий вида news__in.
+    В подзапросе таблицы новостей получают псевдонимы, поэтому индекс здесь не присоединяется к новостям,
+    а ID выбираются из него напрямую.
+    """
+    from .models import News
+
+    if not is_available():
+        return News.objects.search(query).values('pk')
+    match = build_match_query(query)
+    if not match:
+        return News.objects.none().values('pk')
+    return RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match])
+
+
+def order_results(news_list, sort_by, order):
+    """
+    Сортирует результаты поиска по указанному полю.
+    Сортировка 'relevance' доступна только при поиске по индексу: по убыванию - сначала самые релевантные.
+    """
+    if sort_by == 'relevance':
+        if 'search_rank' not in news_list.query.extra:
+            sort_by = 'pub_date'
+        else:
+            # bm25 возвращает тем меньшее значение, чем релевантнее новость
+            return news_list.order_by('search_rank' if order == 'desc' else '-search_rank', '-pub_date')
+    if order == 'desc':
+        sort_by = f'-{sort_by}'
+    return news_list.order_by(sort_by)
+
+
+def _cache_generation():
+    """Текущее поколение кэша поиска. Смена поколения делает недействительными все сохраненные результаты"""
+    return cache.get_or_set(CACHE_GENERATION_KEY, 1, None)
+
+
+def _next_generation():
+    try:
+        cache.incr(CACHE_GENERATION_KEY)
+    except ValueError:
+        cache.set(CACHE_GENERATION_KEY, 1, None)
+
+
+def invalidate_cache():
+    """
+    Сбрасывает кэш результатов поиска (вызывается при изменении новостей) после фиксации транзакции,
+    чтобы параллельный запрос не сохранил в новом поколении результаты по еще не измененным данным.
+    """
+    transaction.on_commit(_next_generation)
+
+
+def cached_search_ids(status, query, sort_by, order):
+    """
+    Возвращает упорядоченный список ID новостей с указанным статусом, подходящих под запрос.
+    Список хранится в кэше, поэтому количество результатов и любая страница выдачи
+    не требуют повторного поиска по индексу.
+    """
+    from .models import News
+
+    params = '\x00'.join([status, query, sort_by, order])
+    key = f'news:search:{_cache_generation()}:{hashlib.md5(params.encode()).hexdigest()}'
+    ids = cache.get(key)
+    if ids is None:
+        news_list = News.objects.filter(status=status)
+        if query:
+            news_list = news_list.search(query, rank=sort_by == 'relevance')
+        ids = list(order_results(news_list, sort_by, order).values_list('id', flat=True))
+        cache.set(key, ids, getattr(settings, 'NEWS_SEARCH_CACHE_TIMEOUT', 300))
+    return ids
+
+
+def fetch_news(ids):
+    """Загружает новости по списку ID одним запросом, сохраняя порядок списка"""
+    from .models import News
+
+    news_by_id = News.objects.filter(id__in=ids).for_cards().in_bulk()
+    return [news_by_id[news_id] for news_id in ids if news_id in news_by_id]
@@ -1,38 +1,287 @@
-import asyncio
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver, Signal
 
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.contrib.auth.models import User
 
-from news_blog.settings import TELEGRAM_BOT_TOKEN, YOUR_PERSONAL_CHAT_ID
-from news.models import News
-from .telegram_bot import send_telegram_message
+from news.models import News, Tag, Comment
+from .notifications import queue_news_notification
+from . import search, cards, tag_stats, author_stats, feeds
+
+# Поля новости, которые попадают в полнотекстовый индекс
+SEARCH_FIELDS = {'title', 'brief', 'content'}
+
+# Поля новости, от которых зависит статистика тегов
+TAG_STATS_FIELDS = {'status', 'pub_date'}
+
+# Поля новости, от которых зависит статистика авторов
+AUTHOR_STATS_FIELDS = {'status', 'pub_date', 'author', 'views'}
+
+# Сигнал о массовом изменении новостей через queryset.update(), при котором post_save не отправляется.
+# Аргументы: news_ids - список ID измененных новостей, fields - список измененных полей,
+# amounts - для записи просмотров (fields=['views']) прирост просмотров по ID новостей.
+news_bulk_updated = Signal()
+
+# Сигнал о массовом изменении лайков запросами к промежуточной таблице, при котором m2m_changed не отправляется.
+# Отправитель - News или Comment. Аргументы: object_ids - ID объектов, user_ids - ID пользователей, чьи лайки изменились.
+likes_bulk_changed = Signal()
 
 
 @receiver(post_save, sender=News)
 def send_telegram_notification(sender, instance, created, **kwargs):
     if created and not instance.notified and instance.status == 'draft':
+        # Записываем уведомление в очередь. Отправляет его в Telegram фоновый процесс (команда run_telegram_worker),
+        # он же устанавливает флаг notified после отправки
+        queue_news_notification(instance)
+
+
+@receiver(post_save, sender=News)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    # Переиндексируем новость, только если изменились поля, по которым идет поиск
+    if update_fields and not SEARCH_FIELDS & set(update_fields):
+        return
+    search.index_news([instance])
+
+
+@receiver(post_delete, sender=News)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_news([instance.pk])
+
+
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+@receiver(news_bulk_updated, sender=News)
+def invalidate_search_cache(sender, fields=None, **kwargs):
+    # Любое изменение новостей может изменить результаты поиска.
+    # Исключение - запись накопленных просмотров: она происходит постоянно, а сортировка по просмотрам
+    # может отставать на время жизни кэша поиска
+    if fields is not None and set(fields) == {'views'}:
+        return
+    search.invalidate_cache()
+
+
+def _m2m_news_ids(sender, instance, action, reverse, pk_set, column='news_id'):
+    """
+    ID новостей, затронутых изменением связи многие-ко-многим (теги или лайки новости).
+    Для лайков комментария column='comment_id' - тогда возвращаются ID комментариев.
+    """
+    if not reverse:
+        return [instance.pk]
+    if pk_set is not None:
+        return list(pk_set)
+    # Очистка связи со стороны тега или пользователя (pre_clear): ищем новости в промежуточной таблице
+    for field in sender._meta.get_fields():
+        if field.is_relation and field.related_model is type(instance):
+            return list(sender.objects.filter(**{field.name: instance}).values_list(column, flat=True))
+    return []
+
+
+def _m2m_changed(action, reverse):
+    """Изменилась ли связь. Очистка со стороны тега или пользователя обрабатывается до нее (pre_clear): после нее затронутые новости уже не найти"""
+    return action in ('post_add', 'post_remove') or (action == 'post_clear' and not reverse) or (action == 'pre_clear' and reverse)
+
+
+@receiver(post_save, sender=News)
+def invalidate_news_card(sender, instance, **kwargs):
+    cards.invalidate_cards([instance.pk])
+
+
+@receiver(m2m_changed, sender=News.tags.through)
+@receiver(m2m_changed, sender=News.likes.through)
+def invalidate_news_cards_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    # Теги и количество лайков показываются на карточке и странице новости,
+    # поэтому меняется и дата изменения, по которой проверяются условные запросы
+    if _m2m_changed(action, reverse):
+        news_ids = _m2m_news_ids(sender, instance, action, reverse, pk_set)
+        cards.invalidate_cards(news_ids)
+        News.objects.filter(pk__in=news_ids).touch()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def invalidate_tag_news_cards(sender, instance, **kwargs):
+    # Название и URL тега показываются на карточках и страницах всех новостей с этим тегом
+    news_ids = list(News.objects.filter(tags=instance).values_list('id', flat=True))
+    cards.invalidate_cards(news_ids)
+    News.objects.filter(pk__in=news_ids).touch()
+
+
+@receiver(news_bulk_updated, sender=News)
+def invalidate_bulk_news_cards(sender, news_ids, fields=None, **kwargs):
+    # Просмотры подставляются в карточку при выводе, их запись карточки не сбрасывает
+    if fields is not None and set(fields) == {'views'}:
+        return
+    cards.invalidate_cards(news_ids)
+
+
+@receiver(pre_save, sender=News)
+def remember_tag_stats_row(sender, instance, update_fields=None, **kwargs):
+    # Прежние статус и дата читаются из базы: загруженная новость могла устареть, пока ее меняли в другом месте
+    if update_fields and not TAG_STATS_FIELDS & set(update_fields):
+        return
+    instance._tag_stats_row = tag_stats.news_row(instance.pk) if instance.pk is not None else None
+
+
+@receiver(post_save, sender=News)
+def update_tag_stats(sender, instance, created, update_fields=None, **kwargs):
+    # У только что созданной новости еще нет тегов, они добавляются позже (m2m_changed)
+    if created or (update_fields and not TAG_STATS_FIELDS & set(update_fields)):
+        return
+    row = getattr(instance, '_tag_stats_row', None)
+    if row is None:
+        # Прежние статус и дата неизвестны - пересчитываем теги новости
+        tag_stats.refresh_tag_stats(tag_stats.news_tag_ids([instance.pk]))
+    else:
+        tag_stats.move_news(instance, *row)
+
+
+@receiver(pre_delete, sender=News)
+def remember_news_tags(sender, instance, **kwargs):
+    # После удаления новости ее связи с тегами уже удалены, поэтому запоминаем их заранее
+    instance._tag_links = tag_stats.news_links([instance.pk])
+
+
+@receiver(post_delete, sender=News)
+def update_tag_stats_on_delete(sender, instance, **kwargs):
+    tag_stats.remove_links(getattr(instance, '_tag_links', []))
+
+
+@receiver(m2m_changed, sender=News.tags.through)
+def update_tag_stats_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    # В post_add pk_set содержит только действительно добавленные связи, а в pre_remove - любые переданные ID,
+    # поэтому удаляемые связи запоминаем по промежуточной таблице
+    if action == 'post_add':
+        if reverse:
+            tag_stats.add_links(tag_stats.news_links(pk_set, [instance.pk]))
+        else:
+            tag_stats.add_links(tag_stats.news_links([instance.pk], pk_set))
+    elif action in ('pre_remove', 'pre_clear'):
+        if reverse:
+            news_ids = pk_set if action == 'pre_remove' else instance.news_set.values_list('id', flat=True)
+            instance._tag_links = tag_stats.news_links(list(news_ids), [instance.pk])
+        else:
+            instance._tag_links = tag_stats.news_links([instance.pk], pk_set if action == 'pre_remove' else None)
+    elif action in ('post_remove', 'post_clear'):
+        tag_stats.remove_links(getattr(instance, '_tag_links', []))
+        instance._tag_links = []
+
+
+@receiver(news_bulk_updated, sender=News)
+def update_bulk_tag_stats(sender, news_ids, fields=None, **kwargs):
+    # Массовая смена статуса из админки, загрузка данных и т.п.: прежние статусы неизвестны,
+    # поэтому статистика затронутых тегов пересчитывается
+    if fields is not None and not TAG_STATS_FIELDS & set(fields):
+        return
+    tag_stats.refresh_tag_stats(tag_stats.news_tag_ids(news_ids))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_cloud(sender, **kwargs):
+    # В облаке тегов показываются название и URL тега
+    tag_stats.invalidate_cloud()
+
+
+@receiver(pre_save, sender=News)
+def remember_author_stats_row(sender, instance, update_fields=None, **kwargs):
+    # Прежние автор, статус, дата и просмотры читаются из базы: просмотры в загруженной новости могли устареть
+    if update_fields and not AUTHOR_STATS_FIELDS & set(update_fields):
+        return
+    instance._author_stats_row = author_stats.news_row(instance.pk) if instance.pk is not None else None
+
+
+@receiver(post_save, sender=News)
+def update_author_stats(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not AUTHOR_STATS_FIELDS & set(update_fields):
+        return
+    author_stats.news_saved(instance, getattr(instance, '_author_stats_row', None), update_fields)
+
+
+@receiver(pre_delete, sender=News)
+def remember_deleted_author_stats_row(sender, instance, **kwargs):
+    # Лайки удаляются вместе с новостью без m2m_changed, поэтому запоминаем их количество заранее
+    instance._author_stats_row = author_stats.news_row(instance.pk)
+    instance._likes_count = News.likes.through.objects.filter(news_id=instance.pk).count()
+
+
+@receiver(post_delete, sender=News)
+def update_author_stats_on_delete(sender, instance, **kwargs):
+    author_stats.news_deleted(getattr(instance, '_author_stats_row', None), getattr(instance, '_likes_count', 0))
+
+
+@receiver(m2m_changed, sender=News.likes.through)
+def update_author_stats_on_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    # Лайки прибавляются и вычитаются без пересчета всех новостей автора
+    if action == 'post_add':
+        author_stats.add_likes(list(pk_set) if reverse else [instance.pk] * len(pk_set), 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        # Запоминаем только существующие лайки: в pk_set могут быть ID, которых нет в промежуточной таблице
+        rows = sender.objects.filter(**{'user_id' if reverse else 'news_id': instance.pk})
+        if action == 'pre_remove':
+            rows = rows.filter(**{'news_id__in' if reverse else 'user_id__in': pk_set})
+        instance._unliked_news_ids = list(rows.values_list('news_id', flat=True))
+    elif action in ('post_remove', 'post_clear'):
+        author_stats.add_likes(getattr(instance, '_unliked_news_ids', []), -1)
+        instance._unliked_news_ids = []
+
+
+@receiver(likes_bulk_changed, sender=News)
+def update_news_on_bulk_likes(sender, object_ids, **kwargs):
+    # Количество лайков показывается на карточке новости и входит в статистику автора
+    cards.invalidate_cards(object_ids)
+    News.objects.filter(pk__in=object_ids).touch()
+    author_stats.refresh_author_stats(author_stats.news_author_ids(object_ids))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def touch_news_on_comment(sender, instance, **kwargs):
+    # Комментарии показываются на странице новости
+    News.objects.filter(pk=instance.news_id).touch()
+
+
+@receiver(m2m_changed, sender=Comment.likes.through)
+def touch_news_on_comment_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    # Количество лайков комментария показывается на странице новости
+    if _m2m_changed(action, reverse):
+        comment_ids = _m2m_news_ids(sender, instance, action, reverse, pk_set, column='comment_id')
+        News.objects.filter(comments__in=comment_ids).touch()
+
+
+@receiver(likes_bulk_changed, sender=Comment)
+def touch_news_on_bulk_comment_likes(sender, object_ids, **kwargs):
+    News.objects.filter(comments__in=object_ids).touch()
+
+
+@receiver(news_bulk_updated, sender=News)
+def update_bulk_author_stats(sender, news_ids, fields=None, amounts=None, **kwargs):
+    if fields is not None and set(fields) == {'views'} and amounts is not None:
+        author_stats.add_views(amounts)
+        return
+    if fields is not None and not AUTHOR_STATS_FIELDS & set(fields):
+        return
+    author_stats.refresh_author_stats(author_stats.news_author_ids(news_ids))
+
+
+@receiver(post_delete, sender=User)
+def update_default_author_stats(sender, instance, **kwargs):
+    # Новости удаленного пользователя переходят автору по умолчанию (on_delete=SET_DEFAULT) без сигналов
+    author_stats.refresh_author_stats([News._meta.get_field('author').get_default()])
+
+
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+@receiver(news_bulk_updated, sender=News)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_feeds(sender, fields=None, **kwargs):
+    # Просмотры в ленты не попадают
+    if fields is not None and set(fields) == {'views'}:
+        return
+    feeds.invalidate_feeds()
+
 
-        # Форматирование даты публикации
-        pub_date_formatted = instance.pub_date.strftime('%d.%m.%Y %H:%M')
-        
-        # Ограничение длины текста новости
-        content_truncated = (instance.content[:100] + '...') if len(instance.content) > 100 else instance.content
-
-        # Формируем сообщение с полной информацией о новости
-        message_template = (
-            f"Заголовок: {instance.title}\n"
-            f"Краткое описание: {instance.brief}\n"
-            f"Текст новости: {content_truncated}\n"
-            f"Дата публикации: {pub_date_formatted}\n"
-            f"Изображение: {'Да' if instance.image else 'Нет'}\n"
-            f"Автор: {instance.author.username}"
-        )
-        
-        message = '*Новая новость!*\n' + message_template
-
-        # Отправляем уведомление в Telegram
-        asyncio.run(send_telegram_message(TELEGRAM_BOT_TOKEN, YOUR_PERSONAL_CHAT_ID, message))
-        
-        # Устанавливаем флаг notified в True после отправки уведомления
-        instance.notified = True
-        instance.save(update_fields=['notified'])
\ No newline at end of file
+@receiver(m2m_changed, sender=News.tags.through)
+def invalidate_feeds_on_tags(sender, action, **kwargs):
+    # Теги показываются в ленте как категории новостей, а ленты тегов состоят из новостей с тегом
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        feeds.invalidate_feeds()
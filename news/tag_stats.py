@@ -0,0 +1,172 @@
+"""
+Материализованная статистика тегов (модель TagStats) и облако тегов.
+При изменении новостей и их тегов (см. news.signals) количество прибавляется и вычитается без пересчета,
+дата последней новости пересчитывается, только если удаленная или измененная новость была последней.
+Полный пересчет выполняет команда rebuild_tag_stats.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import Greatest
+
+from .models import News, TagStats
+
+CLOUD_CACHE_KEY = 'news:tag_cloud'
+CLOUD_WEIGHTS = 5  # Количество размеров шрифта в облаке тегов
+
+
+def news_tag_ids(news_ids):
+    """ID тегов новостей"""
+    if not news_ids:
+        return []
+    return list(
+        News.tags.through.objects.filter(news_id__in=news_ids).values_list('tag_id', flat=True).distinct()
+    )
+
+
+def news_row(pk):
+    """Статус и дата публикации новости в базе (None, если новости еще нет)"""
+    return News.objects.filter(pk=pk).values_list('status', 'pub_date').first()
+
+
+def news_links(news_ids, tag_ids=None):
+    """Связи новостей с тегами: список (ID тега, статус новости, дата публикации новости)"""
+    if not news_ids:
+        return []
+    rows = News.tags.through.objects.filter(news_id__in=news_ids)
+    if tag_ids is not None:
+        rows = rows.filter(tag_id__in=tag_ids)
+    return list(rows.values_list('tag_id', 'news__status', 'news__pub_date'))
+
+
+def _aggregate(tag_ids=None, status=None):
+    """Количество новостей и дата последней новости по тегам и статусам (по индексу промежуточной таблицы)"""
+    rows = News.tags.through.objects.all()
+    if tag_ids is not None:
+        rows = rows.filter(tag_id__in=tag_ids)
+    if status is not None:
+        rows = rows.filter(news__status=status)
+    rows = rows.values('tag_id', 'news__status').annotate(
+        news_count=Count('news_id'), last_pub_date=Max('news__pub_date'),
+    ).order_by()
+    return [
+        TagStats(tag_id=row['tag_id'], status=row['news__status'], count=row['news_count'], last_pub_date=row['last_pub_date'])
+        for row in rows
+    ]
+
+
+def invalidate_cloud():
+    cache.delete(CLOUD_CACHE_KEY)
+
+
+def refresh_tag_stats(tag_ids):
+    """Пересчитывает статистику указанных тегов"""
+    tag_ids = set(tag_ids)
+    if not tag_ids:
+        return
+    with transaction.atomic():
+        TagStats.objects.filter(tag_id__in=tag_ids).delete()
+        TagStats.objects.bulk_create(_aggregate(tag_ids))
+    invalidate_cloud()
+
+
+def _group(links):
+    """Связи (ID тега, статус, дата публикации), сгруппированные по (ID тега, статус): [количество, последняя дата]"""
+    groups = defaultdict(lambda: [0, None])
+    for tag_id, status, pub_date in links:
+        group = groups[tag_id, status]
+        group[0] += 1
+        if group[1] is None or pub_date > group[1]:
+            group[1] = pub_date
+    return groups
+
+
+def add_links(links):
+    """Учитывает новые связи новостей с тегами: прибавляет количество и сдвигает дату последней новости"""
+    if not links:
+        return
+    with transaction.atomic():
+        for (tag_id, status), (count, pub_date) in _group(links).items():
+            rows = TagStats.objects.filter(tag_id=tag_id, status=status)
+            if not rows.update(count=F('count') + count):
+                TagStats.objects.create(tag_id=tag_id, status=status, count=count, last_pub_date=pub_date)
+            else:
+                rows.filter(last_pub_date__lt=pub_date).update(last_pub_date=pub_date)
+    invalidate_cloud()
+
+
+def remove_links(links):
+    """
+    Вычитает удаленные связи новостей с тегами. Вызывается, когда связей уже нет в базе:
+    дата последней новости пересчитывается только для тегов, у которых последней была одна из удаленных новостей.
+    """
+    if not links:
+        return
+    with transaction.atomic():
+        for (tag_id, status), (count, pub_date) in _group(links).items():
+            rows = TagStats.objects.filter(tag_id=tag_id, status=status)
+            rows.update(count=Greatest(F('count') - count, 0))
+            rows.filter(count=0).delete()
+            if rows.filter(last_pub_date__lte=pub_date).exists():
+                latest = _aggregate([tag_id], status)
+                rows.update(last_pub_date=latest[0].last_pub_date if latest else None)
+    invalidate_cloud()
+
+
+def move_news(news, status, pub_date):
+    """Переносит новость в статистике тегов из прежних статуса и даты публикации в текущие"""
+    if (status, pub_date) == (news.status, news.pub_date):
+        return
+    tag_ids = news_tag_ids([news.pk])
+    with transaction.atomic():
+        remove_links([(tag_id, status, pub_date) for tag_id in tag_ids])
+        add_links([(tag_id, news.status, news.pub_date) for tag_id in tag_ids])
+
+
+def rebuild_tag_stats():
+    """Полностью пересчитывает статистику всех тегов. Возвращает количество строк до и после пересчета"""
+    with transaction.atomic():
+        before = {(stats.tag_id, stats.status): (stats.count, stats.last_pub_date) for stats in TagStats.objects.all()}
+        rows = _aggregate()
+        TagStats.objects.all().delete()
+        TagStats.objects.bulk_create(rows)
+    invalidate_cloud()
+    after = {(stats.tag_id, stats.status): (stats.count, stats.last_pub_date) for stats in rows}
+    changed = sum(1 for key in before.keys() | after.keys() if before.get(key) != after.get(key))
+    return len(rows), changed
+
+
+def tag_news_count(tag, status='published'):
+    """Количество новостей с тегом в указанном статусе"""
+    return TagStats.objects.filter(tag=tag, status=status).values_list('count', flat=True).first() or 0
+
+
+def tag_cloud():
+    """
+    Облако тегов: самые популярные теги среди проверенных новостей с весом от 1 до CLOUD_WEIGHTS.
+    Хранится в кэше и сбрасывается при пересчете статистики.
+    """
+    cloud = cache.get(CLOUD_CACHE_KEY)
+    if cloud is not None:
+        return cloud
+
+    stats = list(
+        TagStats.objects.filter(status='published', count__gt=0)
+        .select_related('tag').order_by('-count', 'tag_id')[:settings.NEWS_TAG_CLOUD_SIZE]
+    )
+    cloud = []
+    if stats:
+        smallest, largest = stats[-1].count, stats[0].count
+        spread = largest - smallest or 1
+        for item in sorted(stats, key=lambda item: item.tag.name):
+            cloud.append({
+                'name': item.tag.name,
+                'slug': item.tag.slug,
+                'count': item.count,
+                'weight': 1 + (item.count - smallest) * (CLOUD_WEIGHTS - 1) // spread,
+            })
+    cache.set(CLOUD_CACHE_KEY, cloud, settings.NEWS_TAG_CLOUD_CACHE_TIMEOUT)
+    return cloud
@@ -0,0 +1,64 @@
+from django import template
+from django.utils.html import format_html
+
+from news.cards import render_cards
+from news_blog.images import pick_variant
+
+register = template.Library()
+
+# Ширина, под которую подбирается миниатюра, и атрибут sizes для каждого места вывода изображения
+IMAGE_PLACES = {
+    'card': (400, '(min-width: 768px) 33vw, 100vw'),
+    'detail': (900, '(min-width: 992px) 900px, 100vw'),
+    'social': (1200, None),
+}
+
+
+@register.simple_tag
+def news_cards(news_list, archived=False):
+    """Выводит карточки новостей из кэша отрендеренных карточек"""
+    return render_cards(news_list, archived)
+
+
+def _srcset(news, fmt=None):
+    """Миниатюры всех размеров в формате srcset (fmt=None - исходный формат миниатюр)"""
+    variants = news.image_variants
+    return ', '.join(
+        f'{news.image.storage.url(pick_variant(variants, size, fmt))} {size}w'
+        for size in sorted(variants, key=int)
+    )
+
+
+@register.simple_tag
+def news_image(news, place='card', css_class=''):
+    """
+    Выводит изображение новости с миниатюрами: srcset в WebP и в исходном формате,
+    отложенная загрузка. Пока миниатюры не построены, выводится исходное изображение.
+    """
+    if not news.image:
+        return ''
+    width, sizes = IMAGE_PLACES[place]
+    fallback = _srcset(news)
+    if not fallback:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async">',
+            news.image.url, news.title, css_class,
+        )
+    img = format_html(
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async">',
+        news.get_image_url(width), fallback, sizes, news.title, css_class,
+    )
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">{}</picture>',
+        _srcset(news, 'webp'), sizes, img,
+    )
+
+
+@register.simple_tag(takes_context=True)
+def news_image_url(context, news, place='social'):
+    """Абсолютный URL миниатюры изображения новости (например, для превью в соцсетях)"""
+    url = news.get_image_url(IMAGE_PLACES[place][0])
+    if not url:
+        return ''
+    request = context.get('request')
+    return request.build_absolute_uri(url) if request else url
@@ -1,3 +1,1592 @@
-from django.test import TestCase
+import threading
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django import test
+from django.test import override_settings
+from django.urls import include, path
+
+from .counters import ViewCounter, views_counter
+from .models import News, Tag, Comment
+from .signals import news_bulk_updated
+
+
+def create_news(author, **kwargs):
+    """Создает опубликованную новость для тестов"""
+    kwargs.setdefault('title', 'Заголовок')
+    kwargs.setdefault('brief', 'Краткое описание')
+    kwargs.setdefault('content', 'Текст новости')
+    kwargs.setdefault('status', 'published')
+    return News.objects.create(author=author, **kwargs)
+
+
+class ViewsIsolationMixin:
+    """Просмотры, оставшиеся в общем буфере (например, после ошибки записи), не переходят в следующий тест"""
+
+    def run(self, result=None):
+        try:
+            return super().run(result)
+        finally:
+            views_counter.drain()
+
+
+# Просмотры в тестах записываются сразу при открытии страницы: фоновый поток общего буфера не запускается
+# и не пишет в базу между тестами
+@override_settings(NEWS_VIEWS_FLUSH_INTERVAL=0)
+class TestCase(ViewsIsolationMixin, test.TestCase):
+    pass
+
+
+@override_settings(NEWS_VIEWS_FLUSH_INTERVAL=0)
+class TransactionTestCase(ViewsIsolationMixin, test.TransactionTestCase):
+    pass
+
+
+class ViewCounterTest(TransactionTestCase):
+    """Тесты буфера просмотров"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='password')
+        self.news = create_news(self.author)
+        self.other = create_news(self.author)
+
+    def test_flush_writes_batched_increments(self):
+        counter = ViewCounter(interval=3600)
+        for _ in range(3):
+            counter.incr(self.news.pk)
+        counter.incr(self.other.pk)
+        self.assertEqual(counter.pending(), 4)
+        self.assertEqual(counter.flush(), 4)
+        self.assertEqual(counter.pending(), 0)
+        self.news.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.news.views, 3)
+        self.assertEqual(self.other.views, 1)
+
+    def test_concurrent_increments_are_not_lost(self):
+        counter = ViewCounter(interval=3600)
+        threads_count, hits = 8, 500
+        done = threading.Event()
+
+        def hit(news_id):
+            for _ in range(hits):
+                counter.incr(news_id)
+
+        def flusher():
+            # Сбрасываем буфер параллельно с просмотрами
+            while not done.is_set():
+                counter.flush()
+
+        flush_thread = threading.Thread(target=flusher)
+        flush_thread.start()
+        threads = [
+            threading.Thread(target=hit, args=(self.news.pk if i % 2 else self.other.pk,))
+            for i in range(threads_count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.set()
+        flush_thread.join()
+        counter.flush()
+
+        self.news.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.news.views + self.other.views, threads_count * hits)
+        self.assertEqual(self.news.views, threads_count // 2 * hits)
+
+
+class NewsDetailViewsTest(TestCase):
+    """Тесты счетчика просмотров на странице новости"""
+
+    def test_detail_page_counts_view(self):
+        author = User.objects.create_user('author', password='password')
+        news = create_news(author)
+        response = self.client.get(f'/{news.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['news'].views, 1)
+        news.refresh_from_db()
+        self.assertEqual(news.views, 1)
+
+
+class NewsListQueriesTest(TestCase):
+    """Количество запросов на страницу списка не зависит от количества новостей"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='password')
+        self.readers = [User.objects.create_user(f'reader{i}', password='password') for i in range(3)]
+        self.tag = Tag.objects.create(name='Политика')
+
+    def add_news(self, count, status='published'):
+        # Кэши сбрасываются после фиксации транзакции, как в обычном запросе
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                news = create_news(self.author, status=status)
+                news.tags.add(self.tag)
+                news.likes.add(*self.readers)
+
+    def count_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_listing_queries_are_constant(self):
+        urls = ['/', '/archived/', f'/tag/{self.tag.slug}/', '/search/?q=Текст', f'/users/author/{self.author.pk}/articles/']
+        self.add_news(1)
+        self.add_news(1, status='archived')
+        single = {url: self.count_queries(url) for url in urls}
+        self.add_news(9)
+        self.add_news(9, status='archived')
+        for url in urls:
+            self.assertEqual(self.count_queries(url), single[url], url)
+
+    def test_cards_show_annotated_likes(self):
+        self.add_news(2)
+        response = self.client.get('/')
+        self.assertEqual([news.total_likes() for news in response.context['news_list']], [3, 3])
+
+
+class SearchTest(TestCase):
+    """Тесты полнотекстового поиска"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='password')
+        self.economy = create_news(self.author, title='Новости экономики', content='Курс рубля вырос')
+        self.sport = create_news(self.author, title='Спорт', content='Экономические новости спорта')
+        self.archived = create_news(self.author, title='Экономика прошлого года', status='archived')
+
+    def test_stem(self):
+        from .search import stem
+        self.assertEqual(stem('новости'), stem('новостями'))
+        self.assertEqual(stem('экономики'), stem('экономика'))
+        for word, expected in [('красивая', 'красив'), ('читавшись', 'чита'), ('открывающиеся', 'открыва'),
+                               ('наилучшейше', 'наилучш'), ('Москва', 'москв')]:
+            self.assertEqual(stem(word), expected)
+
+    def test_search_uses_word_forms_and_ranks_title_higher(self):
+        found = list(News.objects.filter(status='published').search('новость', rank=True).order_by('search_rank'))
+        self.assertEqual(found, [self.economy, self.sport])
+
+    def test_index_is_joined_once(self):
+        from .search import order_results
+
+        news_list = News.objects.filter(status='published').search('новость')
+        sql = str(order_results(news_list, 'pub_date', 'desc').query)
+        self.assertEqual(sql.count('MATCH'), 1)
+        self.assertNotIn('bm25', sql)
+        sql = str(order_results(News.objects.search('новость', rank=True), 'relevance', 'desc').query)
+        self.assertEqual(sql.count('MATCH'), 1)
+        self.assertIn('bm25', sql)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.sport.title = 'Футбол'
+        self.sport.content = 'Матч'
+        self.sport.save()
+        self.assertFalse(News.objects.search('спорт').exists())
+        self.assertTrue(News.objects.search('футбола').exists())
+        self.economy.delete()
+        self.assertFalse(News.objects.search('рубль').exists())
+
+    def test_search_views(self):
+        response = self.client.get('/search/', {'q': 'экономики', 'sort_by': 'relevance'})
+        self.assertEqual(list(response.context['news_list']), [self.economy])
+        response = self.client.get('/search/archived/', {'q': 'экономика'})
+        self.assertEqual(list(response.context['news_list']), [self.archived])
+
+    def test_regex_is_not_evaluated(self):
+        response = self.client.get('/search/', {'q': '(a+)+$'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['search_count'], 0)
+
+    def test_empty_query_pages_without_id_cache(self):
+        from unittest import mock
+        from .views import ActiveNewsSearchView
+
+        for index in range(3):
+            create_news(self.author, title=f'Новость {index}', views=index % 2)
+        with mock.patch('news.views.cached_search_ids') as cached_search_ids, \
+                mock.patch.object(ActiveNewsSearchView, 'paginate_by', 2):
+            for order in ('asc', 'desc'):
+                views, found, cursor = [], [], ''
+                while cursor is not None:
+                    response = self.client.get('/search/', {'sort_by': 'views', 'order': order, 'cursor': cursor})
+                    self.assertEqual(response.context['search_count'], 5)
+                    views += [news.views for news in response.context['news_list']]
+                    found += [news.pk for news in response.context['news_list']]
+                    cursor = response.context['page_obj'].next_cursor
+                self.assertEqual(views, sorted(views, reverse=order == 'desc'))
+                self.assertEqual(len(set(found)), 5)
+        cached_search_ids.assert_not_called()
+
+    def test_results_are_cached_until_news_change(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        params = {'q': 'новости', 'sort_by': 'relevance'}
+        first = self.client.get('/search/', params)
+        self.assertEqual(first.context['search_count'], 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/search/', params)
+        self.assertFalse(any('news_search' in query['sql'] for query in queries))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            create_news(self.author, title='Главные новости')
+        # Кэш сбрасывается после фиксации транзакции
+        self.assertEqual(self.client.get('/search/', params).context['search_count'], 2)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get('/search/', params).context['search_count'], 3)
+
+    def test_admin_status_change_invalidates_results(self):
+        from .admin import make_archived
+
+        self.assertEqual(self.client.get('/search/', {'q': 'новости'}).context['search_count'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_archived(None, None, News.objects.filter(pk=self.sport.pk))
+        self.assertEqual(self.client.get('/search/', {'q': 'новости'}).context['search_count'], 1)
+
+
+class SharedCacheCheckTest(TestCase):
+    """Тесты проверки общего кэша"""
+
+    def test_process_local_cache_fails_outside_debug(self):
+        from .checks import check_shared_cache
+
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with self.settings(CACHES=locmem, DEBUG=False):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['news.E001'])
+        with self.settings(CACHES=locmem, DEBUG=True):
+            self.assertEqual(check_shared_cache(None), [])
+        self.assertEqual(check_shared_cache(None), [])
+
+
+class KeysetPaginationTest(TestCase):
+    """Тесты курсорной пагинации"""
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        self.author = User.objects.create_user('author', password='password')
+        now = timezone.now()
+        # Часть новостей с одинаковой датой, чтобы проверить сортировку по id
+        self.news = [create_news(self.author, pub_date=now - timedelta(hours=i // 3)) for i in range(25)]
+        self.expected = sorted(self.news, key=lambda news: (news.pub_date, news.pk), reverse=True)
+
+    def test_walk_forward_and_back(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        pages, cursor = [], ''
+        while cursor is not None:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/', {'cursor': cursor})
+            self.assertFalse(any('COUNT(*)' in query['sql'] for query in queries))
+            page = response.context['page_obj']
+            pages.append(list(page))
+            cursor = page.next_cursor
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        response = self.client.get('/', {'cursor': page.previous_cursor})
+        self.assertEqual(list(response.context['page_obj']), pages[1])
+        self.assertTrue(response.context['page_obj'].has_next())
+
+    def test_count_on_request_and_invalid_cursor(self):
+        response = self.client.get('/', {'cursor': '', 'count': '1'})
+        self.assertEqual(response.context['published_count'], 25)
+        self.assertIsNone(self.client.get('/', {'cursor': ''}).context['published_count'])
+        self.assertEqual(self.client.get('/', {'cursor': 'garbage'}).status_code, 404)
+        response = self.client.get(f'/users/author/{self.author.pk}/articles/', {'cursor': ''})
+        self.assertEqual(len(response.context['articles']), 10)
+
+
+class CardCacheTest(TestCase):
+    """Тесты кэша карточек новостей"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from . import cards
+
+        self.cards = cards
+        self.author = User.objects.create_user('author', password='password')
+        self.reader = User.objects.create_user('reader', password='password')
+        self.tag = Tag.objects.create(name='Спорт')
+        self.news = create_news(self.author, title='Матч')
+        self.news.tags.add(self.tag)
+        cache.clear()
+        cards.reset_stats()
+
+    def render(self):
+        return self.cards.render_cards(News.objects.filter(pk=self.news.pk).for_cards())
+
+    def test_second_render_is_a_hit(self):
+        from django.core.cache import cache
+
+        html = self.render()
+        self.assertEqual(self.render(), html)
+        # Счетчики копятся в памяти процесса и не пишутся в кэш при каждой сборке списка
+        self.assertIsNone(cache.get(self.cards.STATS_KEYS['hits']))
+        self.assertEqual(self.cards.get_stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+        self.assertEqual(cache.get(self.cards.STATS_KEYS['hits']), 1)
+
+    def test_changes_invalidate_card(self):
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.news.likes.add(self.reader)
+        self.assertIn('Количество лайков: 1', self.render())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.liked_news.clear()
+        self.assertIn('Количество лайков: 0', self.render())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Футбол'
+            self.tag.save()
+        self.assertIn('Футбол', self.render())
+        self.news.title = 'Финал'
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.news.save()
+        # Версия меняется только после фиксации транзакции, до нее выводится прежняя карточка
+        self.assertIn('Матч', self.render())
+        for callback in callbacks:
+            callback()
+        self.assertIn('Финал', self.render())
+        self.assertEqual(self.cards.get_stats()['hits'], 1)
+
+    def test_views_flush_keeps_card(self):
+        self.render()
+        counter = ViewCounter(interval=3600)
+        counter.incr(self.news.pk)
+        counter.flush()
+        # Просмотры не хранятся в кэшированной карточке: она берется из кэша с текущим количеством
+        self.assertIn('Количество просмотров: 1', self.render())
+        self.assertEqual(self.cards.get_stats()['hits'], 1)
+
+
+class LikeEndpointsTest(TestCase):
+    """Тесты AJAX-лайков"""
+
+    def setUp(self):
+        from .models import Comment
+
+        self.author = User.objects.create_user('author', password='password')
+        self.reader = User.objects.create_user('reader', password='password')
+        self.news = create_news(self.author)
+        self.comment = Comment.objects.create(news=self.news, author=self.author, content='Комментарий')
+
+    def test_toggle_news_like(self):
+        self.client.force_login(self.reader)
+        response = self.client.post(f'/{self.news.pk}/like/')
+        self.assertEqual(response.json(), {'liked': True, 'total_likes': 1})
+        response = self.client.post(f'/{self.news.pk}/like/')
+        self.assertEqual(response.json(), {'liked': False, 'total_likes': 0})
+
+    def test_toggle_comment_like(self):
+        self.client.force_login(self.reader)
+        response = self.client.post(f'/comment/{self.comment.pk}/like/')
+        self.assertEqual(response.json(), {'liked': True, 'total_likes': 1})
+        self.assertTrue(self.comment.likes.filter(pk=self.reader.pk).exists())
+
+    def test_anonymous_and_get_are_rejected(self):
+        self.assertEqual(self.client.post(f'/{self.news.pk}/like/').status_code, 403)
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(f'/{self.news.pk}/like/').status_code, 405)
+        self.assertEqual(self.client.post('/999/like/').status_code, 404)
+
+
+class ImmediateAtomicTest(TransactionTestCase):
+    """Тесты транзакции с блокировкой записи в начале"""
+
+    def test_begins_immediate_transaction(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .db import immediate_atomic
+
+        with CaptureQueriesContext(connection) as queries:
+            with immediate_atomic():
+                self.assertTrue(connection.in_atomic_block)
+                News.objects.exists()
+                with immediate_atomic():  # Вложенный блок - точка сохранения
+                    News.objects.exists()
+            with immediate_atomic():
+                pass
+        # Выключение автокоммита пишется в журнал запросов как BEGIN, но сам запрос не выполняется
+        begins = [query['sql'] for query in queries if query['sql'].startswith('BEGIN IMMEDIATE')]
+        self.assertEqual(len(begins), 2)
+        self.assertTrue(connection.get_autocommit())
+
+        from django.db import transaction
+
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():  # Обычные транзакции не меняются
+                News.objects.exists()
+        self.assertEqual(queries[0]['sql'], 'BEGIN')
+
+    def test_rolls_back_and_runs_on_commit_after_commit(self):
+        from django.db import connection, transaction
+        from .db import immediate_atomic
+
+        author = User.objects.create_user('author', password='password')
+        callbacks = []
+        with self.assertRaises(ValueError):
+            with immediate_atomic():
+                create_news(author)
+                transaction.on_commit(lambda: callbacks.append('rolled back'))
+                raise ValueError
+        self.assertFalse(News.objects.exists())
+        self.assertTrue(connection.get_autocommit())
+        self.assertFalse(connection.in_atomic_block)
+
+        with immediate_atomic():
+            create_news(author)
+            with self.assertRaises(ValueError), immediate_atomic():  # Ошибка во вложенном блоке откатывает только его
+                create_news(author)
+                raise ValueError
+            transaction.on_commit(lambda: callbacks.append('committed'))
+            self.assertEqual(callbacks, [])
+        self.assertEqual(callbacks, ['committed'])
+        self.assertEqual(News.objects.count(), 1)
+
+
+class CommentsPaginationTest(TestCase):
+    """Тесты постраничной загрузки комментариев"""
+
+    def setUp(self):
+        from .models import Comment
+
+        self.author = User.objects.create_user('author', password='password')
+        self.news = create_news(self.author)
+        self.comments = [
+            Comment.objects.create(news=self.news, author=self.author, content=f'Комментарий {i}') for i in range(5)
+        ]
+        self.comments[0].likes.add(self.author)
+
+    def test_first_page_inline_and_rest_on_demand(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with self.settings(NEWS_COMMENTS_PAGE_SIZE=2):
+            response = self.client.get(f'/{self.news.pk}/')
+            self.assertEqual(list(response.context['comments']), self.comments[:-3:-1])
+            cursor, loaded = response.context['comments_next_cursor'], []
+            while cursor:
+                with CaptureQueriesContext(connection) as queries:
+                    data = self.client.get(f'/{self.news.pk}/comments/', {'cursor': cursor}).json()
+                self.assertLessEqual(len(queries), 2)
+                loaded.append(data['html'])
+                cursor = data['next_cursor']
+        self.assertEqual(len(loaded), 2)
+        self.assertIn('Комментарий 0', loaded[-1])
+        self.assertEqual(self.client.get(f'/{self.news.pk}/comments/', {'cursor': 'bad'}).status_code, 404)
+
+    def test_delete_comment_from_list_form(self):
+        from django.urls import reverse
+
+        url = reverse('delete_comment', args=[self.comments[1].pk])
+        self.client.force_login(self.author)
+        # Комментарий удаляется формой в списке комментариев, отдельной страницы подтверждения нет
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertRedirects(self.client.post(url), reverse('news_detail', args=[self.news.pk]), fetch_redirect_response=False)
+        self.assertFalse(Comment.objects.filter(pk=self.comments[1].pk).exists())
+
+        other = User.objects.create_user('other', password='password')
+        self.client.force_login(other)
+        self.assertEqual(self.client.post(reverse('delete_comment', args=[self.comments[2].pk])).status_code, 403)
+
+
+class FakeTelegramServer:
+    """Локальный HTTP-сервер, отвечающий как Telegram Bot API"""
+
+    def __init__(self):
+        import json
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        server = self
+        self.messages = []
+        self.failures = 0  # Сколько следующих сообщений отклонить
+        self.error = (502, 'Bad Gateway')  # Код и описание ошибки для отклоненных сообщений
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                from urllib.parse import parse_qs
+
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length).decode()
+                if self.path.endswith('/getMe'):
+                    result = {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'bot'}}
+                elif server.failures:
+                    server.failures -= 1
+                    result = {'ok': False, 'error_code': server.error[0], 'description': server.error[1]}
+                else:
+                    params = json.loads(body) if body.startswith('{') else {k: v[0] for k, v in parse_qs(body).items()}
+                    server.messages.append(params)
+                    result = {'ok': True, 'result': {
+                        'message_id': len(server.messages), 'date': 0,
+                        'chat': {'id': 1, 'type': 'private'}, 'text': params.get('text', ''),
+                    }}
+                data = json.dumps(result).encode()
+                self.send_response(200 if result['ok'] else result['error_code'])
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}/bot'
+
+    def __enter__(self):
+        import threading
+
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TelegramOutboxTest(TestCase):
+    """Тесты очереди уведомлений в Telegram"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='password')
+
+    def test_proposed_news_is_queued_not_sent(self):
+        from .models import TelegramNotification
+
+        news = create_news(self.author, status='draft', title='Предложенная новость')
+        notification = TelegramNotification.objects.get()
+        self.assertEqual(notification.news, news)
+        self.assertIn('Предложенная новость', notification.message)
+        self.assertFalse(News.objects.get(pk=news.pk).notified)
+
+    def test_worker_sends_and_retries(self):
+        from django.utils import timezone
+        from .models import TelegramNotification
+        from .notifications import TelegramWorker
+
+        first = create_news(self.author, status='draft', title='Первая')
+        create_news(self.author, status='draft', title='Вторая')
+        with FakeTelegramServer() as server:
+            server.failures = 1
+            worker = TelegramWorker(token='123:test', base_url=server.url, rate_limit=1000, max_attempts=3)
+            worker.start()
+            try:
+                self.assertEqual(worker.run_once(), 2)
+                failed = TelegramNotification.objects.get(status='pending')
+                self.assertEqual(failed.attempts, 1)
+                self.assertGreater(failed.next_attempt_at, timezone.now())
+                self.assertEqual(worker.run_once(), 0)
+
+                TelegramNotification.objects.update(next_attempt_at=timezone.now())
+                self.assertEqual(worker.run_once(), 1)
+            finally:
+                worker.stop()
+
+        self.assertEqual(len(server.messages), 2)
+        self.assertEqual(TelegramNotification.objects.filter(status='sent').count(), 2)
+        self.assertTrue(News.objects.get(pk=first.pk).notified)
+
+    def test_permanent_error_is_not_retried(self):
+        from .models import TelegramNotification
+        from .notifications import TelegramWorker
+
+        create_news(self.author, status='draft', title='Заголовок с *незакрытой разметкой')
+        with FakeTelegramServer() as server:
+            server.failures = 1
+            server.error = (400, "Bad Request: can't parse entities")
+            worker = TelegramWorker(token='123:test', base_url=server.url, rate_limit=1000, max_attempts=3)
+            worker.start()
+            try:
+                with self.assertLogs('news.notifications', 'ERROR'):
+                    self.assertEqual(worker.run_once(), 1)
+            finally:
+                worker.stop()
+
+        notification = TelegramNotification.objects.get()
+        self.assertEqual((notification.status, notification.attempts), ('failed', 1))
+        self.assertIn("Can't parse entities", notification.last_error)
+
+    def test_notification_is_claimed_by_one_worker(self):
+        from django.utils import timezone
+        from .models import TelegramNotification
+        from .notifications import TelegramWorker
+
+        create_news(self.author, status='draft')
+        create_news(self.author, status='draft')
+        first, second = TelegramWorker(token='123:test'), TelegramWorker(token='123:test')
+        self.addCleanup(first.stop)
+        self.addCleanup(second.stop)
+
+        self.assertEqual(len(first.claim_notifications()), 2)
+        self.assertEqual(second.claim_notifications(), [])
+        self.assertEqual(set(TelegramNotification.objects.values_list('status', flat=True)), {'sending'})
+
+        # Захват остановившегося процесса истек: уведомления забирает другой процесс
+        TelegramNotification.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(len(second.claim_notifications()), 2)
+
+
+class ExportCommandTest(TestCase):
+    """Тесты потоковой выгрузки данных"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='password')
+        self.tag = Tag.objects.create(name='Наука')
+        self.news = create_news(self.author)
+        self.news.tags.add(self.tag)
+        self.news.likes.add(self.author)
+
+    def export(self, *args):
+        import os
+        import tempfile
+        from django.core.management import call_command
+
+        handle, path = tempfile.mkstemp(suffix='.json.gz' if '--gzip' in args else '.json')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        call_command('export_to_json', '--output', path, *args, stdout=open(os.devnull, 'w'))
+        return path
+
+    def test_exports_all_models_as_loaddata_fixture(self):
+        import json
+
+        with open(self.export()) as file:
+            data = json.load(file)
+        models = {item['model'] for item in data}
+        self.assertTrue({'auth.user', 'news.tag', 'news.news'} <= models)
+        news = next(item for item in data if item['model'] == 'news.news')
+        self.assertEqual(news['fields']['tags'], [self.tag.pk])
+        self.assertEqual(news['fields']['likes'], [self.author.pk])
+        user = next(item for item in data if item['model'] == 'auth.user')
+        self.assertNotIn('password', user['fields'])
+        self.assertIn('username', user['fields'])
+
+        with open(self.export('--include-passwords')) as file:
+            user = next(item for item in json.load(file) if item['model'] == 'auth.user')
+        self.assertEqual(user['fields']['password'], self.author.password)
+
+    def test_export_without_passwords_keeps_them_on_import(self):
+        import os
+        from django.core.management import call_command
+
+        path = self.export()
+        User.objects.filter(pk=self.author.pk).update(email='old@mail.ru')
+        call_command('import_news', path, stdout=open(os.devnull, 'w'))
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual(author.email, '')
+        self.assertTrue(author.check_password('password'))
+
+    def test_incremental_compressed_jsonl(self):
+        import gzip
+        import json
+        from datetime import timedelta
+        from django.utils import timezone
+
+        News.objects.filter(pk=self.news.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        fresh = create_news(self.author, title='Свежая')
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        with gzip.open(self.export('--format', 'jsonl', '--gzip', '--since', since), 'rt') as file:
+            data = [json.loads(line) for line in file]
+        self.assertEqual([item['pk'] for item in data if item['model'] == 'news.news'], [fresh.pk])
+        # У остальных моделей нет даты изменения, они выгружаются целиком
+        self.assertEqual([item['pk'] for item in data if item['model'] == 'news.tag'], [self.tag.pk])
+
+
+class ImportCommandTest(TestCase):
+    """Тесты пакетной загрузки выгрузки"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='password')
+        self.tag = Tag.objects.create(name='Наука')
+
+    def fixture(self, data):
+        import json
+        import os
+        import tempfile
+
+        handle, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w') as file:
+            json.dump(data, file, ensure_ascii=False)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def import_news(self, path):
+        import os
+        from django.core.management import call_command
+
+        call_command('import_news', path, '--batch-size', '2', stdout=open(os.devnull, 'w'))
+
+    def test_import_is_idempotent_and_maps_natural_keys(self):
+        from .models import TelegramNotification
+        from .search import search_queryset
+
+        # ID пользователя и тега в выгрузке отличаются от ID в базе, связи находятся по имени
+        news = [
+            {'model': 'news.news', 'pk': 100 + i, 'fields': {
+                'title': f'Открытие {i}', 'brief': 'Кратко', 'content': 'Текст', 'pub_date': '2024-01-01T00:00:00Z',
+                'status': 'draft', 'author': 900, 'tags': [700, 701], 'likes': [900],
+            }}
+            for i in range(3)
+        ]
+        path = self.fixture([
+            {'model': 'auth.user', 'pk': 900, 'fields': {'username': 'author', 'password': 'x', 'email': 'new@mail.ru'}},
+            {'model': 'news.tag', 'pk': 700, 'fields': {'name': 'Наука', 'slug': 'nauka'}},
+            {'model': 'news.tag', 'pk': 701, 'fields': {'name': 'Космос', 'slug': 'kosmos'}},
+            *news,
+        ])
+        self.import_news(path)
+        self.import_news(path)
+
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(User.objects.get().email, 'new@mail.ru')
+        self.assertEqual(Tag.objects.count(), 2)
+        imported = News.objects.get(pk=101)
+        self.assertEqual(imported.author, self.author)
+        self.assertEqual(set(imported.tags.values_list('name', flat=True)), {'Наука', 'Космос'})
+        self.assertEqual(list(imported.likes.all()), [self.author])
+        self.assertEqual(News.tags.through.objects.count(), 6)
+        self.assertEqual(search_queryset(News.objects.all(), 'открытия').count(), 3)
+        self.assertFalse(TelegramNotification.objects.exists())
+        # Статистика пересчитывается один раз после загрузки всех пакетов
+        self.assertEqual(self.tag.stats.get(status='draft').count, 3)
+        self.assertEqual(self.author.author_stats.get(status='draft').likes, 3)
+
+
+class TagStatsTest(TestCase):
+    """Тесты материализованной статистики тегов"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='password')
+        self.tag = Tag.objects.create(name='Наука')
+        self.other = Tag.objects.create(name='Космос')
+
+    def stats(self, tag):
+        return {stats.status: stats.count for stats in tag.stats.all()}
+
+    def test_stats_follow_news_changes(self):
+        from .admin import update_status
+        from .tag_stats import rebuild_tag_stats
+
+        first = create_news(self.author)
+        second = create_news(self.author)
+        first.tags.add(self.tag, self.other)
+        self.tag.news_set.add(second)
+        self.assertEqual(self.stats(self.tag), {'published': 2})
+
+        update_status(News.objects.filter(pk=first.pk), 'archived')
+        self.assertEqual(self.stats(self.tag), {'published': 1, 'archived': 1})
+
+        second.status = 'draft'
+        second.save()
+        first.tags.clear()
+        self.assertEqual(self.stats(self.tag), {'draft': 1})
+        self.assertEqual(self.stats(self.other), {})
+
+        second.delete()
+        self.assertEqual(self.stats(self.tag), {})
+        self.assertEqual(rebuild_tag_stats(), (0, 0))
+
+    def test_stats_are_updated_by_deltas(self):
+        from datetime import timedelta
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .tag_stats import rebuild_tag_stats
+
+        old = create_news(self.author)
+        old.pub_date -= timedelta(days=1)
+        old.save()
+        latest = create_news(self.author)
+        self.tag.news_set.add(old, latest)
+        self.tag.news_set.remove(old, create_news(self.author))  # Третьей новости с тегом нет
+        self.tag.news_set.add(old)
+        self.assertEqual(self.stats(self.tag), {'published': 2})
+
+        # Дата последней новости пересчитывается, только если изменилась последняя новость
+        old = News.objects.get(pk=old.pk)
+        old.title = 'Старая'
+        old.pub_date -= timedelta(days=1)
+        with CaptureQueriesContext(connection) as queries:
+            old.save()
+        self.assertFalse([query for query in queries if 'GROUP BY "news_news_tags"' in query['sql']])
+        self.assertEqual(self.tag.stats.get().last_pub_date, latest.pub_date)
+
+        latest = News.objects.get(pk=latest.pk)
+        latest.status = 'archived'
+        latest.save()
+        self.assertEqual(self.stats(self.tag), {'published': 1, 'archived': 1})
+        self.assertEqual(self.tag.stats.get(status='published').last_pub_date, old.pub_date)
+        self.assertEqual(rebuild_tag_stats()[1], 0)
+
+    def test_stale_instance_moves_news_from_current_status(self):
+        from .tag_stats import rebuild_tag_stats
+
+        news = create_news(self.author)
+        news.tags.add(self.tag)
+        # Статус изменился в базе после загрузки новости: переносить нужно из текущего статуса, а не загруженного
+        stale = News.objects.get(pk=news.pk)
+        news.status = 'archived'
+        news.save()
+        stale.status = 'draft'
+        stale.save()
+        self.assertEqual(self.stats(self.tag), {'draft': 1})
+        self.assertEqual(rebuild_tag_stats()[1], 0)
+
+    def test_tag_page_and_cloud_use_stats(self):
+        from django.core.cache import cache
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+
+        cache.clear()
+        for _ in range(3):
+            create_news(self.author).tags.add(self.tag)
+        create_news(self.author).tags.add(self.other)
+
+        url = reverse('news_by_tag', args=[self.tag.slug])
+        response = self.client.get(url)
+        self.assertEqual(response.context['news_count'], 3)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse(any('news_news_tags' in query['sql'] and 'COUNT(*)' in query['sql'] for query in queries))
+
+        cloud = response.context['tag_cloud']()
+        self.assertEqual([(tag['name'], tag['weight']) for tag in cloud], [('Космос', 1), ('Наука', 5)])
+        self.assertContains(response, 'tag-cloud-weight-5')
+
+
+class AuthorStatsTest(TestCase):
+    """Тесты материализованной статистики авторов"""
+
+    def setUp(self):
+        User.objects.create_user('admin', password='password')  # Автор по умолчанию для новостей удаленных авторов
+        self.author = User.objects.create_user('author', password='password')
+        self.reader = User.objects.create_user('reader', password='password')
+
+    def stats(self, user):
+        from .models import AuthorStats
+
+        return {stats.status: (stats.count, stats.views, stats.likes) for stats in AuthorStats.objects.filter(author=user)}
+
+    def assert_consistent(self):
+        from .author_stats import rebuild_author_stats
+
+        self.assertEqual(rebuild_author_stats()[1], 0)
+
+    def test_stats_follow_news_likes_and_views(self):
+        from .admin import update_status
+
+        first = create_news(self.author)
+        second = create_news(self.author)
+        first.likes.add(self.reader, self.author)
+        self.reader.liked_news.add(second)
+        self.reader.liked_news.remove(second, second)
+        second.likes.remove(self.author)  # Автор эту новость не лайкал
+        self.assertEqual(self.stats(self.author), {'published': (2, 0, 2)})
+
+        views_counter.incr(first.pk, 3)
+        update_status(News.objects.filter(pk=second.pk), 'archived')
+        self.assertEqual(self.stats(self.author), {'published': (1, 3, 2), 'archived': (1, 0, 0)})
+        self.assert_consistent()
+
+        first.refresh_from_db()
+        first.author = self.reader
+        first.save()
+        self.assertEqual(self.stats(self.author), {'archived': (1, 0, 0)})
+        self.assertEqual(self.stats(self.reader), {'published': (1, 3, 2)})
+        self.reader.liked_news.clear()
+        self.assertEqual(self.stats(self.reader), {'published': (1, 3, 1)})
+        self.assert_consistent()
+
+        self.reader.delete()  # Новость переходит автору по умолчанию
+        second.delete()
+        self.assertEqual(self.stats(self.author), {})
+        self.assert_consistent()
+
+    def test_save_applies_deltas(self):
+        from datetime import timedelta
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import AuthorStats
+
+        old = create_news(self.author)
+        latest = create_news(self.author)
+        latest.likes.add(self.reader)
+        old = News.objects.get(pk=old.pk)
+        views_counter.incr(old.pk, 5)
+
+        # Загруженная новость не знает о записанных просмотрах, ее сохранение их перезаписывает
+        old.title = 'Старая'
+        old.pub_date -= timedelta(days=1)
+        with CaptureQueriesContext(connection) as queries:
+            old.save()
+        self.assertFalse([query for query in queries if 'GROUP BY' in query['sql']])
+        self.assertEqual(self.stats(self.author), {'published': (2, 0, 1)})
+        self.assert_consistent()
+
+        latest = News.objects.get(pk=latest.pk)
+        latest.status = 'draft'
+        latest.save(update_fields=['status'])
+        self.assertEqual(self.stats(self.author), {'published': (1, 0, 0), 'draft': (1, 0, 1)})
+        self.assertEqual(AuthorStats.objects.get(author=self.author, status='published').last_pub_date, old.pub_date)
+        self.assert_consistent()
+
+        latest.delete()
+        self.assertEqual(self.stats(self.author), {'published': (1, 0, 0)})
+        self.assert_consistent()
+
+    def test_author_page_uses_stats(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+
+        for i in range(3):
+            create_news(self.author, status='draft' if i == 2 else 'published')
+        url = reverse('author_articles', args=[self.author.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url + '?status=published')
+        self.assertEqual(response.context['author_stats']['counts'], {'draft': 1, 'scheduled': 0, 'published': 2, 'archived': 0})
+        self.assertEqual(response.context['paginator'].count, 2)
+        self.assertFalse(any('COUNT(*)' in query['sql'] for query in queries))
+        self.assertContains(response, 'Всего статей: 3')
+
+
+class BulkLikesAdminTest(TestCase):
+    """Тесты массовых действий с лайками в админке"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.author = User.objects.create_user('author', password='password')
+        self.news = [create_news(self.author) for _ in range(5)]
+        self.comments = [Comment.objects.create(news=news, author=self.author, content='Комментарий') for news in self.news]
+        self.client.force_login(self.admin)
+
+    def run_action(self, model, action, objects):
+        from django.urls import reverse
+
+        url = reverse(f'admin:news_{model}_changelist')
+        return self.client.post(url, {'action': action, '_selected_action': [obj.pk for obj in objects]})
+
+    def assert_stats_consistent(self):
+        from users.stats import rebuild_user_stats
+        from .author_stats import rebuild_author_stats
+
+        self.assertEqual(rebuild_user_stats()[1], 0)
+        self.assertEqual(rebuild_author_stats()[1], 0)
+
+    def test_actions_are_set_based(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.news[0].likes.add(self.admin, self.author)
+        with CaptureQueriesContext(connection) as queries:
+            self.run_action('news', 'add_likes_to_news', self.news)
+        self.assertEqual(News.likes.through.objects.filter(user=self.admin).count(), 5)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT') and 'INTO "news_news_likes"' in query['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assert_stats_consistent()
+
+        with CaptureQueriesContext(connection) as few:
+            self.run_action('comment', 'add_likes_to_comments', self.comments[:1])
+        with CaptureQueriesContext(connection) as many:
+            self.run_action('comment', 'add_likes_to_comments', self.comments)
+        self.assertEqual(len(few), len(many))
+
+        self.run_action('news', 'remove_likes_from_news', self.news[:3])
+        self.run_action('comment', 'remove_likes_from_comments', self.comments)
+        self.assertEqual(News.likes.through.objects.count(), 2)
+        self.assertFalse(Comment.likes.through.objects.exists())
+        self.assert_stats_consistent()
+
+    def test_large_selection_runs_as_job(self):
+        from django.urls import reverse
+        from .bulk_likes import run_job
+        from .models import BulkLikeJob
+
+        with self.settings(ADMIN_BULK_LIKES_SYNC_LIMIT=2), self.captureOnCommitCallbacks() as callbacks:
+            self.run_action('news', 'add_likes_to_news', self.news)
+        self.assertEqual(len(callbacks), 1)  # Запуск фонового потока после фиксации транзакции
+        job = BulkLikeJob.objects.get()
+        self.assertEqual((job.action, job.target, job.total, job.status), ('add', 'news', 5, 'pending'))
+        self.assertFalse(News.likes.through.objects.exists())
+
+        self.assertTrue(run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.progress), ('done', 5, 100))
+        self.assertEqual(News.likes.through.objects.count(), 5)
+        self.assertFalse(run_job(job.pk))  # Выполненное задание не запускается повторно
+        self.assert_stats_consistent()
+
+        response = self.client.get(reverse('admin:news_bulklikejob_change', args=[job.pk]))
+        self.assertContains(response, '<progress value="100"')
+
+    def test_running_job_is_reclaimed_after_lease_expires(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .bulk_likes import run_job
+        from .models import BulkLikeJob
+
+        job = BulkLikeJob.objects.create(
+            action='add', target='news', user=self.admin, object_ids=[news.pk for news in self.news],
+            total=len(self.news), status='running', locked_until=timezone.now() + timedelta(minutes=1),
+        )
+        # Задание выполняется другим процессом: пока захват действует, повторно оно не обрабатывается
+        self.assertFalse(run_job(job.pk))
+        self.assertFalse(News.likes.through.objects.exists())
+
+        BulkLikeJob.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(run_job(job.pk))
+        self.assertEqual(News.likes.through.objects.count(), len(self.news))
+
+
+class AdminChangelistTest(TestCase):
+    """Тесты списков новостей и комментариев в админке"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.author = User.objects.create_user('author', password='password')
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        for i in range(count):
+            news = create_news(self.author, title=f'Космос {i}')
+            comment = Comment.objects.create(news=news, author=self.author, content=f'Комментарий {i}')
+            news.likes.add(self.admin)
+            comment.likes.add(self.admin, self.author)
+
+    def get(self, model, query=''):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:news_{model}_changelist') + query)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_rows(2)
+        few = [self.get(model)[1] for model in ('news', 'comment')]
+        self.add_rows(6)
+        many = [self.get(model)[1] for model in ('news', 'comment')]
+        self.assertEqual(few, many)
+
+        response, _ = self.get('comment', '?o=5')  # Сортировка по количеству лайков
+        self.assertEqual([comment.likes_count for comment in response.context['cl'].result_list][:1], [2])
+
+    def test_input_filters(self):
+        self.add_rows(3)
+        other = User.objects.create_user('other', password='password')
+        Comment.objects.create(news=News.objects.first(), author=other, content='Другой')
+
+        response, _ = self.get('comment', '?author=other')
+        self.assertEqual([comment.content for comment in response.context['cl'].result_list], ['Другой'])
+        news = News.objects.get(title='Космос 1')
+        response, _ = self.get('comment', f'?news={news.pk}')
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response, _ = self.get('comment', '?news=космос')
+        self.assertEqual(response.context['cl'].result_count, 4)
+        response, _ = self.get('news', '?author=author&status__exact=published')
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertContains(response, 'name="status__exact" value="published"')
+        self.assertNotContains(response, '?news__id__exact=')
+
+    def test_estimated_count(self):
+        from django.db import connection
+
+        self.add_rows(3)
+        with self.settings(ADMIN_ESTIMATED_COUNT=True):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            from django.test.utils import CaptureQueriesContext
+            from django.urls import reverse
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('admin:news_news_changelist'))
+            self.assertEqual(response.context['cl'].result_count, 3)
+            self.assertFalse(any('COUNT(*)' in query['sql'] for query in queries))
+
+            response, _ = self.get('news', '?status__exact=draft')  # С фильтром количество считается точно
+            self.assertEqual(response.context['cl'].result_count, 0)
+
+
+class PublisherTest(TestCase):
+    """Тесты публикации запланированных новостей"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='password')
+
+    def test_due_news_are_published_in_batches(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import TelegramNotification, TagStats
+        from . import publisher
+
+        now = timezone.now()
+        tag = Tag.objects.create(name='Наука')
+        due = [create_news(self.author, status='scheduled', pub_date=now - timedelta(minutes=i)) for i in range(5)]
+        later = create_news(self.author, status='scheduled', pub_date=now + timedelta(hours=1))
+        for news in due:
+            news.tags.add(tag)
+        self.assertEqual(publisher.next_due(now), due[-1].pub_date)
+
+        self.assertEqual(publisher.run_once(batch_size=2, now=now), 5)
+        self.assertEqual(News.objects.filter(status='published').count(), 5)
+        self.assertEqual(News.objects.get(pk=later.pk).status, 'scheduled')
+        self.assertEqual(TelegramNotification.objects.filter(message__startswith=publisher.PUBLISHED_HEADER).count(), 5)
+        self.assertEqual(TagStats.objects.get(tag=tag, status='published').count, 5)
+        self.assertEqual(publisher.next_due_in(7200, now), (later.pub_date - now).total_seconds())
+        self.assertEqual(publisher.next_due_in(60, now), 60)
+
+    def test_old_news_are_archived(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from . import publisher
+
+        now = timezone.now()
+        old = create_news(self.author, pub_date=now - timedelta(days=40))
+        fresh = create_news(self.author, pub_date=now - timedelta(days=5))
+        self.assertEqual(publisher.run_once(now=now), 0)  # Архивирование по умолчанию отключено
+        with self.settings(NEWS_ARCHIVE_AFTER_DAYS=30):
+            self.assertEqual(publisher.run_once(now=now), 1)
+            self.assertEqual(publisher.next_due(now), fresh.pub_date + timedelta(days=30))
+        self.assertEqual(News.objects.get(pk=old.pk).status, 'archived')
+        self.assertEqual(News.objects.get(pk=fresh.pk).status, 'published')
+
+    def test_due_lookups_use_index(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from . import publisher
+
+        with self.settings(NEWS_ARCHIVE_AFTER_DAYS=30), CaptureQueriesContext(connection) as queries:
+            publisher.next_due()
+            publisher.run_once()
+        with connection.cursor() as cursor:
+            for query in queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    for step in (row[-1] for row in cursor.fetchall()):
+                        self.assertNotIn('TEMP B-TREE', step, query['sql'])
+                        self.assertFalse(step.startswith('SCAN news_news'), query['sql'])
+
+
+class FeedTest(TestCase):
+    """Тесты лент RSS, Atom и JSON Feed"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.author = User.objects.create_user('author', password='password')
+        self.tag = Tag.objects.create(name='Наука')
+        self.news = create_news(self.author, title='Открытие')
+        self.news.tags.add(self.tag)
+        create_news(self.author, title='Черновик', status='draft')
+
+    def test_formats_and_filters(self):
+        import json
+        from django.urls import reverse
+
+        for name, kwargs in (
+            ('news_feed', {}), ('tag_news_feed', {'tag_slug': self.tag.slug}), ('author_news_feed', {'author_id': self.author.pk}),
+        ):
+            for fmt, content_type in (('rss', 'application/rss+xml'), ('atom', 'application/atom+xml'), ('json', 'application/feed+json')):
+                response = self.client.get(reverse(name, kwargs={'fmt': fmt, **kwargs}))
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['Content-Type'].startswith(content_type))
+                self.assertContains(response, 'Открытие')
+                self.assertNotContains(response, 'Черновик')
+
+        data = json.loads(self.client.get(reverse('news_feed', args=['json'])).content)
+        self.assertEqual(data['items'][0]['tags'], ['Наука'])
+        self.assertEqual(data['items'][0]['authors'], [{'name': 'author'}])
+        self.assertEqual(self.client.get(reverse('tag_news_feed', args=['missing', 'rss'])).status_code, 404)
+        self.assertEqual(self.client.get('/feed/xml/').status_code, 404)
+
+    def test_conditional_get(self):
+        from django.urls import reverse
+
+        url = reverse('news_feed', args=['atom'])
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        News.objects.filter(pk=self.news.pk).update(views=5)
+        news_bulk_updated.send(sender=News, news_ids=[self.news.pk], fields=['views'])  # Просмотры ленту не меняют
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.news.title = 'Новое открытие'
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.news.save()
+        # Кэш сбрасывается после фиксации транзакции
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for callback in callbacks:
+            callback()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Новое открытие')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Физика'
+            self.tag.save()
+        self.assertContains(self.client.get(reverse('news_feed', args=['rss'])), 'Физика')
+
+    def test_cache_is_per_host(self):
+        from django.urls import reverse
+
+        url = reverse('news_feed', args=['rss'])
+        with self.settings(ALLOWED_HOSTS=['localhost', '24newsblog.ru']):
+            local = self.client.get(url, HTTP_HOST='localhost')
+            public = self.client.get(url, HTTP_HOST='24newsblog.ru', secure=True)
+        self.assertContains(local, f'http://localhost/{self.news.pk}/')
+        self.assertContains(public, f'https://24newsblog.ru/{self.news.pk}/')
+        self.assertNotContains(public, 'localhost')
+
+
+class ConditionalGetTest(TestCase):
+    """Тесты условных запросов к спискам и страницам новостей"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='password')
+        self.tag = Tag.objects.create(name='Наука')
+        self.news = create_news(self.author, title='Открытие')
+        self.news.tags.add(self.tag)
+        self.other = create_news(self.author, title='Другая')
+
+    def assert_changed(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200, url)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def test_list_not_modified(self):
+        from django.urls import reverse
+
+        url = reverse('news_list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn(f'max-age={settings.NEWS_HTTP_CACHE_MAX_AGE}', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        # Дата изменения и количество новостей - два запроса, шаблон не рендерится
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.templates, [])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.news.likes.add(self.author)
+        etag = self.assert_changed(url, etag)
+        self.other.delete()  # Удаление не меняет MAX(updated_at), но меняет количество
+        etag = self.assert_changed(url, etag)
+        News.objects.filter(pk=self.news.pk).update(views=5)
+        news_bulk_updated.send(sender=News, news_ids=[self.news.pk], fields=['views'])  # Просмотры не учитываются
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_tag_and_archive_lists(self):
+        from django.urls import reverse
+
+        from .admin import update_status
+
+        url = reverse('news_by_tag', args=[self.tag.slug])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.tag.name = 'Физика'
+        self.tag.save()
+        url = reverse('news_by_tag', args=[self.tag.slug])
+        etag = self.assert_changed(url, etag)
+        self.other.tags.add(self.tag)
+        self.assert_changed(url, etag)
+        self.assertEqual(self.client.get(reverse('news_by_tag', args=['missing'])).status_code, 404)
+
+        url = reverse('archived_news')
+        self.assertNotIn('ETag', self.client.get(url))  # Пустой список не с чем сравнивать
+        update_status(News.objects.filter(pk=self.news.pk), 'archived')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        update_status(News.objects.filter(pk=self.other.pk), 'archived')
+        self.assert_changed(url, etag)
+
+    def test_detail_not_modified(self):
+        from django.urls import reverse
+
+        url = reverse('news_detail', args=[self.news.pk])
+        response = self.client.get(url)
+        etag = response['ETag']
+        # Прокси не может показывать страницу без проверки, иначе просмотр не будет засчитан
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=0', response['Cache-Control'])
+        self.assertIn('must-revalidate', response['Cache-Control'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(News.objects.get(pk=self.news.pk).views, 2)  # Просмотр засчитывается и при ответе 304
+
+        comment = Comment.objects.create(news=self.news, author=self.author, content='Комментарий')
+        etag = self.assert_changed(url, etag)
+        comment.likes.add(self.author)
+        etag = self.assert_changed(url, etag)
+        self.author.liked_comments.clear()
+        etag = self.assert_changed(url, etag)
+        comment.delete()
+        self.assert_changed(url, etag)
+
+    def test_authenticated_pages_are_private(self):
+        from django.urls import reverse
+
+        url = reverse('news_list')
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        # В странице пользователя имя и CSRF-токены форм: она не отдается из кэша и не кэшируется в прокси
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+
+
+class NewsImageTest(TestCase):
+    """Тесты миниатюр изображений новостей"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = self.settings(MEDIA_ROOT=media_root, IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = User.objects.create_user('author', password='password')
+
+    def test_card_uses_srcset_once_thumbnails_are_built(self):
+        import io
+        from django.core.cache import cache
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.urls import reverse
+        from PIL import Image
+
+        cache.clear()
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000), 'blue').save(buffer, 'JPEG')
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            news = create_news(self.author, image=SimpleUploadedFile('big.jpg', buffer.getvalue()))
+
+        # Пока миниатюры не построены, выводится исходное изображение
+        response = self.client.get(reverse('news_list'))
+        self.assertContains(response, f'src="{news.image.url}"')
+        self.assertNotContains(response, 'srcset')
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        news.refresh_from_db()
+        self.assertEqual(set(news.image_variants), {'400', '900', '1200'})
+
+        # Построенные миниатюры меняют разметку, поэтому прежний ETag больше не подходит
+        response = self.client.get(reverse('news_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f'{news.get_image_url(900)} 900w')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertNotContains(response, f'src="{news.image.url}"')
+
+        response = self.client.get(reverse('news_detail', args=[news.pk]))
+        self.assertContains(response, f'og:image" content="http://testserver{news.get_image_url(1200)}"')
+
+        # Повторная загрузка того же файла не сбрасывает миниатюры
+        variants = news.image_variants
+        news.image = SimpleUploadedFile('same.jpg', buffer.getvalue())
+        with self.captureOnCommitCallbacks() as callbacks:
+            news.save()
+        self.assertNotIn(news.process_image, callbacks)
+        news.refresh_from_db()
+        self.assertEqual(news.image_variants, variants)
+
+
+class SQLiteProfileTest(TestCase):
+    """Тесты настроек соединения с SQLite"""
+
+    def test_pragmas_applied_to_connection(self):
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_file_database_uses_wal(self):
+        import os
+        import sqlite3
+        import tempfile
+        from .db import apply_pragmas, get_pragmas
+
+        with tempfile.TemporaryDirectory() as directory:
+            db = sqlite3.connect(os.path.join(directory, 'test.sqlite3'))
+            apply_pragmas(db, get_pragmas('production'))
+            self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            db.close()
+        self.assertEqual(get_pragmas('default'), {})
+
+
+class QueryPlanTest(TestCase):
+    """
+    Регрессионный тест планов запросов: все SELECT, которые выполняют страницы списков,
+    не должны читать таблицы целиком и сортировать результат во временном B-дереве.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='password')
+        cls.tag = Tag.objects.create(name='Наука')
+        for i in range(3):
+            news = create_news(cls.author, status='archived' if i == 2 else 'published')
+            news.tags.add(cls.tag)
+            news.likes.add(cls.author)
+            Comment.objects.create(news=news, author=cls.author, content='Комментарий')
+        cls.news = news
+
+    def explain(self, sql):
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_plans(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            for step in self.explain(query['sql']):
+                # SCAN допустим только для промежуточных результатов подзапросов
+                is_scan = step.startswith('SCAN ') and not step.startswith('SCAN (subquery')
+                if is_scan or 'TEMP B-TREE' in step:
+                    self.fail(f'{url}: {step}\n{query["sql"]}')
+        return response
+
+    def test_list_pages_use_indexes(self):
+        from django.urls import reverse
+
+        urls = [
+            reverse('news_list'),
+            reverse('news_list') + '?cursor=',
+            reverse('archived_news'),
+            reverse('news_by_tag', args=[self.tag.slug]),
+            reverse('news_by_tag_status', args=[self.tag.slug, 'archived']),
+            reverse('author_articles', args=[self.author.pk]),
+            reverse('author_articles', args=[self.author.pk]) + '?status=published',
+            reverse('news_detail', args=[self.news.pk]),
+            reverse('news_comments', args=[self.news.pk]),
+        ]
+        with self.settings(NEWS_COMMENTS_PAGE_SIZE=1):
+            for url in urls:
+                self.assert_plans(url)
+
+
+def unoptimized_activity(request):
+    """Страница активности с комментариями без select_related (N+1 для QueryInstrumentationTest)"""
+    from django.shortcuts import render
+
+    return render(request, 'users/user_activity.html', {'liked_comments': Comment.objects.order_by('-id')})
+
+
+# Маршруты сайта и страница с N+1 (ROOT_URLCONF в QueryInstrumentationTest)
+urlpatterns = [
+    path('n-plus-one/', unoptimized_activity, name='n_plus_one'),
+    path('', include(settings.ROOT_URLCONF)),
+]
+
+
+@override_settings(DB_INSTRUMENTATION=True)
+class QueryInstrumentationTest(TestCase):
+    """Тесты учета запросов к базе на HTTP-запрос"""
+
+    def test_server_timing_and_n_plus_one_report(self):
+        author = User.objects.create_user('author', password='password')
+        for i in range(6):
+            Comment.objects.create(news=create_news(author), author=author, content=f'Комментарий {i}')
+
+        with self.settings(ROOT_URLCONF=__name__), self.assertLogs('news.middleware', 'WARNING') as logs:
+            response = self.client.get('/n-plus-one/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+, total;dur=[\d.]+$')
+        n_plus_one = [line for line in logs.output if 'N+1' in line]
+        self.assertTrue(n_plus_one)
+        self.assertIn('(n_plus_one)', n_plus_one[0])
+        self.assertIn('users/user_activity.html:', n_plus_one[0])
+
+    def test_location_is_computed_only_for_repeated_queries(self):
+        import re
+        from unittest import mock
+        from . import middleware
+
+        author = User.objects.create_user('author', password='password')
+        for i in range(6):
+            Comment.objects.create(news=create_news(author), author=author, content=f'Комментарий {i}')
+
+        with mock.patch.object(middleware, 'query_location', wraps=middleware.query_location) as location, \
+                self.settings(ROOT_URLCONF=__name__), self.assertLogs('news.middleware', 'WARNING') as logs:
+            response = self.client.get('/n-plus-one/')
+        # Место вычисляется только для повторов после порога N+1, а не для каждого запроса
+        queries = int(re.search(r'"(\d+) queries"', response['Server-Timing']).group(1))
+        repeats = [int(re.search(r'repeated (\d+) times', line).group(1)) for line in logs.output if 'N+1' in line]
+        self.assertEqual(location.call_count, sum(count - settings.N_PLUS_ONE_THRESHOLD + 1 for count in repeats))
+        self.assertLess(location.call_count, queries)
+
+    def test_cheap_page_is_not_reported(self):
+        with self.assertNoLogs('news.middleware', 'WARNING'):
+            response = self.client.get('/')
+        self.assertIn('Server-Timing', response)
+
+
+class BenchCommandTest(TestCase):
+    """Проверка команды нагрузочного тестирования на маленьком наборе данных"""
+
+    def test_percentile(self):
+        from .benchmarks import percentile
+
+        self.assertEqual(percentile([0.3, 0.1, 0.2], 50), 200.0)
+        self.assertEqual(percentile([0.3, 0.1, 0.2], 99), 300.0)
+        self.assertIsNone(percentile([], 95))
+
+    def test_bench_reports_every_url(self):
+        import json
+        import os
+        import subprocess
+        import sys
+        from django.conf import settings
+
+        # Команда подменяет базу default своей временной базой, поэтому запускается в отдельном процессе
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'bench', '--scale', '20', '--requests', '2', '--concurrency', '1',
+             '--routes', 'news_list', 'news_detail', 'news_like'],
+            cwd=settings.BASE_DIR, env={**os.environ, 'SECRET_KEY': 'bench'}, capture_output=True, text=True, check=True,
+        )
+        report = json.loads(result.stdout)
+        self.assertEqual(report['meta']['scale'], 20)
+        results = {item['name']: item for item in report['results']}
+        self.assertEqual(set(results), {'news_list', 'news_detail', 'news_like'})
+        for item in results.values():
+            self.assertEqual((item['requests'], item['errors']), (2, 0))
+            self.assertIsNotNone(item['latency_ms']['p95'])
+        self.assertEqual(results['news_like']['method'], 'POST')
+        self.assertIn('news_detail', result.stderr)
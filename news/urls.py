@@ -1,11 +1,14 @@
-from django.urls import path
-from .views import NewsListView, NewsDetailView, NewsByTagView, ArchivedNewsView, ActiveNewsSearchView, ArchivedNewsSearchView, ProposeNewsView, SiteInformationView, DeleteCommentView
+from django.urls import path, register_converter
+from .views import NewsListView, NewsDetailView, NewsByTagView, ArchivedNewsView, ActiveNewsSearchView, ArchivedNewsSearchView, ProposeNewsView, SiteInformationView, DeleteCommentView, NewsLikeView, CommentLikeView, CommentListView
 from . import views
+from .feeds import CachedFeedView, NewsFeed, TagNewsFeed, AuthorNewsFeed, FeedFormatConverter
 from django.conf import settings
 from django.conf.urls.static import static
 
 # Урлы для новостей + статические файлы
 
+register_converter(FeedFormatConverter, 'feed_format')  # Формат ленты: rss, atom или json
+
 urlpatterns = [
     path('', NewsListView.as_view(), name='news_list'),
     path('archived/', ArchivedNewsView.as_view(), name='archived_news'),
@@ -17,6 +20,12 @@ urlpatterns = [
     path('propose/', ProposeNewsView.as_view(), name='propose_news'),
     path('site-information/', SiteInformationView.as_view(), name='site_information'),
     path('comment/<int:pk>/delete/', DeleteCommentView.as_view(), name='delete_comment'),
+    path('<int:pk>/comments/', CommentListView.as_view(), name='news_comments'),
+    path('<int:pk>/like/', NewsLikeView.as_view(), name='news_like'),
+    path('comment/<int:pk>/like/', CommentLikeView.as_view(), name='comment_like'),
+    path('feed/<feed_format:fmt>/', CachedFeedView.as_view(feed_class=NewsFeed), name='news_feed'),
+    path('feed/tag/<slug:tag_slug>/<feed_format:fmt>/', CachedFeedView.as_view(feed_class=TagNewsFeed), name='tag_news_feed'),
+    path('feed/author/<int:author_id>/<feed_format:fmt>/', CachedFeedView.as_view(feed_class=AuthorNewsFeed), name='author_news_feed'),
 ]
 
 if settings.DEBUG:
@@ -1,18 +1,46 @@
-from django.db.models import Q
 from django.views.generic import ListView, DetailView, CreateView, TemplateView, DeleteView
 from django.views import View
 from django.urls import reverse_lazy, reverse
 from django.shortcuts import get_object_or_404, redirect
+from django.db import transaction
 from django.shortcuts import render
 from .models import News, Tag, Comment
 from .forms import NewsForm, CommentForm
+from .search import SEARCH_SORT_FIELDS, cached_search_ids, fetch_news
+from .pagination import KeysetPaginationMixin, KeysetPaginator, InvalidCursor
+from .tag_stats import tag_news_count
+from .author_stats import status_news_count
+from .conditional import ConditionalGetMixin, list_validators
+from .counters import views_counter
+from .db import immediate_atomic
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
+from django.template.loader import render_to_string
+from django.conf import settings
 
-class NewsListView(ListView):
+def comments_paginator(news):
+    """Курсорный пагинатор комментариев новости: автор и количество лайков загружаются в том же запросе"""
+    return KeysetPaginator(news.comments.for_list(), settings.NEWS_COMMENTS_PAGE_SIZE, field='created_at')
+
+def toggle_like(obj, user):
+    """
+    Ставит или снимает лайк пользователя у новости или комментария.
+    Наличие лайка проверяется запросом EXISTS по промежуточной таблице, а не загрузкой всех лайкнувших.
+    Возвращает (поставлен ли лайк, новое количество лайков).
+    """
+    # Проверка и изменение лайка не должны прерываться параллельной записью: блокировка записи берется сразу
+    with immediate_atomic():
+        liked = obj.likes.filter(pk=user.pk).exists()
+        if liked:
+            obj.likes.remove(user)
+        else:
+            obj.likes.add(user)
+        return not liked, obj.likes.count()
+
+class NewsListView(ConditionalGetMixin, KeysetPaginationMixin, ListView):
     """ 
     Назначение: Этот класс-представление используется для отображения списка опубликованных новостей.
     Атрибуты:
@@ -25,18 +53,19 @@ class NewsListView(ListView):
     template_name = 'news/news_list_active.html'
     context_object_name = 'news_list'
     paginate_by = 10
-    queryset = News.objects.filter(status='published').order_by('-pub_date')
+    queryset = News.objects.filter(status='published').for_cards().order_by('-pub_date', '-id')
+
+    def get_validators(self):
+        """Дата последнего изменения проверенных новостей и их количество для условного запроса"""
+        return list_validators(News.objects.filter(status='published'), status_news_count('published'))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['published_count'] = News.objects.filter(status='published').count()
-
-        # Добавляем количество лайков для каждой новости
-        for news in context['news_list']:
-            news.total_likes = news.total_likes()
+        # Количество берем у пагинатора, чтобы не считать его повторно. При курсорной пагинации - только по запросу
+        context['published_count'] = context['paginator'].count if self.count_requested() else None
         return context
 
-class NewsDetailView(DetailView):
+class NewsDetailView(ConditionalGetMixin, DetailView):
     """
     Назначение: Этот класс-представление используется для отображения детальной информации о новости.
     Атрибуты:
@@ -48,6 +77,8 @@ class NewsDetailView(DetailView):
     model = News
     template_name = 'news/news_detail.html'
     context_object_name = 'news'
+    # Каждый показ страницы проверяется на сервере, иначе просмотры из кэша прокси не засчитывались бы
+    cache_max_age = 0
 
     def get_object(self, queryset=None):
         """
@@ -56,11 +87,23 @@ class NewsDetailView(DetailView):
         news = super().get_object(queryset)
         news.increase_views()
         return news
+
+    def get_validators(self):
+        """Дата изменения новости для условного запроса (меняется и при новых комментариях и лайках)"""
+        updated_at = News.objects.filter(pk=self.kwargs['pk']).values_list('updated_at', flat=True).first()
+        return None if updated_at is None else (updated_at,)
+
+    def not_modified(self):
+        # Просмотр засчитывается и тогда, когда страница взята из кэша браузера или прокси
+        views_counter.incr(self.kwargs['pk'])
     
     def get_context_data(self, **kwargs):
         """ Метод для добавления комментариев и формы добавления комментариев в контекст. """
         context = super().get_context_data(**kwargs)
-        context['comments'] = self.object.comments.all().order_by('-created_at') # Сортируем комментарии по дате создания в порядке убывания
+        # Первая страница комментариев, отсортированных по дате создания в порядке убывания. Следующие подгружаются через CommentListView
+        comments_page = comments_paginator(self.object).page()
+        context['comments'] = comments_page.object_list
+        context['comments_next_cursor'] = comments_page.next_cursor
         comment_form = CommentForm() # Cоздаем форму для добавления комментариев
         comment_form.fields['content'].widget.attrs.update({'class': 'form-control'}) # Добавляем класс для стилизации поля формы
         context['comment_form'] = comment_form # Добавляем форму в контекст
@@ -82,26 +125,62 @@ class NewsDetailView(DetailView):
             # Обработка лайка комментария
             comment_id = request.POST.get('like_comment') # Получаем идентификатор комментария из POST-запроса
             comment = get_object_or_404(Comment, id=comment_id) # Получаем объект комментария из базы данных по его идентификатору или генерируем ошибку 404, если комментарий не найден
-            if request.user in comment.likes.all(): # Проверяем, лайкнул ли текущий пользователь этот комментарий
-                comment.likes.remove(request.user) # Если да, то удаляем лайк
-            else:
-                comment.likes.add(request.user) # Если нет, то добавляем лайк
+            toggle_like(comment, request.user) # Ставим или снимаем лайк текущего пользователя
             return redirect('news_detail', pk=self.object.pk) # Перенаправляет пользователя на страницу-details новости
         elif 'like_news' in request.POST: # Проверяем, что в POST-запросе есть поле 'like_news', это означает, что пользователь пытается лайкнуть новость
             # Обработка лайка новости
-            if request.user in self.object.likes.all(): # Проверяем, лайкнул ли текущий пользователь эту новость
-                self.object.likes.remove(request.user) # Если да, то удаляем лайк
-            else:
-                self.object.likes.add(request.user) # Если нет, то добавляем лайк
+            toggle_like(self.object, request.user) # Ставим или снимаем лайк текущего пользователя
             return redirect('news_detail', pk=self.object.pk) # Перенаправляет пользователя на страницу-details новости
         
         context = self.get_context_data(object=self.object)
         context['comment_form'] = form
         return render(request, self.template_name, context)
     
+class CommentListView(View):
+    """
+    Подгрузка следующих комментариев к новости.
+    Принимает курсор из параметра cursor и возвращает JSON с HTML комментариев и курсором следующей страницы:
+    {"html": "...", "next_cursor": "..."}.
+    """
+
+    def get(self, request, pk):
+        news = get_object_or_404(News.objects.only('id'), pk=pk)
+        try:
+            page = comments_paginator(news).page(request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Некорректный курсор страницы')
+        html = render_to_string('news/comment_list.html', {'comments': page.object_list, 'news': news}, request=request)
+        return JsonResponse({'html': html, 'next_cursor': page.next_cursor})
+
+class LikeView(View):
+    """
+    Базовый класс для AJAX-лайков. Принимает POST-запрос, переключает лайк текущего пользователя
+    и возвращает JSON с новым состоянием: {"liked": true, "total_likes": 5}.
+    Атрибуты:
+    - model: Модель, у объектов которой переключаются лайки (News или Comment).
+    """
+    model = None
+    http_method_names = ['post']
+
+    def post(self, request, pk):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Чтобы поставить лайк, войдите на сайт'}, status=403)
+        obj = get_object_or_404(self.model.objects.only('id'), pk=pk)
+        liked, total_likes = toggle_like(obj, request.user)
+        return JsonResponse({'liked': liked, 'total_likes': total_likes})
+
+class NewsLikeView(LikeView):
+    """Лайк новости"""
+    model = News
+
+class CommentLikeView(LikeView):
+    """Лайк комментария"""
+    model = Comment
+
 class DeleteCommentView(DeleteView):
     """Удаление комментария"""
     model = Comment
+    http_method_names = ['post']  # Удаление выполняется формой в списке комментариев, страницы подтверждения нет
     success_url = reverse_lazy('news_list')
 
     def get_success_url(self):
@@ -115,7 +194,7 @@ class DeleteCommentView(DeleteView):
             raise PermissionDenied("You do not have permission to delete this comment.")
         return obj
 
-class NewsByTagView(ListView):
+class NewsByTagView(ConditionalGetMixin, KeysetPaginationMixin, ListView):
     """
     Назначение: Этот класс-представление используется для отображения новостей, связанных с определенным тегом.
     Атрибуты:
@@ -130,9 +209,23 @@ class NewsByTagView(ListView):
         """
         Метод для получения списка новостей, связанных с определенным тегом и со статусом 'published'.
         """
-        self.tag = get_object_or_404(Tag, slug=self.kwargs['tag_slug'])
         status = self.kwargs.get('status', 'published')
-        return News.objects.filter(tags=self.tag, status=status).order_by('-pub_date')
+        return News.objects.filter(tags=self.get_tag(), status=status).for_cards().order_by('-pub_date', '-id')
+
+    def get_tag(self):
+        """Тег из URL (загружается один раз за запрос)"""
+        if not hasattr(self, 'tag'):
+            self.tag = get_object_or_404(Tag, slug=self.kwargs['tag_slug'])
+        return self.tag
+
+    def get_validators(self):
+        """Дата последнего изменения новостей тега и их количество для условного запроса"""
+        status = self.kwargs.get('status', 'published')
+        return list_validators(News.objects.filter(tags=self.get_tag(), status=status), self.get_total_count())
+
+    def get_total_count(self):
+        """Количество новостей по тегу из материализованной статистики тега"""
+        return tag_news_count(self.tag, self.kwargs.get('status', 'published'))
 
     def get_template_names(self):
         """
@@ -151,10 +244,10 @@ class NewsByTagView(ListView):
         context = super().get_context_data(**kwargs)
         context['tag'] = self.tag
         context['status'] = self.kwargs.get('status', 'published')
-        context['news_count'] = self.get_queryset().count()
+        context['news_count'] = context['paginator'].count  # Берется из статистики тега, без подсчета новостей
         return context
 
-class ArchivedNewsView(ListView):
+class ArchivedNewsView(ConditionalGetMixin, KeysetPaginationMixin, ListView):
     """
     Назначение: Этот класс-представление используется для отображения архивных новостей.
     Атрибуты:
@@ -167,22 +260,81 @@ class ArchivedNewsView(ListView):
     template_name = 'news/news_list_archived.html'
     context_object_name = 'news_list'
     paginate_by = 10
-    queryset = News.objects.filter(status='archived').order_by('-pub_date')
+    queryset = News.objects.filter(status='archived').for_cards().order_by('-pub_date', '-id')
+
+    def get_validators(self):
+        """Дата последнего изменения архивных новостей и их количество для условного запроса"""
+        return list_validators(News.objects.filter(status='archived'), status_news_count('archived'))
 
     def get_context_data(self, **kwargs):
         """
         Метод для добавления количества архивных новостей в контекст.
         """
         context = super().get_context_data(**kwargs)
-        context['archived_count'] = News.objects.filter(status='archived').count()
+        context['archived_count'] = context['paginator'].count if self.count_requested() else None
         context['archived'] = True
+        return context
+
+class SearchResultsMixin(KeysetPaginationMixin):
+    """
+    Общая логика поисковых представлений.
+    Упорядоченный список ID найденных новостей берется из кэша (см. news.search.cached_search_ids),
+    количество найденных новостей считается по этому списку, а из базы загружается только текущая страница.
+    Без поискового запроса выдача - весь список новостей статуса: он не кэшируется, а листается
+    курсорной пагинацией прямо по базе, количество берется из статистики авторов.
+    """
+    status = None
+
+    def get_search_params(self):
+        """Параметры поиска из GET-запроса: запрос, поле сортировки и порядок"""
+        query = self.request.GET.get('q') or ''
+        sort_by = self.request.GET.get('sort_by', 'pub_date')
+        if sort_by not in SEARCH_SORT_FIELDS:
+            sort_by = 'pub_date'
+        order = 'asc' if self.request.GET.get('order') == 'asc' else 'desc'
+        return query, sort_by, order
+
+    def use_cursor_pagination(self):
+        return not self.get_search_params()[0]
+
+    def get_keyset_ordering(self):
+        _, sort_by, order = self.get_search_params()
+        # Без запроса релевантности нет, сортируем по дате публикации (как news.search.order_results)
+        return 'pub_date' if sort_by == 'relevance' else sort_by, order == 'desc'
+
+    def get_total_count(self):
+        # С запросом количество считается по списку найденных ID
+        return None if self.get_search_params()[0] else status_news_count(self.status)
 
-        # Добавляем количество лайков для каждой новости
-        for news in context['news_list']:
-            news.total_likes = news.total_likes()
+    def get_queryset(self):
+        """Список ID новостей с нужным статусом, подходящих под запрос (без запроса - все новости статуса)"""
+        query, sort_by, order = self.get_search_params()
+        if not query:
+            return News.objects.filter(status=self.status).for_cards()
+        return cached_search_ids(self.status, query, sort_by, order)
+
+    def paginate_queryset(self, queryset, page_size):
+        """Пагинация по списку ID с загрузкой новостей текущей страницы одним запросом"""
+        paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+        if self.use_cursor_pagination():
+            return paginator, page, object_list, is_paginated
+        page.object_list = fetch_news(object_list)
+        return paginator, page, page.object_list, is_paginated
+
+    def get_context_data(self, **kwargs):
+        """
+        Метод для добавления параметров запроса в контекст.
+        """
+        context = super().get_context_data(**kwargs)
+        query, sort_by, order = self.get_search_params()
+        context['query'] = query
+        context['sort_by'] = sort_by
+        context['order'] = order
+        context['search_count'] = context['paginator'].count
+        context['status'] = self.status
         return context
 
-class ActiveNewsSearchView(ListView):
+class ActiveNewsSearchView(SearchResultsMixin, ListView):
     """
     Метод для получения списка активных новостей, связанных с определенным запросом.
     Атрибуты:
@@ -190,57 +342,21 @@ class ActiveNewsSearchView(ListView):
     - template_name: Шаблон, который будет отображаться (news/news_list_active.html).
     - context_object_name: Имя переменной контекста, которая будет использоваться в шаблоне (news_list).
     - paginate_by: Количество новостей на странице (10).
-    - get_queryset: Метод для фильтрации списка новостей в зависимости от запроса.
+    - status: Статус активных новостей.
     - get_context_data: Метод для добавления параметров запроса в контекст.
     """
     model = News
     template_name = 'news/news_list_active.html'
     context_object_name = 'news_list'
     paginate_by = 10
-
-    def get_queryset(self):
-        """
-        Метод для фильтрации списка активных новостей в зависимости от запроса.
-        """
-        query = self.request.GET.get('q')
-        sort_by = self.request.GET.get('sort_by', 'pub_date')
-        order = self.request.GET.get('order', 'desc')
-        status = 'published'  # Статус активных новостей
-
-        news_list = News.objects.filter(status=status)
-
-        if query:
-            """
-            Фильтруем новости по заголовку или содержанию.
-            """
-            news_list = news_list.filter(
-                Q(title__iregex=query) | Q(content__iregex=query)
-            )
-
-        if sort_by:
-            """
-            Сортируем новости по указанному полю.
-            """
-            if order == 'desc':
-                sort_by = f'-{sort_by}'
-            news_list = news_list.order_by(sort_by)
-
-        return news_list
+    status = 'published'
 
     def get_context_data(self, **kwargs):
-        """
-        Метод для добавления параметров запроса в контекст.
-        """
         context = super().get_context_data(**kwargs)
-        context['query'] = self.request.GET.get('q')
-        context['sort_by'] = self.request.GET.get('sort_by', 'pub_date')
-        context['order'] = self.request.GET.get('order', 'desc')
-        context['search_count'] = self.get_queryset().count()
-        context['status'] = 'published'
-        context['published_count'] = self.get_queryset().count()  # Добавляем published_count в контекст
+        context['published_count'] = context['search_count']  # Добавляем published_count в контекст
         return context
 
-class ArchivedNewsSearchView(ListView):
+class ArchivedNewsSearchView(SearchResultsMixin, ListView):
     """
     Метод для получения списка архивных новостей, связанных с определенным запросом.
     Атрибуты:
@@ -248,42 +364,18 @@ class ArchivedNewsSearchView(ListView):
     - template_name: Шаблон, который будет отображаться (news/news_list_archived.html).
     - context_object_name: Имя переменной контекста, которая будет использоваться в шаблоне (news_list).
     - paginate_by: Количество новостей на странице (10).
-    - get_queryset: Метод для фильтрации списка архивных новостей в зависимости от запроса.
+    - status: Статус архивных новостей.
     - get_context_data: Метод для добавления параметров запроса в контекст.
     """
     model = News
     template_name = 'news/news_list_archived.html'
     context_object_name = 'news_list'
     paginate_by = 10
-
-    def get_queryset(self):
-        query = self.request.GET.get('q')
-        sort_by = self.request.GET.get('sort_by', 'pub_date')
-        order = self.request.GET.get('order', 'desc')
-        status = 'archived'  # Статус архивных новостей
-
-        news_list = News.objects.filter(status=status)
-
-        if query:
-            news_list = news_list.filter(
-                Q(title__iregex=query) | Q(content__iregex=query)
-            )
-
-        if sort_by:
-            if order == 'desc':
-                sort_by = f'-{sort_by}'
-            news_list = news_list.order_by(sort_by)
-
-        return news_list
+    status = 'archived'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['query'] = self.request.GET.get('q')
-        context['sort_by'] = self.request.GET.get('sort_by', 'pub_date')
-        context['order'] = self.request.GET.get('order', 'desc')
-        context['search_count'] = self.get_queryset().count()
-        context['status'] = 'archived'
-        context['archived_count'] = self.get_queryset().count()  # Добавляем published_count в контекст
+        context['archived_count'] = context['search_count']  # Добавляем archived_count в контекст
         return context
 
 class ProposeNewsView(CreateView):
@@ -304,8 +396,9 @@ class ProposeNewsView(CreateView):
         news = form.save(commit=False) # Создаем экземпляр модели News, но не сохраняем его в базу данных
         news.status = 'draft'  # Устанавливаем статус "Не проверено"
         news.author = self.request.user if self.request.user.is_authenticated else User.objects.get(id=1)  # Устанавливаем автора, если пользователь аутентифицирован, иначе администратора
-        news.save() # Сохраняем экземпляр модели News в базу данных
-        form.save_m2m()  # Сохраняем связанные теги
+        with transaction.atomic(): # Новость, ее теги и уведомление в очереди сохраняются в одной транзакции
+            news.save() # Сохраняем экземпляр модели News в базу данных
+            form.save_m2m()  # Сохраняем связанные теги
         return super().form_valid(form)
 
 
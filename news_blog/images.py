@@ -0,0 +1,168 @@
+"""
+Производные изображения (миниатюры нескольких размеров и WebP) вне обработки запроса.
+Общий модуль для изображений новостей (news) и фото профилей (users). Исходный файл не изменяется.
+Миниатюры строятся в пуле процессов и складываются в каталог, названный по хэшу содержимого файла,
+поэтому повторное сохранение того же файла их не пересоздает.
+Размер пула задает настройка IMAGE_WORKERS (0 - обрабатывать сразу в текущем процессе).
+"""
+import atexit
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+WEBP = 'webp'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def file_hash(path, chunk_size=65536):
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def field_file_hash(field_file):
+    """
+    SHA-256 содержимого файла поля модели, в том числе только что загруженного и еще не сохраненного.
+    Пустая строка, если файла нет в хранилище.
+    """
+    digest = hashlib.sha256()
+    try:
+        field_file.open('rb')
+    except OSError:
+        return ''
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    finally:
+        # Загруженный файл еще будет записан в хранилище при сохранении модели, его не закрываем
+        if getattr(field_file, '_committed', True):
+            field_file.close()
+    return digest.hexdigest()
+
+
+def derivative_name(directory, digest, size, fmt):
+    """Имя файла миниатюры относительно MEDIA_ROOT"""
+    return f'{directory}/{digest[:2]}/{digest[:16]}/{size}.{fmt}'
+
+
+def build_derivatives(source_path, media_root, directory, sizes, known_hash=''):
+    """
+    Строит миниатюры изображения: для каждого размера - в исходном формате (JPEG или PNG для прозрачных) и в WebP.
+    Выполняется в процессе пула, поэтому работает только с файлами и не обращается к базе.
+    Возвращает (хэш, {размер: {формат: имя файла}}) или None, если хэш не изменился и миниатюры уже есть.
+    """
+    digest = file_hash(source_path)
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        fallback = 'png' if has_alpha else 'jpg'
+
+        variants = {}
+        for size in sizes:
+            names = {fmt: derivative_name(directory, digest, size, fmt) for fmt in (fallback, WEBP)}
+            variants[str(size)] = names
+        if digest == known_hash and all(
+            os.path.exists(os.path.join(media_root, name)) for names in variants.values() for name in names.values()
+        ):
+            return None
+
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        for size in sizes:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size), Image.LANCZOS)
+            for fmt, name in variants[str(size)].items():
+                path = os.path.join(media_root, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if fmt == WEBP:
+                    thumbnail.save(path, 'WEBP', quality=80, method=4)
+                elif fmt == 'png':
+                    thumbnail.save(path, 'PNG', optimize=True)
+                else:
+                    thumbnail.save(path, 'JPEG', quality=85, optimize=True, progressive=True)
+    return digest, variants
+
+
+def get_executor():
+    """Общий пул процессов для обработки изображений (создается при первом обращении)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn вместо fork: дочерний процесс не наследует потоки и открытые соединения с базой веб-сервера
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+@atexit.register
+def shutdown():
+    """Дожидается обработки всех изображений (включая запись результатов в базу) и останавливает пул"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def process_image(source_path, directory, sizes, known_hash, on_done):
+    """
+    Строит миниатюры в пуле процессов (или сразу при IMAGE_WORKERS = 0) и передает результат в on_done.
+    on_done вызывается только если миниатюры изменились и выполняется в потоке текущего процесса,
+    поэтому может обращаться к базе. Возвращает Future или None при синхронной обработке.
+    """
+    args = (source_path, settings.MEDIA_ROOT, directory, sizes, known_hash)
+    if settings.IMAGE_WORKERS <= 0:
+        result = build_derivatives(*args)
+        if result is not None:
+            on_done(*result)
+        return None
+
+    submitter = threading.get_ident()
+
+    def callback(future):
+        try:
+            result = future.result()
+            if result is not None:
+                on_done(*result)
+        except Exception:
+            logger.exception(f'Ошибка обработки изображения {source_path}')
+        finally:
+            # Колбэк обычно выполняется в служебном потоке пула, его соединение с базой закрываем сами
+            if threading.get_ident() != submitter:
+                connection.close()
+
+    future = get_executor().submit(build_derivatives, *args)
+    future.add_done_callback(callback)
+    return future
+
+
+def pick_variant(variants, size=None, fmt=None):
+    """
+    Выбирает миниатюру: наименьшую, не меньшую запрошенного размера (или самую большую).
+    Без fmt возвращается миниатюра в исходном формате, с fmt='webp' - в WebP.
+    """
+    if not variants:
+        return None
+    sizes = sorted(variants, key=int)
+    if size is None:
+        chosen = sizes[-1]
+    else:
+        chosen = next((value for value in sizes if int(value) >= int(size)), sizes[-1])
+    names = variants[chosen]
+    if fmt is None:
+        fmt = next(name for name in names if name != WEBP)
+    return names.get(fmt)
@@ -62,6 +62,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'news.middleware.QueryInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,6 +84,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'news.context_processors.tag_cloud',
             ],
         },
     },
@@ -98,6 +100,36 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Постоянные соединения: соединение живет CONN_MAX_AGE секунд и не открывается заново на каждый запрос
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Профиль базы данных: production - WAL и настройки SQLITE_PRAGMAS, default - настройки SQLite по умолчанию
+DB_PROFILE = os.getenv('DB_PROFILE', 'production')
+
+# Настройки (PRAGMA), которые выполняются для каждого нового соединения с SQLite в профиле production (см. news.db)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',  # Читатели не блокируются записью
+    'synchronous': 'normal',  # В режиме WAL безопасно и не требует fsync на каждую транзакцию
+    'busy_timeout': 5000,  # Ожидание блокировки записи в миллисекундах вместо ошибки database is locked
+    'cache_size': -20000,  # Кэш страниц около 20 МБ на соединение
+    'mmap_size': 268435456,  # Чтение файла базы через отображение в память (256 МБ)
+    'temp_store': 'memory',
+}
+
+
+# Кэш
+# Кэш должен быть общим для всех процессов: процессы сервера и фоновые команды сбрасывают закэшированные данные
+# сменой поколения в нем. По умолчанию - файловый кэш, для нескольких серверов - Redis
+# (CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://...).
+# Кэш в памяти процесса (LocMemCache) допустим только при DEBUG, иначе проверка news.E001 не даст запустить проект
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / '.cache')),
     }
 }
 
@@ -159,6 +191,14 @@ MEDIA_URL = '/media/'
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 YOUR_PERSONAL_CHAT_ID = os.getenv("YOUR_PERSONAL_CHAT_ID")
 
+# Настройки фоновой отправки уведомлений в Telegram (команда run_telegram_worker)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org/bot')  # Адрес Bot API, к нему добавляется токен
+TELEGRAM_RATE_LIMIT = float(os.getenv('TELEGRAM_RATE_LIMIT', 20))  # Не больше сообщений в секунду
+TELEGRAM_MAX_ATTEMPTS = int(os.getenv('TELEGRAM_MAX_ATTEMPTS', 8))  # Попыток отправки одного уведомления
+TELEGRAM_RETRY_BASE_DELAY = 5  # Задержка перед первой повторной попыткой в секундах, далее удваивается
+TELEGRAM_RETRY_MAX_DELAY = 3600
+TELEGRAM_CLAIM_TIMEOUT = 300  # Через сколько секунд уведомление, захваченное остановившимся процессом, отправляется заново
+
 # Настройки для отправки уведомлений по почте
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST')
@@ -169,4 +209,56 @@ EMAIL_USE_SSL = True
 EMAIL_USE_TLS = False
 DEFAULT_FROM_EMAIL = os.getenv('EMAIL_HOST_USER')
 
-SITE_NAME = os.getenv('SITE_NAME', 'NewsBlog')
\ No newline at end of file
+SITE_NAME = os.getenv('SITE_NAME', 'NewsBlog')
+
+# Интервал (в секундах) записи накопленных просмотров новостей в базу, 0 - записывать сразу
+NEWS_VIEWS_FLUSH_INTERVAL = int(os.getenv('NEWS_VIEWS_FLUSH_INTERVAL', 5))
+
+# Количество новостей в лентах RSS, Atom и JSON Feed и время хранения (в секундах) готовых лент в кэше
+NEWS_FEED_SIZE = int(os.getenv('NEWS_FEED_SIZE', 30))
+NEWS_FEED_CACHE_TIMEOUT = int(os.getenv('NEWS_FEED_CACHE_TIMEOUT', 3600))
+
+# Сколько секунд браузер и прокси могут показывать списки и страницы новостей анонимным посетителям без проверки
+NEWS_HTTP_CACHE_MAX_AGE = int(os.getenv('NEWS_HTTP_CACHE_MAX_AGE', 60))
+
+# Через сколько дней после публикации новость переносится в архив (команда run_publisher), 0 - не переносить
+NEWS_ARCHIVE_AFTER_DAYS = int(os.getenv('NEWS_ARCHIVE_AFTER_DAYS', 0))
+
+# Время хранения (в секундах) списков найденных новостей в кэше поиска
+NEWS_SEARCH_CACHE_TIMEOUT = int(os.getenv('NEWS_SEARCH_CACHE_TIMEOUT', 300))
+
+# Курсорная пагинация для всех списков новостей (без OFFSET и подсчета общего количества)
+NEWS_CURSOR_PAGINATION = os.getenv('NEWS_CURSOR_PAGINATION') == 'True'
+
+# Время хранения (в секундах) отрендеренных карточек новостей в кэше
+NEWS_CARD_CACHE_TIMEOUT = int(os.getenv('NEWS_CARD_CACHE_TIMEOUT', 3600))
+
+# Количество комментариев, которые выводятся на странице новости сразу и подгружаются за один раз
+NEWS_COMMENTS_PAGE_SIZE = int(os.getenv('NEWS_COMMENTS_PAGE_SIZE', 20))
+
+# Сколько объектов массовые действия с лайками в админке обрабатывают сразу, большие выборки - фоновым заданием
+ADMIN_BULK_LIKES_SYNC_LIMIT = int(os.getenv('ADMIN_BULK_LIKES_SYNC_LIMIT', 1000))
+ADMIN_BULK_LIKES_CLAIM_TIMEOUT = 300  # Через сколько секунд задание, захваченное остановившимся процессом, продолжается заново
+# Приблизительное количество строк в списках новостей и комментариев в админке (для больших таблиц)
+ADMIN_ESTIMATED_COUNT = os.getenv('ADMIN_ESTIMATED_COUNT') == 'True'
+
+# Количество записей в каждом разделе страницы активности пользователя
+USER_ACTIVITY_PAGE_SIZE = int(os.getenv('USER_ACTIVITY_PAGE_SIZE', 10))
+
+# Время хранения (в секундах) облака тегов в кэше и количество тегов в нем
+NEWS_TAG_CLOUD_CACHE_TIMEOUT = int(os.getenv('NEWS_TAG_CLOUD_CACHE_TIMEOUT', 600))
+NEWS_TAG_CLOUD_SIZE = int(os.getenv('NEWS_TAG_CLOUD_SIZE', 30))
+
+# Процессов для построения миниатюр изображений, 0 - строить сразу в процессе запроса
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+# Размеры миниатюр фото профиля (в пикселях по большей стороне)
+PROFILE_PHOTO_SIZES = (30, 150, 300)
+# Размеры миниатюр изображений новостей: карточка в списке, страница новости, превью для соцсетей
+NEWS_IMAGE_SIZES = (400, 900, 1200)
+
+# Учет запросов к базе на каждый HTTP-запрос (заголовок Server-Timing и журнал медленных запросов, см. news.middleware).
+# По умолчанию включен только в режиме отладки (DEBUG=True)
+DB_INSTRUMENTATION = os.getenv('DB_INSTRUMENTATION', os.getenv('DEBUG', 'False')) == 'True'
+REQUEST_TIME_BUDGET_MS = int(os.getenv('REQUEST_TIME_BUDGET_MS', 500))  # Запросы дольше пишутся в журнал вместе с SQL
+REQUEST_QUERY_BUDGET = int(os.getenv('REQUEST_QUERY_BUDGET', 30))  # Как и запросы с большим количеством обращений к базе
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))  # Одинаковых запросов, которые считаются признаком N+1
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from users.models import Profile
+from news_blog import images
+
+# python manage.py build_profile_photos команда
+
+class Command(BaseCommand):
+    help = 'Build avatar thumbnails (several sizes and WebP) for existing profile photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild thumbnails even if the photo has not changed')
+
+    def handle(self, *args, **options):
+        futures = []
+        total = 0
+        for profile in Profile.objects.exclude(photo='').exclude(photo__isnull=True).iterator():
+            total += 1
+            try:
+                future = profile.process_photo(force=options['force'])
+            except OSError as e:
+                self.stderr.write(f'{profile}: {e}')
+                continue
+            if future is not None:
+                futures.append(future)
+        images.shutdown()  # Ждем, пока миниатюры будут построены и записаны в профили
+        failed = sum(1 for future in futures if future.exception() is not None)
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} profile photos ({failed} failed)'))
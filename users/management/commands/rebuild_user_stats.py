@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from users.stats import rebuild_user_stats
+
+# python manage.py rebuild_user_stats команда
+
+class Command(BaseCommand):
+    help = 'Recalculate per-user activity counters (comments written, likes given and received)'
+
+    def handle(self, *args, **options):
+        rows, changed = rebuild_user_stats()
+        self.stdout.write(self.style.SUCCESS(f'User statistics rebuilt: {rows} rows, {changed} corrected'))
@@ -0,0 +1,57 @@
+# Generated by Django 4.2 on 2026-10-18 12:57
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_user_stats(apps, schema_editor):
+    """Заполняет счетчики активности по существующим комментариям и лайкам"""
+    News = apps.get_model('news', 'News')
+    Comment = apps.get_model('news', 'Comment')
+    UserStats = apps.get_model('users', 'UserStats')
+
+    def counts(queryset, key, column):
+        return queryset.values(key).annotate(total=Count(column)).order_by().values_list(key, 'total')
+
+    rows = {}
+
+    def add(field, values):
+        for user_id, total in values:
+            stats = rows.setdefault(user_id, UserStats(user_id=user_id))
+            setattr(stats, field, getattr(stats, field) + total)
+
+    add('comments_count', counts(Comment.objects.all(), 'author_id', 'id'))
+    add('news_likes_given', counts(News.likes.through.objects.all(), 'user_id', 'news_id'))
+    add('comment_likes_given', counts(Comment.likes.through.objects.all(), 'user_id', 'comment_id'))
+    add('likes_received', counts(News.likes.through.objects.all(), 'news__author_id', 'id'))
+    add('likes_received', counts(Comment.likes.through.objects.all(), 'comment__author_id', 'id'))
+    UserStats.objects.bulk_create(rows.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('news', '0017_composite_indexes'),
+        ('users', '0005_profile_photo_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('comments_count', models.PositiveIntegerField(default=0, verbose_name='Написано комментариев')),
+                ('news_likes_given', models.PositiveIntegerField(default=0, verbose_name='Лайков новостям')),
+                ('comment_likes_given', models.PositiveIntegerField(default=0, verbose_name='Лайков комментариям')),
+                ('likes_received', models.PositiveIntegerField(default=0, verbose_name='Получено лайков')),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+            },
+        ),
+        migrations.RunPython(fill_user_stats, migrations.RunPython.noop),
+    ]
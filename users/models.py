@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from PIL import Image
+from django.conf import settings
+
+from news_blog import images
 
 class Profile(models.Model):
     """Класс для профиля пользователя"""
@@ -11,19 +13,87 @@ class Profile(models.Model):
     date_of_birth = models.DateField(null=True, blank=True)
     photo = models.ImageField(upload_to='profile_photos/', null=True, blank=True)
     default_photo = models.ImageField(upload_to='default_photos/', default='default_photos/default_profile.ico')
+    photo_hash = models.CharField(max_length=64, blank=True, editable=False)  # Хэш файла, по которому построены миниатюры
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)  # {размер: {формат: имя файла}}
 
     def __str__(self):
         return self.user.username
 
-    def get_photo_url(self):
-        return self.photo.url if self.photo else self.default_photo.url
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженное фото, чтобы при сохранении понять, изменилось ли оно
+        instance._loaded_photo = instance.__dict__.get('photo')
+        return instance
+
+    def get_photo_url(self, size=None, fmt=None):
+        """
+        URL фото профиля. С размером возвращается подходящая миниатюра, а пока миниатюры
+        не построены - исходное фото. fmt='webp' - миниатюра в формате WebP.
+        """
+        if not self.photo:
+            return self.default_photo.url
+        if size is not None or fmt is not None:
+            name = images.pick_variant(self.photo_variants, size, fmt)
+            if name:
+                return self.photo.storage.url(name)
+            if fmt is not None:
+                return None
+        return self.photo.url
+
+    def process_photo(self, force=False):
+        """Строит миниатюры фото вне запроса (см. news_blog.images). Без изменений файла миниатюры не пересоздаются"""
+        if not self.photo:
+            return None
+        pk, name = self.pk, self.photo.name
+
+        def on_done(digest, variants):
+            # Фото могло смениться, пока строились миниатюры
+            Profile.objects.filter(pk=pk, photo=name).update(photo_hash=digest, photo_variants=variants)
+
+        return images.process_image(
+            self.photo.path, 'profile_photos/derived', settings.PROFILE_PHOTO_SIZES,
+            '' if force else self.photo_hash, on_done,
+        )
 
     def save(self, *args, **kwargs):
+        photo_changed = self.photo.name != getattr(self, '_loaded_photo', None)
+        if photo_changed and self.photo and self.photo_hash and images.field_file_hash(self.photo) == self.photo_hash:
+            # Загружен файл с тем же содержимым: миниатюры названы по хэшу содержимого и по-прежнему подходят
+            photo_changed = False
+        if photo_changed:
+            # Миниатюры старого фото больше не подходят
+            self.photo_hash = ''
+            self.photo_variants = {}
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'photo_hash', 'photo_variants'}
         super().save(*args, **kwargs)
+        self._loaded_photo = self.photo.name
+
+        if photo_changed and self.photo:
+            # Миниатюры строятся после фиксации транзакции и не задерживают ответ на запрос
+            transaction.on_commit(self.process_photo)
+
+
+class UserStats(models.Model):
+    """
+    Счетчики активности пользователя. Обновляются сигналами при добавлении и удалении
+    комментариев и лайков (см. users.stats), а не пересчитываются при каждом открытии страницы активности.
+    Отсутствие строки означает нулевые счетчики.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    comments_count = models.PositiveIntegerField(default=0, verbose_name='Написано комментариев')
+    news_likes_given = models.PositiveIntegerField(default=0, verbose_name='Лайков новостям')
+    comment_likes_given = models.PositiveIntegerField(default=0, verbose_name='Лайков комментариям')
+    likes_received = models.PositiveIntegerField(default=0, verbose_name='Получено лайков')
+
+    def __str__(self):
+        return f'Статистика {self.user}'
+
+    @property
+    def likes_given(self):
+        return self.news_likes_given + self.comment_likes_given
 
-        if self.photo:
-            img = Image.open(self.photo.path)
-            if img.height > 300 or img.width > 300:
-                output_size = (300, 300)
-                img.thumbnail(output_size)
-                img.save(self.photo.path)
\ No newline at end of file
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from news.models import News, Comment
+from news.signals import likes_bulk_changed
+from . import stats
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        stats.change('comments_count', {instance.author_id: 1})
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    stats.change('comments_count', {instance.author_id: -1})
+
+
+@receiver(pre_delete, sender=News)
+@receiver(pre_delete, sender=Comment)
+def uncount_deleted_likes(sender, instance, **kwargs):
+    # Лайки удаляются вместе с объектом без сигнала m2m_changed, поэтому вычитаем их заранее
+    through = sender.likes.through
+    column = sender.likes.field.m2m_field_name()
+    users = through.objects.filter(**{column: instance.pk}).values_list('user_id', flat=True)
+    stats.change_likes(sender, [(user_id, instance.pk) for user_id in users], -1)
+
+
+@receiver(pre_delete, sender=User)
+def uncount_user_likes(sender, instance, **kwargs):
+    # Лайки удаляемого пользователя пропадают у авторов новостей и комментариев
+    for model in (News, Comment):
+        column = model.likes.field.m2m_field_name()
+        objects = model.likes.through.objects.filter(user_id=instance.pk).values_list(column, flat=True)
+        received = stats.authors(model, objects)
+        received.pop(instance.pk, None)
+        stats.change('likes_received', {author_id: -count for author_id, count in received.items()})
+
+
+@receiver(m2m_changed, sender=News.likes.through)
+@receiver(m2m_changed, sender=Comment.likes.through)
+def count_likes(sender, instance, action, reverse, model, pk_set, **kwargs):
+    liked_model = type(instance) if not reverse else model
+    column = liked_model.likes.field.m2m_field_name()
+    if action == 'post_add':
+        # При добавлении pk_set содержит только действительно новые связи
+        pairs = [(instance.pk, pk) if reverse else (pk, instance.pk) for pk in pk_set]
+        stats.change_likes(liked_model, pairs, 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        # Удаляемые связи запоминаем заранее: в pk_set могут быть ID, которых нет в промежуточной таблице
+        rows = sender.objects.filter(**{'user_id' if reverse else column: instance.pk})
+        if action == 'pre_remove':
+            rows = rows.filter(**{f'{column}__in' if reverse else 'user_id__in': pk_set})
+        instance._removed_likes = list(rows.values_list('user_id', column))
+    elif action in ('post_remove', 'post_clear'):
+        stats.change_likes(liked_model, getattr(instance, '_removed_likes', []), -1)
+        instance._removed_likes = []
+
+
+@receiver(likes_bulk_changed)
+def refresh_bulk_like_stats(sender, object_ids, user_ids, **kwargs):
+    # Массовые изменения лайков пересчитывают счетчики поставивших лайки и авторов объектов
+    stats.refresh_user_stats(set(user_ids) | set(stats.authors(sender, object_ids)))
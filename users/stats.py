@@ -0,0 +1,118 @@
+"""
+Счетчики активности пользователей (модель UserStats).
+Счетчики изменяются на разницу при каждом изменении комментариев и лайков (см. users.signals),
+полный пересчет выполняет команда rebuild_user_stats.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from news.models import News, Comment
+from .models import UserStats
+
+COUNTERS = ('comments_count', 'news_likes_given', 'comment_likes_given', 'likes_received')
+
+
+def change(field, deltas):
+    """Изменяет счетчик field пользователей на величины из deltas ({ID пользователя: разница})"""
+    deltas = {user_id: delta for user_id, delta in deltas.items() if user_id is not None and delta}
+    if not deltas:
+        return
+    groups = defaultdict(list)
+    for user_id, delta in deltas.items():
+        groups[delta].append(user_id)
+    with transaction.atomic():
+        # Строки создаются только для увеличения: отсутствие строки и так означает нулевые счетчики,
+        # а при удалении пользователя его строку нельзя создавать заново
+        created = [user_id for user_id, delta in deltas.items() if delta > 0]
+        if created:
+            UserStats.objects.bulk_create([UserStats(user_id=user_id) for user_id in created], ignore_conflicts=True)
+        for delta, user_ids in groups.items():
+            UserStats.objects.filter(user_id__in=user_ids).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def authors(model, object_ids):
+    """Количество объектов (новостей или комментариев) по их авторам: Counter({ID автора: количество})"""
+    object_ids = Counter(object_ids)
+    if not object_ids:
+        return Counter()
+    result = Counter()
+    for pk, author_id in model.objects.filter(pk__in=object_ids).values_list('pk', 'author_id'):
+        result[author_id] += object_ids[pk]
+    return result
+
+
+def change_likes(model, likes, sign):
+    """
+    Учитывает добавленные (sign = 1) или удаленные (sign = -1) лайки новостей или комментариев.
+    likes - список пар (ID пользователя, ID объекта).
+    """
+    if not likes:
+        return
+    given = 'news_likes_given' if model is News else 'comment_likes_given'
+    change(given, {user_id: count * sign for user_id, count in Counter(user_id for user_id, _ in likes).items()})
+    received = authors(model, [object_id for _, object_id in likes])
+    change('likes_received', {author_id: count * sign for author_id, count in received.items()})
+
+
+def _counts(queryset, key, column):
+    return {row[key]: row['total'] for row in queryset.values(key).annotate(total=Count(column)).order_by()}
+
+
+def calculate(user_ids=None):
+    """Счетчики пользователей (всех или указанных), посчитанные заново: {ID пользователя: {счетчик: значение}}"""
+    news_likes = News.likes.through.objects.all()
+    comment_likes = Comment.likes.through.objects.all()
+    comments = Comment.objects.all()
+    received_news_likes, received_comment_likes = news_likes, comment_likes
+    if user_ids is not None:
+        comments = comments.filter(author_id__in=user_ids)
+        received_news_likes = news_likes.filter(news__author_id__in=user_ids)
+        received_comment_likes = comment_likes.filter(comment__author_id__in=user_ids)
+        news_likes = news_likes.filter(user_id__in=user_ids)
+        comment_likes = comment_likes.filter(user_id__in=user_ids)
+    columns = {
+        'comments_count': _counts(comments, 'author_id', 'id'),
+        'news_likes_given': _counts(news_likes, 'user_id', 'news_id'),
+        'comment_likes_given': _counts(comment_likes, 'user_id', 'comment_id'),
+        'likes_received': Counter(_counts(received_news_likes, 'news__author_id', 'id')) + Counter(
+            _counts(received_comment_likes, 'comment__author_id', 'id')
+        ),
+    }
+    result = defaultdict(dict)
+    for field, values in columns.items():
+        for user_id, value in values.items():
+            result[user_id][field] = value
+    return result
+
+
+def refresh_user_stats(user_ids):
+    """Пересчитывает счетчики указанных пользователей (после массовых изменений без поштучных сигналов)"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    with transaction.atomic():
+        UserStats.objects.filter(user_id__in=user_ids).delete()
+        UserStats.objects.bulk_create([UserStats(user_id=user_id, **values) for user_id, values in calculate(user_ids).items()])
+
+
+def rebuild_user_stats():
+    """Полностью пересчитывает счетчики всех пользователей. Возвращает количество строк и исправленных строк"""
+    with transaction.atomic():
+        before = {
+            stats.user_id: tuple(getattr(stats, field) for field in COUNTERS) for stats in UserStats.objects.all()
+        }
+        rows = [UserStats(user_id=user_id, **values) for user_id, values in calculate().items()]
+        UserStats.objects.all().delete()
+        UserStats.objects.bulk_create(rows)
+    after = {stats.user_id: tuple(getattr(stats, field) for field in COUNTERS) for stats in rows}
+    zeros = (0,) * len(COUNTERS)
+    changed = sum(1 for key in before.keys() | after.keys() if before.get(key, zeros) != after.get(key, zeros))
+    return len(rows), changed
+
+
+def get_user_stats(user):
+    """Счетчики пользователя (без сохранения пустой строки, если пользователь еще ничего не делал)"""
+    return UserStats.objects.filter(user=user).first() or UserStats(user=user)
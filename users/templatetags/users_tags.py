@@ -0,0 +1,19 @@
+from django import template
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def profile_photo(profile, size, css_class=''):
+    """Выводит фото профиля нужного размера: миниатюру в WebP и в исходном формате для остальных браузеров"""
+    if not profile:
+        return ''  # У пользователя нет профиля (например, у созданного через createsuperuser)
+    webp = profile.get_photo_url(size, 'webp')
+    img = format_html(
+        '<img src="{}" alt="Фото профиля" class="{}" style="width: {}px; height: {}px;" loading="lazy">',
+        profile.get_photo_url(size), css_class, size, size,
+    )
+    if not webp:
+        return img
+    return format_html('<picture><source srcset="{}" type="image/webp">{}</picture>', webp, img)
@@ -1,3 +1,187 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from .models import Profile
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_file(name='photo.jpg', size=(800, 600), color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class ProfilePhotoTest(TestCase):
+    """Тесты миниатюр фото профиля"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.profile = Profile.objects.create(user=User.objects.create_user('author', password='password'))
+
+    def test_thumbnails_are_built_after_commit_and_only_for_new_content(self):
+        self.profile.photo = image_file()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.save()
+        self.profile.refresh_from_db()
+        self.assertEqual(set(self.profile.photo_variants), {'30', '150', '300'})
+
+        # Исходный файл не изменяется, миниатюры нужного размера лежат рядом
+        self.assertEqual(Image.open(self.profile.photo.path).size, (800, 600))
+        small = self.profile.get_photo_url(30)
+        self.assertTrue(small.endswith('/30.jpg'))
+        self.assertTrue(self.profile.get_photo_url(100, 'webp').endswith('/150.webp'))
+        with Image.open(os.path.join(MEDIA_ROOT, self.profile.photo_variants['30']['jpg'])) as thumbnail:
+            self.assertEqual(thumbnail.size, (30, 23))
+
+        # Сохранение без смены фото не запускает обработку
+        self.profile.first_name = 'Иван'
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.profile.save()
+        self.assertEqual(callbacks, [])
+
+        # Новый файл с тем же содержимым не сбрасывает миниатюры и не запускает обработку
+        digest, variants = self.profile.photo_hash, self.profile.photo_variants
+        self.profile.photo = image_file('same.jpg')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.profile.save()
+        self.assertEqual(callbacks, [])
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.photo_hash, self.profile.photo_variants), (digest, variants))
+        self.assertTrue(os.path.exists(self.profile.photo.path))
+
+        # Файл с другим содержимым обрабатывается заново
+        self.profile.photo = image_file('other.jpg', color='blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.save()
+        self.profile.refresh_from_db()
+        self.assertNotEqual(self.profile.photo_hash, digest)
+
+    def test_original_is_served_until_thumbnails_are_ready(self):
+        self.profile.photo = image_file()
+        with self.captureOnCommitCallbacks(execute=False):
+            self.profile.save()
+        self.assertEqual(self.profile.get_photo_url(30), self.profile.photo.url)
+        self.assertIsNone(self.profile.get_photo_url(30, 'webp'))
+
+
+class UserStatsTest(TestCase):
+    """Тесты счетчиков активности пользователя"""
+
+    def setUp(self):
+        from news.models import News, Comment
+
+        User.objects.create_user('admin', password='password')  # Автор по умолчанию для новостей удаленных авторов
+        self.author = User.objects.create_user('author', password='password')
+        self.reader = User.objects.create_user('reader', password='password')
+        self.news = News.objects.create(title='Новость', brief='Кратко', content='Текст', author=self.author)
+        self.comment = Comment.objects.create(news=self.news, author=self.author, content='Комментарий')
+
+    def counters(self, user):
+        from .stats import COUNTERS, get_user_stats
+
+        stats = get_user_stats(user)
+        return tuple(getattr(stats, field) for field in COUNTERS)
+
+    def assert_consistent(self):
+        from .models import UserStats
+        from .stats import rebuild_user_stats
+
+        self.assertEqual(rebuild_user_stats()[1], 0)
+        self.assertFalse(UserStats.objects.filter(user__isnull=True).exists())
+
+    def test_counters_follow_comments_and_likes(self):
+        from news.models import Comment
+
+        self.news.likes.add(self.reader)
+        self.comment.likes.add(self.reader)
+        self.comment.likes.add(self.reader)  # Повторный лайк не добавляет связь
+        self.reader.liked_news.remove(self.news, self.news)
+        self.comment.likes.remove(self.author)  # Автор этот комментарий не лайкал
+        Comment.objects.create(news=self.news, author=self.reader, content='Ответ')
+        self.assertEqual(self.counters(self.author), (1, 0, 0, 1))
+        self.assertEqual(self.counters(self.reader), (1, 0, 1, 0))
+        self.assert_consistent()
+
+        self.news.likes.add(self.reader, self.author)
+        self.reader.liked_comments.clear()
+        self.assertEqual(self.counters(self.author), (1, 1, 0, 2))
+        self.assertEqual(self.counters(self.reader), (1, 1, 0, 0))
+        self.assert_consistent()
+
+    def test_counters_follow_deletions(self):
+        self.news.likes.add(self.reader)
+        self.comment.likes.add(self.reader, self.author)
+        self.news.delete()  # Вместе с новостью удаляются комментарии и лайки
+        self.assertEqual(self.counters(self.author), (0, 0, 0, 0))
+        self.assertEqual(self.counters(self.reader), (0, 0, 0, 0))
+        self.assert_consistent()
+
+        from news.models import News, Comment
+
+        news = News.objects.create(title='Еще', brief='Кратко', content='Текст', author=self.author)
+        comment = Comment.objects.create(news=news, author=self.reader, content='Комментарий')
+        comment.likes.add(self.author)
+        self.author.delete()
+        self.assertEqual(self.counters(self.reader), (1, 0, 0, 0))
+        self.assert_consistent()
+
+
+class UserActivityViewTest(TestCase):
+    """Тесты страницы активности пользователя"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from news.models import News, Comment
+
+        cls.user = User.objects.create_user('reader', password='password')
+        author = User.objects.create_user('author', password='password')
+        for i in range(7):
+            news = News.objects.create(title=f'Новость {i}', brief='Кратко', content='Текст', author=author)
+            news.likes.add(cls.user)
+            Comment.objects.create(news=news, author=cls.user, content=f'Мой комментарий {i}')
+            Comment.objects.create(news=news, author=author, content=f'Комментарий {i}').likes.add(cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_sections_are_paginated_independently(self):
+        from django.urls import reverse
+
+        url = reverse('user_activity')
+        with self.settings(USER_ACTIVITY_PAGE_SIZE=3):
+            with self.assertNumQueries(7):  # Сессия, пользователь, профиль, счетчики и по запросу на раздел
+                response = self.client.get(url)
+            self.assertEqual(response.context['stats'].comments_count, 7)
+            self.assertEqual(response.context['stats'].likes_given, 14)
+            for name in ('liked_comments', 'user_comments', 'liked_news'):
+                self.assertEqual(len(response.context[name]), 3)
+                self.assertEqual(response.context[name].count, 7)
+
+            user_comments = response.context['user_comments']
+            response = self.client.get(f'{url}?{user_comments.next_query}')
+            self.assertEqual(
+                [comment.content for comment in response.context['user_comments']],
+                ['Мой комментарий 3', 'Мой комментарий 2', 'Мой комментарий 1'],
+            )
+            self.assertEqual(response.context['liked_news'].object_list[0].title, 'Новость 6')
+
+        self.assertEqual(self.client.get(url + '?liked_news=bad').status_code, 404)
+
+    def test_login_required(self):
+        from django.urls import reverse
+
+        self.client.logout()
+        self.assertRedirects(self.client.get(reverse('user_activity')), reverse('login') + '?next=' + reverse('user_activity'))
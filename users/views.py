@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect
-from django.views.generic import View, ListView, DetailView
+from django.views.generic import View, ListView, DetailView, TemplateView
 from django.contrib.auth.views import PasswordResetView
 from news.models import News
 from django.contrib.auth import login, authenticate, logout, get_user_model
@@ -8,6 +8,12 @@ from .forms import ProfileForm
 from .models import Profile
 from datetime import date
 from news.models import Comment
+from news.pagination import KeysetPaginationMixin, KeysetPaginator, InvalidCursor
+from .stats import get_user_stats
+from news.author_stats import author_summary
+from django.contrib.auth.decorators import login_required
+from django.utils.decorators import method_decorator
+from django.http import Http404
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.conf import settings
@@ -164,7 +170,7 @@ class EditProfileView(View):
             return redirect('profile')
         return render(request, 'users/edit_profile.html', {'form': form})
 
-class AuthorArticlesView(ListView):
+class AuthorArticlesView(KeysetPaginationMixin, ListView):
     """Просмотр статей автора"""
     model = News
     template_name = 'users/author_articles.html'
@@ -173,16 +179,31 @@ class AuthorArticlesView(ListView):
 
     def get_queryset(self):
         """Фильтрация статей по автору и статусу"""
-        queryset = News.objects.filter(author_id=self.kwargs['author_id']) # Фильтрует статьи по author_id, который передается через URL.
+        queryset = News.objects.filter(author_id=self.kwargs['author_id']).for_cards() # Фильтрует статьи по author_id, который передается через URL.
         status = self.request.GET.get('status', 'all') # Получает значение параметра status из GET-запроса. Если параметр не указан, по умолчанию используется значение 'all'.
         if status != 'all': # Если статус не равен 'all', фильтрует статьи по статусу.
             queryset = queryset.filter(status=status)
-        return queryset.order_by('-pub_date') # Сортирует статьи по дате публикации в порядке убывания.
+        return queryset.order_by('-pub_date', '-id') # Сортирует статьи по дате публикации в порядке убывания.
+
+    def get_author_summary(self):
+        """Итоги автора из статистики AuthorStats (не больше одной строки на статус)"""
+        if not hasattr(self, '_author_summary'):
+            self._author_summary = author_summary(self.kwargs['author_id'])
+        return self._author_summary
+
+    def get_total_count(self):
+        """Количество статей для пагинации берется из статистики автора, а не запросом COUNT"""
+        summary = self.get_author_summary()
+        status = self.request.GET.get('status', 'all')
+        if status == 'all':
+            return summary['count']
+        return summary['counts'].get(status, 0)
 
     def get_context_data(self, **kwargs):
-        """ Добавляет в контекст данные о статусе статей"""
+        """ Добавляет в контекст данные о статусе статей и итоги автора"""
         context = super().get_context_data(**kwargs)
         context['status'] = self.request.GET.get('status', 'all')
+        context['author_stats'] = self.get_author_summary()
         return context
     
 class ArticleDetailView(DetailView):
@@ -191,23 +212,50 @@ class ArticleDetailView(DetailView):
     template_name = 'users/article_detail.html'
     context_object_name = 'article'
 
-class UserActivityView(ListView):
-    """Просмотр активности пользователя"""
-    model = Comment
+@method_decorator(login_required(login_url='login'), name='dispatch')
+class UserActivityView(TemplateView):
+    """
+    Просмотр активности пользователя: лайкнутые комментарии, свои комментарии и лайкнутые новости.
+    Каждый раздел листается отдельно по своему курсору (параметр запроса с именем раздела),
+    количество записей в разделах и итоговые счетчики берутся из UserStats без запросов COUNT.
+    """
     template_name = 'users/user_activity.html'
-    context_object_name = 'comments'
 
-    def get_queryset(self):
-        """Фильтрация комментариев по пользователю"""
-        return Comment.objects.filter(likes=self.request.user).order_by('-created_at')
+    def get_sections(self):
+        """Разделы страницы: (имя и параметр курсора, запрос, поле сортировки, счетчик UserStats)"""
+        user = self.request.user
+        return [
+            ('liked_comments', Comment.objects.filter(likes=user).select_related('news', 'author')
+                .only('content', 'created_at', 'news__title', 'author__username'), 'created_at', 'comment_likes_given'),
+            ('user_comments', Comment.objects.filter(author=user).select_related('news')
+                .only('content', 'created_at', 'news__title'), 'created_at', 'comments_count'),
+            ('liked_news', News.objects.filter(likes=user).only('title', 'brief', 'pub_date'), 'pub_date', 'news_likes_given'),
+        ]
 
     def get_context_data(self, **kwargs):
-        """Добавляет в контекст данные о пользователе"""
+        """Добавляет в контекст страницы разделов и счетчики пользователя"""
         context = super().get_context_data(**kwargs)
-        context['user_comments'] = Comment.objects.filter(author=self.request.user).order_by('-created_at')
-        context['liked_news'] = News.objects.filter(likes=self.request.user).order_by('-pub_date')
+        stats = get_user_stats(self.request.user)
+        for name, queryset, field, counter in self.get_sections():
+            paginator = KeysetPaginator(queryset, settings.USER_ACTIVITY_PAGE_SIZE, field=field)
+            paginator.count = getattr(stats, counter)
+            try:
+                page = paginator.page(self.request.GET.get(name))
+            except InvalidCursor:
+                raise Http404('Некорректный курсор страницы')
+            page.count = paginator.count
+            # Ссылки на соседние страницы раздела сохраняют курсоры остальных разделов
+            page.previous_query = self.section_query(name, page.previous_cursor) if page.has_previous() else None
+            page.next_query = self.section_query(name, page.next_cursor) if page.has_next() else None
+            context[name] = page
+        context['stats'] = stats
         return context
 
+    def section_query(self, name, cursor):
+        params = self.request.GET.copy()
+        params[name] = cursor
+        return params.urlencode()
+
 User = get_user_model()
 
 class WebPasswordResetView(PasswordResetView):